@@ -0,0 +1,112 @@
+import json
+import queue
+import itertools
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class MockAPIC:
+    """
+    In-memory stand-in for the APIC REST API and its event websocket, served on a local port.
+
+    Implements what subscription mode uses: login and token refresh, fabricNode class
+    queries, class subscriptions and their refresh. Events given to push() are
+    delivered by the websocket stand-in websocket() returns, pass that as
+    CiscoACIFabric.subscribe()'s websocket_factory.
+    """
+
+    def __init__(self, nodes=None, host='127.0.0.1', port=0):
+        self.nodes = dict(nodes or {})  # Node DN -> fabricNode attributes
+        self.events = queue.Queue()
+        self.subscription_ids = itertools.count(1)
+        self.subscriptions = {}  # Subscription id -> class name
+        self.lock = threading.Lock()
+        handler = type('Handler', (MockAPICHandler,), {'apic': self})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.url = f"http://{host}:{self.server.server_address[1]}"
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def push(self, *objects):
+        """Send one websocket message holding the given events ({class name: {'attributes': ...}})."""
+        self.events.put(json.dumps({'subscriptionId': list(self.subscriptions), 'imdata': list(objects)}))
+
+    def websocket(self, url):
+        return MockAPICSocket(self.events)
+
+    def handle(self, method, path, query):
+        """Serve one API request, returns (status, response body)."""
+        if path in ('/api/aaaLogin.json', '/api/aaaRefresh.json'):
+            return (200, {'imdata': [{'aaaLogin': {'attributes': {'token': 'mock-apic-token', 'refreshTimeoutSeconds': '600'}}}]})
+        if path == '/api/subscriptionRefresh.json':
+            return (200, {'imdata': []})
+        if not path.startswith('/api/node/class/') or not path.endswith('.json'):
+            return (404, {'imdata': []})
+
+        class_name = path[len('/api/node/class/'):-len('.json')]
+        objects = [{class_name: {'attributes': dict(attributes, dn=dn)}} for dn, attributes in sorted(self.nodes.items())] if class_name == 'fabricNode' else []
+        response = {'totalCount': str(len(objects)), 'imdata': objects}
+        if query.get('subscription') == 'yes':
+            with self.lock:
+                subscription_id = str(next(self.subscription_ids))
+                self.subscriptions[subscription_id] = class_name
+            response['subscriptionId'] = subscription_id
+        return (200, response)
+
+
+class MockAPICSocket:
+    """Websocket stand-in, recv() returns the messages pushed to the MockAPIC and times out like websocket-client."""
+
+    def __init__(self, events):
+        self.events = events
+        self.timeout = None
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+    def recv(self):
+        try:
+            return self.events.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError('No APIC event') from None
+
+    def close(self):
+        pass
+
+
+class MockAPICHandler(BaseHTTPRequestHandler):
+    apic = None  # Set on the subclass MockAPIC builds for its server
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def dispatch(self, method):
+        url = urlparse(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+
+        (status, response) = self.apic.handle(method, url.path, query)
+        payload = json.dumps(response).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
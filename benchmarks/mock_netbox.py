@@ -0,0 +1,378 @@
+import re
+import json
+import time
+import itertools
+import threading
+import collections
+from urllib.parse import urlparse, parse_qs, urlencode
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Fields NetBox resolves to another object, and the endpoint that object lives in
+RELATIONS = {
+    'device': 'dcim/devices',
+    'master': 'dcim/devices',
+    'site': 'dcim/sites',
+    'group': 'dcim/site-groups',
+    'location': 'dcim/locations',
+    'role': 'dcim/device-roles',
+    'device_type': 'dcim/device-types',
+    'manufacturer': 'dcim/manufacturers',
+    'platform': 'dcim/platforms',
+    'virtual_chassis': 'dcim/virtual-chassis',
+    'lag': 'dcim/interfaces',
+    'vlan': 'ipam/vlans',
+    'primary_ip4': 'ipam/ip-addresses',
+    'primary_ip6': 'ipam/ip-addresses',
+    'virtual_machine': 'virtualization/virtual-machines',
+    'cluster': 'virtualization/clusters',
+}
+
+# Fields NetBox returns as {'value': ..., 'label': ...}
+CHOICE_FIELDS = ['status', 'type']
+
+# Fields kept in the nested (brief) representation of an object
+BRIEF_FIELDS = ['name', 'model', 'slug', 'vid', 'prefix', 'address', 'device']
+
+# GraphQL list queries and the endpoint they read
+GRAPHQL_LISTS = {
+    'virtual_chassis_list': 'dcim/virtual-chassis',
+    'rack_list': 'dcim/racks',
+    'device_list': 'dcim/devices',
+    'device_role_list': 'dcim/device-roles',
+    'device_type_list': 'dcim/device-types',
+    'manufacturer_list': 'dcim/manufacturers',
+    'platform_list': 'dcim/platforms',
+    'site_list': 'dcim/sites',
+    'site_group_list': 'dcim/site-groups',
+    'location_list': 'dcim/locations',
+    'interface_list': 'dcim/interfaces',
+    'cable_list': 'dcim/cables',
+    'vlan_list': 'ipam/vlans',
+    'fhrp_group_list': 'ipam/fhrp-groups',
+    'prefix_list': 'ipam/prefixes',
+    'ip_address_list': 'ipam/ip-addresses',
+    'virtual_machine_list': 'virtualization/virtual-machines',
+    'vm_interface_list': 'virtualization/interfaces',
+    'cluster_list': 'virtualization/clusters',
+}
+
+PAGE_SIZE = 50        # NetBox's default PAGINATE_COUNT
+MAX_PAGE_SIZE = 1000  # NetBox's default MAX_PAGE_SIZE
+
+
+class MockNetBox:
+    """
+    In-memory stand-in for the NetBox REST API, served on a local port.
+
+    Implements what pynetbox uses: paginated and filtered lists, get/create/update/delete
+    by id, bulk creates and OPTIONS choices, plus GraphQL list queries. Related objects
+    given by id, name or attribute dict are resolved to nested objects the way NetBox
+    returns them, nothing else is validated.
+    Every request is counted per method and endpoint and can be delayed by a fixed
+    latency to model a remote NetBox.
+    """
+
+    def __init__(self, latency=0.0, host='127.0.0.1', port=0):
+        self.latency = latency
+        self.objects = collections.defaultdict(dict)  # Endpoint ('dcim/devices') -> id -> object
+        self.ids = itertools.count(1)
+        self.calls = collections.Counter()  # (method, endpoint) -> requests
+        self.response_bytes = 0
+        self.lock = threading.Lock()
+        handler = type('MockNetBoxHandler', (MockNetBoxHandler,), {'netbox': self})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self.url = f"http://{host}:{self.server.server_address[1]}"
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def reset_calls(self):
+        with self.lock:
+            self.calls.clear()
+            self.response_bytes = 0
+
+    def call_counts(self):
+        """Return (total requests, requests per 'METHOD endpoint')."""
+        with self.lock:
+            per_endpoint = {f"{method} {endpoint}": count for (method, endpoint), count in sorted(self.calls.items())}
+        return (sum(per_endpoint.values()), per_endpoint)
+
+    def object_counts(self):
+        with self.lock:
+            return {endpoint: len(objects) for endpoint, objects in sorted(self.objects.items()) if objects}
+
+    def handle(self, method, path, query, body):
+        """Serve one API request, returns (status, response body)."""
+        parts = [part for part in path.split('/') if part]
+        if parts == ['graphql'] and method == 'POST':
+            if self.latency:
+                time.sleep(self.latency)
+            with self.lock:
+                self.calls[(method, 'graphql')] += 1
+                return (200, self.graphql(body.get('query', '')))
+        if parts[:1] != ['api']:
+            return (404, {'detail': 'Not found.'})
+        if len(parts) < 3:
+            return (200, {})  # API root and status
+        endpoint = f"{parts[1]}/{parts[2]}"
+        object_id = int(parts[3]) if len(parts) > 3 and parts[3].isdigit() else None
+
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.calls[(method, endpoint)] += 1
+            objects = self.objects[endpoint]
+
+            if method == 'GET' and object_id is None:
+                return (200, self.list(endpoint, query))
+            if method == 'OPTIONS' and object_id is None:
+                return (200, self.options(endpoint))
+            if method == 'POST':
+                if isinstance(body, list):
+                    return (201, [self.create(endpoint, data) for data in body])
+                return (201, self.create(endpoint, body))
+            if object_id not in objects:
+                return (404, {'detail': 'Not found.'})
+            if method == 'GET':
+                return (200, objects[object_id])
+            if method in ('PATCH', 'PUT'):
+                objects[object_id].update(self.resolve(body))
+                return (200, objects[object_id])
+            if method == 'DELETE':
+                del objects[object_id]
+                return (204, None)
+        return (405, {'detail': f'Method "{method}" not allowed.'})
+
+    def list(self, endpoint, query):
+        limit = int(query.pop('limit', PAGE_SIZE) or MAX_PAGE_SIZE)
+        limit = min(limit, MAX_PAGE_SIZE)
+        offset = int(query.pop('offset', 0))
+        query.pop('brief', None)
+        matches = [obj for obj in self.objects[endpoint].values() if all(matches_filter(obj.get(key), value) for key, value in query.items())]
+
+        next_url = None
+        if offset + limit < len(matches):
+            next_url = f"{self.url}/api/{endpoint}/?{urlencode(dict(query, limit=limit, offset=offset + limit))}"
+        return {'count': len(matches), 'next': next_url, 'previous': None, 'results': matches[offset:offset + limit]}
+
+    def options(self, endpoint):
+        """OPTIONS of an endpoint, the choices of a field are the values the mock has seen."""
+        choices = collections.defaultdict(set)
+        for obj in self.objects[endpoint].values():
+            for field in CHOICE_FIELDS:
+                if isinstance(obj.get(field), dict):
+                    choices[field].add(obj[field]['value'])
+        return {'actions': {'POST': {field: {'type': 'choice', 'choices': [{'value': value, 'display_name': value} for value in sorted(values)]}
+                                     for field, values in choices.items()}}}
+
+    def graphql(self, query):
+        """Answer a query of GraphQL lists like the cache preload makes, choices are returned as NetBox's enum names."""
+        data = {}
+        for (name, arguments, fields) in parse_graphql(query):
+            if name not in GRAPHQL_LISTS:
+                return {'data': None, 'errors': [{'message': f"Cannot query field '{name}' on type 'Query'."}]}
+            pagination = arguments.get('pagination', {})
+            offset = pagination.get('offset', 0)
+            objects = list(self.objects[GRAPHQL_LISTS[name]].values())
+            objects = objects[offset:offset + pagination['limit']] if 'limit' in pagination else objects[offset:]
+            data[name] = [graphql_object(obj, fields) for obj in objects]
+        return {'data': data}
+
+    def create(self, endpoint, data):
+        object_id = next(self.ids)
+        obj = self.resolve(data)
+        obj.update({'id': object_id, 'url': f"{self.url}/api/{endpoint}/{object_id}/"})
+        obj['display'] = str(next((obj[field] for field in BRIEF_FIELDS if isinstance(obj.get(field), (str, int))), object_id))
+        self.objects[endpoint][object_id] = obj
+        return obj
+
+    def resolve(self, data):
+        """Replace related objects given by id, name or attributes with their nested representation."""
+        obj = {}
+        for key, value in (data or {}).items():
+            if key in ('a_terminations', 'b_terminations'):
+                value = [self.termination(termination) for termination in value]
+            elif key in RELATIONS and value is not None:
+                value = self.nested(RELATIONS[key], value)
+            elif key in CHOICE_FIELDS and isinstance(value, str):
+                value = {'value': value, 'label': value.replace('-', ' ').title()}
+            obj[key] = value
+        return obj
+
+    def nested(self, endpoint, value):
+        objects = self.objects[endpoint]
+        if isinstance(value, int):
+            target = objects.get(value)
+        elif isinstance(value, str):
+            target = next((obj for obj in objects.values() if obj.get('name') == value), None)
+        elif isinstance(value, dict) and 'id' not in value:
+            target = next((obj for obj in objects.values() if matches_attributes(obj, value)), None)
+        else:
+            return value
+        # Unresolvable references are kept as given, the mock does not validate
+        return brief(target) if target else value
+
+    def termination(self, termination):
+        # 'dcim.interface' -> 'dcim/interfaces'
+        (app, model) = termination['object_type'].split('.')
+        target = self.objects[f"{app}/{model.replace('_', '-')}s"].get(termination['object_id'])
+        return dict(termination, object=brief(target) if target else None)
+
+
+def brief(obj):
+    return {key: obj[key] for key in ['id', 'url', 'display'] + BRIEF_FIELDS if key in obj}
+
+
+def matches_attributes(obj, attributes):
+    for key, value in attributes.items():
+        current = obj.get(key)
+        if isinstance(value, dict):
+            if not isinstance(current, dict) or not matches_attributes(current, value):
+                return False
+        elif current != value:
+            return False
+    return True
+
+
+def matches_filter(current, value):
+    """Query string filters compare against the value, id or name of a field."""
+    if isinstance(current, dict):
+        return value in (str(current.get('value')), str(current.get('id')), str(current.get('name')))
+    return str(current) == value
+
+
+def parse_graphql(query):
+    """Return the (field, arguments, selection) of a query's top level fields."""
+    tokens = re.findall(r'\.\.\.|[{}():,\[\]]|-?\d+|"[^"]*"|\w+', query)
+    position = 0
+
+    def value():
+        nonlocal position
+        token = tokens[position]
+        position += 1
+        if token == '{':
+            result = {}
+            while tokens[position] != '}':
+                key = tokens[position]
+                position += 2  # Key and ':'
+                result[key] = value()
+                if tokens[position] == ',':
+                    position += 1
+            position += 1
+            return result
+        if token.lstrip('-').isdigit():
+            return int(token)
+        return token.strip('"')
+
+    def selection():
+        # '{' field (arguments) {selection} ... on Type {selection} '}' -> [(field, arguments, selection)]
+        nonlocal position
+        position += 1
+        fields = []
+        while tokens[position] != '}':
+            if tokens[position] == '...':
+                fragment_type = tokens[position + 2]
+                position += 3
+                fields.append(('...', {'on': fragment_type}, selection()))
+                continue
+            name = tokens[position]
+            position += 1
+            arguments = {}
+            if tokens[position] == '(':
+                position += 1
+                while tokens[position] != ')':
+                    key = tokens[position]
+                    position += 2
+                    arguments[key] = value()
+                    if tokens[position] == ',':
+                        position += 1
+                position += 1
+            fields.append((name, arguments, selection() if tokens[position] == '{' else None))
+        position += 1
+        return fields
+
+    while tokens[position] != '{':
+        position += 1  # 'query' and the operation name
+    return selection()
+
+
+def graphql_object(obj, fields, typename=None):
+    result = {}
+    for (name, arguments, selection) in fields:
+        if name == '...':
+            if arguments['on'] == typename:
+                result.update(graphql_object(obj, selection, typename))
+        elif name == '__typename':
+            result[name] = typename
+        elif name == 'id':
+            result[name] = str(obj['id'])
+        else:
+            result[name] = graphql_value(name, obj.get(name), selection)
+    return result
+
+
+def graphql_value(name, value, selection):
+    if isinstance(value, list):
+        return [graphql_value(name, item, selection) for item in value]
+    if isinstance(value, dict) and 'object_type' in value:
+        # Generic relation (cable termination), 'dcim.interface' -> InterfaceType
+        target = value.get('object') or {'id': value['object_id']}
+        return graphql_object(target, selection or [], f"{value['object_type'].split('.')[1].title()}Type")
+    if selection is not None:
+        # References the mock could not resolve are kept as given, NetBox would have rejected them
+        return graphql_object(value, selection) if isinstance(value, dict) and 'id' in value else None
+    if isinstance(value, dict) and name in CHOICE_FIELDS:
+        return re.sub(r'[^A-Z0-9]', '_', f"{name}_{value['value']}".upper())  # NetBox's enum names, e.g. TYPE_25GBASE_X_SFP28
+    return value
+
+
+class MockNetBoxHandler(BaseHTTPRequestHandler):
+    netbox = None  # Set on the subclass MockNetBox builds for its server
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True  # Headers and body are written separately, don't let delayed ACKs stall keep-alive requests
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def do_PATCH(self):
+        self.dispatch('PATCH')
+
+    def do_PUT(self):
+        self.dispatch('PUT')
+
+    def do_DELETE(self):
+        self.dispatch('DELETE')
+
+    def do_OPTIONS(self):
+        self.dispatch('OPTIONS')
+
+    def dispatch(self, method):
+        url = urlparse(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+
+        (status, response) = self.netbox.handle(method, url.path, query, body)
+        payload = json.dumps(response).encode() if response is not None else b''
+        with self.netbox.lock:
+            self.netbox.response_bytes += len(payload)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.send_header('API-Version', '4.1')
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
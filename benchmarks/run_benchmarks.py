@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Scale benchmarks for fabric2dcim.
+
+Syncs synthetic leaf/spine and campus fabrics into a local mock NetBox and reports,
+for a cold run (empty NetBox), a warm run (populated NetBox, no local cache) and a
+no-change run (cache and fingerprints from the previous run):
+
+    wall time, NetBox API calls (total and per synced object), MB returned by NetBox,
+    peak RSS of the sync process and the time taken to load the NetBox cache.
+
+Run from the repository root:
+
+    python -m benchmarks.run_benchmarks --switches 100 1000 --latency 0.005 --output results.json
+    python -m benchmarks.run_benchmarks --switches 100 1000 --compare results.json
+
+With --compare the run fails when wall time or API calls grew by more than
+--threshold over the saved results.
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import shutil
+import argparse
+import resource
+import tempfile
+import contextlib
+import multiprocessing
+from benchmarks.mock_netbox import MockNetBox
+from benchmarks.synthetic_fabric import SyntheticFabric, TOPOLOGIES
+
+RUNS = ['cold', 'warm', 'no-change']
+
+# The synthetic topologies look like these fabric types to the sync
+FABRIC_TYPES = {'leaf-spine': ('bigswitch', 'Arista'), 'campus': ('cisco-dnac', 'Cisco')}
+
+
+def run_sync(config, topology, switches, results, verbose):
+    """Run one sync in a fresh process so its peak RSS is its own, puts the measurements on results."""
+    from dcim.ip_manager import IPManager
+    from sync.fabric_sync import FabricSync
+    from metrics.run_metrics import get_metrics
+    from metrics.run_log import setup_logging
+
+    # Quiet runs still show errors
+    setup_logging(dict(config, log_level=None if verbose else 'ERROR'))
+    ip_manager = IPManager()
+    fabric = SyntheticFabric(config, ip_manager, topology, switches)
+    fabric_sync = FabricSync(config, ip_manager, fabric, FABRIC_TYPES[topology][1])
+
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(open(os.devnull, 'w'))
+    start = time.perf_counter()
+    with output:
+        fabric.connect()
+        fabric_sync.run()
+    wall_time = time.perf_counter() - start
+
+    phases = {phase['phase']: phase['seconds'] for phase in get_metrics().report()['phases']}
+    cache_loads = [seconds for phase, seconds in phases.items() if phase.startswith('cache_load_')]
+    results.put({
+        'phases': phases,
+        'wall_time': wall_time,
+        'cache_load_time': sum(cache_loads) if cache_loads else None,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,  # KB on Linux
+    })
+
+
+def count_objects(topology, switches):
+    """Devices, interfaces, cables, VLANs and prefixes the synthetic fabric holds."""
+    fabric = SyntheticFabric({}, None, topology, switches)
+    result = fabric.get_device_inventory()
+    devices = result[0] if isinstance(result, tuple) else result
+    interfaces = sum(len(device.get('interfaces', [])) for device in devices)
+    interfaces += sum(len(switch['interfaces']) for switch in fabric.get_interface_inventory())
+    (vlans, prefixes) = fabric.get_vlan_inventory(devices, {})
+    return len(devices) + interfaces + len(fabric.get_connection_inventory()) + len(vlans) + len(prefixes)
+
+
+def benchmark(topology, switches, latency, cache_preload, verbose):
+    """Run the cold, warm and no-change syncs of one synthetic fabric, returns a result per run."""
+    (fabric_type, _) = FABRIC_TYPES[topology]
+    work_dir = tempfile.mkdtemp(prefix='fabric2dcim-benchmark-')
+    netbox = MockNetBox(latency).start()
+    config = {
+        'netbox_url': netbox.url,
+        'netbox_token': 'benchmark',
+        'netbox_site': 'Benchmark',
+        'fabric_type': fabric_type,
+        'fabric_url': f"https://synthetic-{topology}-{switches}",
+        'fabric_name': f"SYNTHETIC-{topology.upper()}-{switches}",
+        'cache_file_name': os.path.join(work_dir, 'netbox_cache.json'),
+        'vlan_cache_file_name': os.path.join(work_dir, 'vlan_cache.json'),
+        'token_cache_file_name': os.path.join(work_dir, 'token_cache.json'),
+        'cache_preload': cache_preload,
+        'debug': 0,
+    }
+    objects = count_objects(topology, switches)
+    context = multiprocessing.get_context('spawn')
+    results = []
+    try:
+        for run in RUNS:
+            if run == 'warm':
+                # NetBox keeps what the cold run created, the cache is reloaded from it and every object compared
+                for file_name in os.listdir(work_dir):
+                    os.remove(os.path.join(work_dir, file_name))
+            netbox.reset_calls()
+
+            results_queue = context.Queue()
+            process = context.Process(target=run_sync, args=(config, topology, switches, results_queue, verbose))
+            process.start()
+            result = wait_for_result(process, results_queue)
+
+            (calls, endpoints) = netbox.call_counts()
+            result.update({
+                'topology': topology,
+                'switches': switches,
+                'run': run,
+                'cache_preload': cache_preload,
+                'objects': objects,
+                'api_calls': calls,
+                'calls_per_object': calls / objects,
+                'response_mb': netbox.response_bytes / 1024 / 1024,
+                'endpoints': endpoints,
+            })
+            results.append(result)
+            print_result(result)
+    finally:
+        netbox.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def wait_for_result(process, results):
+    """Return the measurements of a sync process, raising if it died without reporting them."""
+    while True:
+        try:
+            result = results.get(timeout=1)
+            process.join()
+            return result
+        except queue.Empty:
+            if not process.is_alive():
+                raise RuntimeError(f"Benchmark sync failed with exit code {process.exitcode}")
+
+
+def print_result(result):
+    cache_load = f"{result['cache_load_time']:.2f}" if result['cache_load_time'] is not None else '-'
+    print(f"{result['topology']:<11} {result['switches']:>7} {result['run']:<10} {result['wall_time']:>9.2f} "
+          f"{result['api_calls']:>9} {result['calls_per_object']:>9.3f} {result['response_mb']:>9.2f} {result['peak_rss_mb']:>9.1f} {cache_load:>10}")
+
+
+def compare(results, baseline_file_name, threshold):
+    """Print the runs that got slower or made more API calls than in the baseline, returns True if there are none."""
+    with open(baseline_file_name, 'r') as baseline_file:
+        baseline = {(result['topology'], result['switches'], result['run'], result.get('cache_preload', 'rest')): result for result in json.load(baseline_file)}
+
+    regressions = []
+    for result in results:
+        old = baseline.get((result['topology'], result['switches'], result['run'], result['cache_preload']))
+        if old is None:
+            continue
+        for metric in ['wall_time', 'api_calls']:
+            if old[metric] and result[metric] > old[metric] * (1 + threshold):
+                regressions.append(f"{result['topology']} {result['switches']} {result['run']}: {metric} {old[metric]:.2f} -> {result[metric]:.2f}")
+
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return not regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='fabric2dcim scale benchmarks against a local mock NetBox')
+    parser.add_argument('--topology', nargs='+', choices=TOPOLOGIES, default=TOPOLOGIES, help='Synthetic fabric topologies to sync')
+    parser.add_argument('--switches', nargs='+', type=int, default=[100], help='Fabric sizes to sync, e.g. 100 1000 10000')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds the mock NetBox waits before answering each request')
+    parser.add_argument('--cache-preload', choices=['rest', 'graphql'], default='rest', help='How the syncs load the NetBox cache')
+    parser.add_argument('--output', type=str, help='Write the results to this JSON file')
+    parser.add_argument('--compare', type=str, help='Fail if wall time or API calls regressed against this results file')
+    parser.add_argument('--threshold', type=float, default=0.1, help='Allowed growth over --compare results, default 0.1 (10%%)')
+    parser.add_argument('--verbose', action='store_true', help='Show the output of the syncs')
+    args = parser.parse_args()
+
+    print(f"{'topology':<11} {'switches':>7} {'run':<10} {'wall s':>9} {'api calls':>9} {'calls/obj':>9} {'resp MB':>9} {'rss MB':>9} {'cache s':>10}")
+    results = []
+    for topology in args.topology:
+        for switches in args.switches:
+            results.extend(benchmark(topology, switches, args.latency, args.cache_preload, args.verbose))
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+    if args.compare and not compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
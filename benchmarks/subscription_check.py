@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Checks ACI subscription mode against local stand-ins for the APIC websocket and NetBox.
+
+A small synthetic fabric is synced into a mock NetBox, then APIC events are pushed
+through the MockAPIC websocket stand-in to CiscoACIFabric.subscribe(). Each event's
+effect on NetBox (or the NetBox cache for updates) is checked, the run fails if
+any check does.
+
+Run from the repository root:
+
+    python -m benchmarks.subscription_check
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+from benchmarks.mock_apic import MockAPIC
+from benchmarks.mock_netbox import MockNetBox
+from benchmarks.synthetic_fabric import SyntheticFabric
+from dcim.ip_manager import IPManager
+from sync.fabric_sync import FabricSync
+from fabrics.cisco_aci_fabric import CiscoACIFabric
+from metrics.run_log import setup_logging
+
+SWITCHES = 6  # pod1-spine1..4, pod1-leaf1..2
+
+
+def node_dn(number):
+    return f"topology/pod-1/node-{number}"
+
+
+def event(class_name, dn, status='modified', **attributes):
+    return {class_name: {'attributes': dict(attributes, dn=dn, status=status)}}
+
+
+def main():
+    work_dir = tempfile.mkdtemp(prefix='fabric2dcim-subscription-')
+    netbox = MockNetBox().start()
+    config = {
+        'netbox_url': netbox.url,
+        'netbox_token': 'check',
+        'netbox_site': 'Check',
+        'fabric_type': 'cisco-aci',
+        'fabric_name': 'CHECK-ACI',
+        'cache_file_name': os.path.join(work_dir, 'netbox_cache.json'),
+        'token_cache_file_name': os.path.join(work_dir, 'token_cache.json'),
+        'log_level': 'ERROR',
+        'debug': 0,
+    }
+    setup_logging(config)
+
+    # Nodes 101-106 are the synced switches, 150 is registered with the APIC but not synced yet
+    synthetic = SyntheticFabric(config, IPManager(), 'leaf-spine', SWITCHES)
+    nodes = {node_dn(101 + index): {'name': synthetic.leaf_spine_name(index), 'role': 'spine' if synthetic.is_spine(index) else 'leaf'}
+             for index in range(SWITCHES)}
+    nodes[node_dn(150)] = {'name': 'pod1-leaf50', 'role': 'leaf'}
+    apic = MockAPIC(nodes).start()
+    config['fabric_url'] = apic.url
+
+    try:
+        ip_manager = IPManager()
+        fabric_sync = FabricSync(config, ip_manager, synthetic, 'Cisco')
+        synthetic.connect()
+        fabric_sync.run()
+        netbox_manager = fabric_sync.get_netbox_manager()
+        cache = netbox_manager.netbox_cache
+        before = netbox.object_counts()
+
+        apic.push(
+            event('fabricNode', node_dn(101), fabricSt='inactive'),
+            event('l1PhysIf', f"{node_dn(105)}/sys/phys-[ethernet1]", adminSt='down'),
+            event('fabricNode', node_dn(199), 'created', name='pod1-leaf99', role='leaf', model='N9K-C93180YC-FX', serial='CHECK199', fabricSt='active'),
+            event('l1PhysIf', f"{node_dn(199)}/sys/phys-[eth1/1]", 'created', adminSt='up', speed='10G'),
+            event('l1PhysIf', f"{node_dn(105)}/sys/phys-[ethernet999]", adminSt='down'),
+            event('fabricNode', node_dn(150), fabricSt='active'),
+            event('lldpAdjEp', f"{node_dn(199)}/sys/lldp/inst/if-[eth1/1]/adj-1", 'created', sysName='pod1-spine1.check', portIdV='ethernet10'),
+        )
+        aci = CiscoACIFabric(config, ip_manager)
+        aci.connect()
+        aci.subscribe(netbox_manager, fabric_sync.prepare_device, websocket_factory=apic.websocket, max_events=7)
+        after = netbox.object_counts()
+
+        new_device = next((device for device in netbox.objects['dcim/devices'].values() if device['name'] == 'pod1-leaf99'), {})
+        new_interface = next((interface for interface in netbox.objects['dcim/interfaces'].values()
+                              if interface['device']['name'] == 'pod1-leaf99' and interface['name'] == 'eth1/1'), {})
+        leaf1_id = cache['devices']['pod1-leaf1']['id']
+        checks = [
+            ('node status update', cache['devices']['pod1-spine1'].get('status') == 'offline'),
+            ('port adminSt update', netbox_manager.nb_cacher.index.interface(leaf1_id, 'ethernet1').get('enabled') is False),
+            ('new node created with type, role, site and virtual chassis',
+             all(new_device.get(field) for field in ['device_type', 'role', 'site', 'virtual_chassis'])),
+            ('new port created with a type', (new_interface.get('type') or {}).get('value') == '10gbase-x-sfpp'),
+            ('uncached port left for the next full sync', netbox_manager.nb_cacher.index.interface(leaf1_id, 'ethernet999') is None),
+            ('uncached node left for the next full sync', 'pod1-leaf50' not in cache['devices']),
+            ('one device, interface and cable created',
+             [after.get(endpoint, 0) - before.get(endpoint, 0) for endpoint in ['dcim/devices', 'dcim/interfaces', 'dcim/cables']] == [1, 1, 1]),
+        ]
+    finally:
+        apic.stop()
+        netbox.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    for (name, passed) in checks:
+        print(f"{'PASS' if passed else 'FAIL'} {name}")
+    if not all(passed for (_, passed) in checks):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+import ipaddress
+from fabrics.network_fabric_base import NetworkFabric
+from metrics.run_log import get_logger
+
+log = get_logger(__name__)
+
+TOPOLOGIES = ['leaf-spine', 'campus']
+
+# Leaf/spine: pods of 4 spines and 32 leaves, 48 server ports and one uplink per pod spine on each leaf
+POD_SPINES = 4
+POD_SWITCHES = 36
+LEAF_PORTS = 48
+SPINE_PORTS = 32
+HOSTS_PER_LEAF = 2  # LLDP discovered servers, placeholders in NetBox
+
+# Campus: buildings with 2 distribution and 8 access switches over 4 floors, behind 2 core switches
+CORE_SWITCHES = 2
+BUILDING_SWITCHES = 10
+FLOORS = 4
+ACCESS_PORTS = 48
+BUILDING_VLANS = 4
+
+
+class SyntheticFabric(NetworkFabric):
+    """
+    Generated fabric inventory for benchmarks, in the format the real fabrics return.
+
+    leaf-spine looks like a Big Switch fabric (devices and interfaces collected
+    separately, fabric links and connected servers as cables), campus like DNA Center
+    (sites per building and floor, interfaces returned with their devices, VLANs and
+    prefixes per building). The same topology and size always produce the same data.
+    """
+
+    def __init__(self, config, ip_manager, topology='leaf-spine', switches=100):
+        if topology not in TOPOLOGIES:
+            raise ValueError(f"Unknown topology {topology}, supported values are {', '.join(TOPOLOGIES)}")
+        self.config = config
+        self.ip_manager = ip_manager
+        self.topology = topology
+        self.switches = switches
+        self.default_site = self.config.get('netbox_site')
+
+    def connect(self):
+        log.info(f"Generating {self.topology} fabric with {self.switches} switches")
+
+    def get_device_inventory(self):
+        if self.topology == 'campus':
+            devices = [self.campus_device(index) for index in range(self.switches)]
+            return (devices, self.get_site_inventory())
+        return [self.leaf_spine_device(index) for index in range(self.switches)]
+
+    def get_interface_inventory(self):
+        if self.topology == 'campus':
+            return []  # Returned with the devices
+        return [{'name': self.leaf_spine_name(index), 'interfaces': self.leaf_spine_interfaces(index)} for index in range(self.switches)]
+
+    def get_network_inventory(self):
+        return None
+
+    def get_connection_inventory(self):
+        if self.topology == 'campus':
+            return self.campus_connections()
+        return self.leaf_spine_connections()
+
+    def get_site_inventory(self):
+        if self.topology != 'campus':
+            return {}
+        return {serial(index): self.campus_site(index) for index in range(self.switches)}
+
+    def get_vlan_inventory(self, devices, sites):
+        """Return (vlans, prefixes) keyed by VLAN id like the DNAC collector."""
+        vlans = {}
+        prefixes = {}
+        if self.topology == 'campus':
+            count = min(4000, max(1, (self.switches - CORE_SWITCHES) // BUILDING_SWITCHES + 1) * BUILDING_VLANS)
+        else:
+            count = min(4000, self.switches * 2)
+        for index in range(count):
+            vid = index + 2
+            name = f"vlan-{vid}"
+            vlans[vid] = {'vid': vid, 'name': name, 'status': 'active'}
+            if index % 2 == 0:
+                network = ipaddress.ip_network('10.0.0.0/26').network_address + index * 64
+                prefixes[vid] = {'name': name, 'vlan': vid, 'prefix': f"{network}/26", 'status': 'active'}
+        return (vlans, prefixes)
+
+    def leaf_spine_name(self, index):
+        (pod, position) = divmod(index, POD_SWITCHES)
+        if position < POD_SPINES:
+            return f"pod{pod + 1}-spine{position + 1}"
+        return f"pod{pod + 1}-leaf{position - POD_SPINES + 1}"
+
+    def is_spine(self, index):
+        return index % POD_SWITCHES < POD_SPINES
+
+    def leaf_spine_device(self, index):
+        spine = self.is_spine(index)
+        return {
+            'name': self.leaf_spine_name(index),
+            'role': {'name': 'spine' if spine else 'leaf'},
+            'device_type': {'model': 'DCS-7280CR3-32P4' if spine else 'DCS-7050SX3-48YC8', 'manufacturer': {'name': 'Generic'}},
+            'platform': 'Switch Light OS',
+            'serial': serial(index),
+            'status': 'active',
+            'primary_ip6': f"fe80::{index + 1:x}/64",
+            'primary_ip4': f"{management_ip(index)}/32",
+            'site': {'name': self.default_site},
+        }
+
+    def leaf_spine_interfaces(self, index):
+        name = self.leaf_spine_name(index)
+        if self.is_spine(index):
+            ports = [(f"ethernet{port}", '100g') for port in range(1, SPINE_PORTS + 1)]
+        else:
+            ports = [(f"ethernet{port}", '25g') for port in range(1, LEAF_PORTS + 1)]
+            ports += [(f"ethernet{LEAF_PORTS + spine}", '100g') for spine in range(1, POD_SPINES + 1)]
+        return [interface(name, index, number, port, speed) for number, (port, speed) in enumerate(ports)]
+
+    def leaf_spine_connections(self):
+        connections = []
+        for index in range(self.switches):
+            if self.is_spine(index):
+                continue
+            pod_start = index - index % POD_SWITCHES
+            leaf = index % POD_SWITCHES - POD_SPINES + 1
+            for spine in range(POD_SPINES):
+                if pod_start + spine >= self.switches:
+                    break
+                connections.append({
+                    'src-device': self.leaf_spine_name(pod_start + spine),
+                    'src-interface': f"ethernet{leaf}",
+                    'dst-device': self.leaf_spine_name(index),
+                    'dst-interface': f"ethernet{LEAF_PORTS + spine + 1}",
+                })
+            for host in range(1, HOSTS_PER_LEAF + 1):
+                connections.append({
+                    'src-device': self.leaf_spine_name(index),
+                    'src-interface': f"ethernet{host}",
+                    'dst-device': f"server{index + 1}-{host}",
+                    'dst-interface': 'eth0',
+                })
+        return connections
+
+    def campus_role(self, index):
+        if index < CORE_SWITCHES:
+            return 'core'
+        return 'distribution' if (index - CORE_SWITCHES) % BUILDING_SWITCHES < 2 else 'access'
+
+    def campus_building(self, index):
+        return max(0, index - CORE_SWITCHES) // BUILDING_SWITCHES
+
+    def campus_site(self, index):
+        if index < CORE_SWITCHES:
+            return 'Global/Campus/Core/Data Center'
+        building = self.campus_building(index)
+        floor = (index - CORE_SWITCHES) % BUILDING_SWITCHES % FLOORS + 1
+        return f"Global/Area {building // 25 + 1}/Building {building + 1}/Floor {floor}"
+
+    def campus_name(self, index):
+        role = self.campus_role(index)
+        if role == 'core':
+            return f"core{index + 1}"
+        return f"b{self.campus_building(index) + 1}-{role[:4]}{(index - CORE_SWITCHES) % BUILDING_SWITCHES + 1}"
+
+    def campus_device(self, index):
+        role = self.campus_role(index)
+        name = self.campus_name(index)
+        parts = self.campus_site(index).split('/')
+        models = {'core': 'C9500-32C', 'distribution': 'C9500-24Y4C', 'access': 'C9300-48P'}
+        return {
+            'name': name,
+            'role': {'name': role},
+            'device_type': {'model': models[role].replace('C', 'Catalyst ', 1), 'manufacturer': {'name': 'Cisco'}, 'part_number': models[role]},
+            'platform': 'IOS-XE 17.9.4',
+            'serial': serial(index),
+            'status': 'active',
+            'primary_ip4': f"{management_ip(index)}/32",
+            'site': {'name': parts[2]},
+            'location': {'name': parts[3]},
+            'interfaces': self.campus_interfaces(index),
+        }
+
+    def campus_interfaces(self, index):
+        role = self.campus_role(index)
+        name = self.campus_name(index)
+        if role == 'core':
+            ports = [f"HundredGigE1/0/{port}" for port in range(1, 33)]
+        elif role == 'distribution':
+            ports = [f"TwentyFiveGigE1/0/{port}" for port in range(1, 25)] + [f"HundredGigE1/1/{port}" for port in range(1, 5)]
+        else:
+            ports = [f"GigabitEthernet1/0/{port}" for port in range(1, ACCESS_PORTS + 1)] + [f"TenGigabitEthernet1/1/{port}" for port in range(1, 5)]
+        return [interface(name, index, number, port, None) for number, port in enumerate(ports + ['Vlan1'])]
+
+    def campus_connections(self):
+        connections = []
+        for index in range(CORE_SWITCHES, self.switches):
+            role = self.campus_role(index)
+            building_start = CORE_SWITCHES + self.campus_building(index) * BUILDING_SWITCHES
+            position = index - building_start
+            if role == 'distribution':
+                # Each distribution switch uplinks to both cores
+                for core in range(CORE_SWITCHES):
+                    connections.append({
+                        'src-device': self.campus_name(core),
+                        'src-interface': f"HundredGigE1/0/{(self.campus_building(index) * 2 + position) % 32 + 1}",
+                        'dst-device': self.campus_name(index),
+                        'dst-interface': f"HundredGigE1/1/{core + 1}",
+                    })
+            else:
+                # Each access switch uplinks to both distribution switches of its building
+                for distribution in range(2):
+                    if building_start + distribution >= self.switches:
+                        break
+                    connections.append({
+                        'src-device': self.campus_name(building_start + distribution),
+                        'src-interface': f"TwentyFiveGigE1/0/{position - 1}",
+                        'dst-device': self.campus_name(index),
+                        'dst-interface': f"TenGigabitEthernet1/1/{distribution + 1}",
+                    })
+        return connections
+
+
+def serial(index):
+    return f"SYN{index:08d}"
+
+
+def management_ip(index):
+    return ipaddress.ip_address('10.255.0.1') + index
+
+
+def interface(device_name, index, number, name, speed):
+    return {
+        'device': {'name': device_name},
+        'name': name,
+        'mac_address': f"02:00:{index >> 16 & 0xff:02x}:{index >> 8 & 0xff:02x}:{index & 0xff:02x}:{number:02x}",
+        'enabled': True,
+        'speed_type': ['fiber', speed] if speed else None,
+    }
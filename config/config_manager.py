@@ -11,7 +11,7 @@ class ConfigManager:
         Load configuration values from command-line arguments.
         """
         parser = argparse.ArgumentParser(description="Sync network fabric information to NetBox")
-        parser.add_argument('--fabric-type', type=str, help='Fabric type (bigswitch, cisco-nx, cisco-aci, cisco-dnac) (FABRIC_TYPE environment variable)')
+        parser.add_argument('--fabric-type', type=str, help='Fabric type (bigswitch, cisco-aci, cisco-dnac or one added by a plugin) (FABRIC_TYPE environment variable)')
         parser.add_argument('--fabric-url', type=str, help='Fabric controller URL (FABRIC_URL environment variable)')
         parser.add_argument('--fabric-name', type=str, help='Fabric controller name (FABRIC_URL environment variable)')
         parser.add_argument('--username', type=str, help='Fabric username (FABRIC_USERNAME environment variable)')
@@ -21,6 +21,36 @@ class ConfigManager:
         parser.add_argument('--netbox-site', type=str, help='NetBox site name to use (NETBOX_SITE environment variable)')
         parser.add_argument('--cache-filename', type=str, help='Cache Netbox data to Filename (CACHE_FILENAME environment variable)')
         parser.add_argument('--cache-timeout', type=str, help='Cache file timeout (CACHE_FILE_TIMEOUT environment variable)')
+        parser.add_argument('--cache-mode', type=str, choices=['file', 'shared'], help="Load the NetBox cache file into each process (default) or map a snapshot shared by every process on this host (CACHE_MODE environment variable)")
+        parser.add_argument('--vlan-cache-filename', type=str, help='Cache DNAC device VLANs to Filename (VLAN_CACHE_FILENAME environment variable)')
+        parser.add_argument('--vlan-cache-timeout', type=int, help='Seconds cached DNAC device VLANs are reused, default 86400 (VLAN_CACHE_TIMEOUT environment variable)')
+        parser.add_argument('--cache-preload', type=str, choices=['rest', 'graphql'], help="Load the NetBox cache through the REST API (default) or GraphQL, which falls back to REST per object type (CACHE_PRELOAD environment variable)")
+        parser.add_argument('--token-cache-filename', type=str, help='Cache fabric controller auth tokens to Filename (TOKEN_CACHE_FILENAME environment variable)')
+        parser.add_argument('--fabric-workers', type=int, help='Number of concurrent fabric API calls (FABRIC_WORKERS environment variable)')
+        parser.add_argument('--fabric-rate-limit', type=float, help='Maximum fabric API requests per second (FABRIC_RATE_LIMIT environment variable)')
+        parser.add_argument('--fabric-retries', type=int, help='Retries for throttled or failed fabric API calls (FABRIC_RETRIES environment variable)')
+        parser.add_argument('--fabrics-file', type=str, help='JSON list of fabric definitions to sync concurrently in one process (FABRICS_FILE environment variable)')
+        parser.add_argument('--shards', type=int, help='Split the NetBox writes over this many worker processes/hosts (SHARDS environment variable)')
+        parser.add_argument('--shard-index', type=int, help='Only run this shard, for workers on other hosts sharing --work-dir (SHARD_INDEX environment variable)')
+        parser.add_argument('--local-shards', type=int, help='Shards the coordinator starts itself, default all of them (LOCAL_SHARDS environment variable)')
+        parser.add_argument('--work-dir', type=str, help='Directory shared by the coordinator and shards, default ./fabric2dcim-work (WORK_DIR environment variable)')
+        parser.add_argument('--stream', action='store_true', help='Stream inventory from the fabric into NetBox while it is collected, for one-shot syncs of large fabrics (STREAM environment variable)')
+        parser.add_argument('--queue-depth', help='Items buffered per inventory section in streaming mode, default 500 (QUEUE_DEPTH environment variable)')
+        parser.add_argument('--resume', action='store_true', help='Continue an interrupted sync from its checkpoint without collecting the fabric again (RESUME environment variable)')
+        parser.add_argument('--record-file', type=str, help='Save every controller response to this gzip archive for offline replay (RECORD_FILE environment variable)')
+        parser.add_argument('--replay-file', type=str, help='Replay a recorded archive instead of connecting to the fabric (REPLAY_FILE environment variable)')
+        parser.add_argument('--replay-latency', type=str, help="Seconds added to every replayed call, or 'recorded' for the recorded latency (REPLAY_LATENCY environment variable)")
+        parser.add_argument('--force-sync', action='store_true', help='Write every section even if the fabric is unchanged since the last sync (FORCE_SYNC environment variable)')
+        parser.add_argument('--daemon', action='store_true', help='Keep running and sync only changes every --sync-interval seconds (DAEMON environment variable)')
+        parser.add_argument('--sync-interval', type=int, help='Seconds between syncs in daemon mode, default 300 (SYNC_INTERVAL environment variable)')
+        parser.add_argument('--subscribe', action='store_true', help='After syncing keep NetBox updated from controller events, cisco-aci only (SUBSCRIBE environment variable)')
+        parser.add_argument('--metrics-file', type=str, help='Write a JSON report of phase timings, API calls and object counts (METRICS_FILE environment variable)')
+        parser.add_argument('--metrics-textfile', type=str, help='Write the metrics for the node_exporter textfile collector, e.g. /var/lib/node_exporter/fabric2dcim.prom (METRICS_TEXTFILE environment variable)')
+        parser.add_argument('--profile', type=str, help='Profile CPU and wall time of each sync phase into this directory (PROFILE_DIR environment variable)')
+        parser.add_argument('--log-level', type=str.upper, choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], help='Log level, default INFO or DEBUG with --debug (LOG_LEVEL environment variable)')
+        parser.add_argument('--log-format', choices=['text', 'json'], help='Log as text lines or one JSON object per line, default text (LOG_FORMAT environment variable)')
+        parser.add_argument('--log-sample', type=int, help='Only log every Nth per-object message of each kind, default 1 (LOG_SAMPLE environment variable)')
+        parser.add_argument('--progress-interval', type=float, help='Seconds between progress summaries, 0 turns them off, default 30 (PROGRESS_INTERVAL environment variable)')
         parser.add_argument('--debug', type=str, help='Show Debug output (DEBUG environment variable)')
 
         args = parser.parse_args()
@@ -36,6 +66,36 @@ class ConfigManager:
         self.config['fabric_name'] = args.username or os.getenv('FABRIC_NAME')
         self.config['cache_file_name'] = args.cache_filename or os.getenv('CACHE_FILENAME')
         self.config['cache_time']= args.cache_timeout or os.getenv('CACHE_FILE_TIMEOUT')
+        self.config['cache_mode'] = args.cache_mode or os.getenv('CACHE_MODE')
+        self.config['vlan_cache_file_name'] = args.vlan_cache_filename or os.getenv('VLAN_CACHE_FILENAME')
+        self.config['vlan_cache_time'] = args.vlan_cache_timeout or os.getenv('VLAN_CACHE_TIMEOUT')
+        self.config['cache_preload'] = args.cache_preload or os.getenv('CACHE_PRELOAD')
+        self.config['token_cache_file_name'] = args.token_cache_filename or os.getenv('TOKEN_CACHE_FILENAME')
+        self.config['fabric_workers'] = args.fabric_workers or os.getenv('FABRIC_WORKERS')
+        self.config['fabric_rate_limit'] = args.fabric_rate_limit or os.getenv('FABRIC_RATE_LIMIT')
+        self.config['fabric_retries'] = args.fabric_retries or os.getenv('FABRIC_RETRIES')
+        self.config['fabrics_file'] = args.fabrics_file or os.getenv('FABRICS_FILE')
+        self.config['shards'] = args.shards or os.getenv('SHARDS')
+        self.config['shard_index'] = args.shard_index if args.shard_index is not None else os.getenv('SHARD_INDEX')
+        self.config['local_shards'] = args.local_shards if args.local_shards is not None else os.getenv('LOCAL_SHARDS')
+        self.config['work_dir'] = args.work_dir or os.getenv('WORK_DIR')
+        self.config['stream'] = args.stream or os.getenv('STREAM')
+        self.config['queue_depth'] = args.queue_depth or os.getenv('QUEUE_DEPTH')
+        self.config['resume'] = args.resume or os.getenv('RESUME')
+        self.config['record_file'] = args.record_file or os.getenv('RECORD_FILE')
+        self.config['replay_file'] = args.replay_file or os.getenv('REPLAY_FILE')
+        self.config['replay_latency'] = args.replay_latency or os.getenv('REPLAY_LATENCY')
+        self.config['force_sync'] = args.force_sync or os.getenv('FORCE_SYNC')
+        self.config['daemon'] = args.daemon or os.getenv('DAEMON')
+        self.config['sync_interval'] = args.sync_interval or os.getenv('SYNC_INTERVAL')
+        self.config['subscribe'] = args.subscribe or os.getenv('SUBSCRIBE')
+        self.config['metrics_file'] = args.metrics_file or os.getenv('METRICS_FILE')
+        self.config['metrics_textfile'] = args.metrics_textfile or os.getenv('METRICS_TEXTFILE')
+        self.config['profile_dir'] = args.profile or os.getenv('PROFILE_DIR')
+        self.config['log_level'] = args.log_level or os.getenv('LOG_LEVEL')
+        self.config['log_format'] = args.log_format or os.getenv('LOG_FORMAT')
+        self.config['log_sample'] = args.log_sample or os.getenv('LOG_SAMPLE')
+        self.config['progress_interval'] = args.progress_interval if args.progress_interval is not None else os.getenv('PROGRESS_INTERVAL')
         self.config['debug'] = args.debug or os.getenv('DEBUG') or 0
         
         return self.config
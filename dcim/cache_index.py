@@ -0,0 +1,111 @@
+from collections.abc import Mapping
+
+# Related object fields -> the object type their id refers to, per object type where a field
+# name refers to different types (a site's group is a site group, a VLAN's group a VLAN group)
+RELATED_TYPES = {
+    'device': 'devices',
+    'device_type': 'device_types',
+    'role': 'device_roles',
+    'manufacturer': 'manufacturers',
+    'platform': 'platforms',
+    'site': 'sites',
+    'location': 'locations',
+    'rack': 'racks',
+    'virtual_chassis': 'virtual_chassis',
+    'master': 'devices',
+    'lag': 'interfaces',
+    'vlan': 'vlans',
+    'untagged_vlan': 'vlans',
+    'primary_ip4': 'ip_addresses',
+    'primary_ip6': 'ip_addresses',
+    'cluster': 'virtual_clusters',
+    'virtual_machine': 'virtual_machines',
+}
+RELATED_TYPE_OVERRIDES = {
+    ('sites', 'group'): 'site_groups',
+    ('site_groups', 'parent'): 'site_groups',
+    ('locations', 'parent'): 'locations',
+    ('interfaces', 'parent'): 'interfaces',
+    ('virtual_interfaces', 'parent'): 'virtual_interfaces',
+    ('devices', 'role'): 'device_roles',
+    ('virtual_machines', 'role'): 'device_roles',
+}
+
+_EMPTY = {}
+
+
+def related_type(object_type, field):
+    """Object type a related object field of object_type refers to, None if it isn't cached."""
+    return RELATED_TYPE_OVERRIDES.get((object_type, field)) or RELATED_TYPES.get(field)
+
+
+def related_id(value):
+    """Id of a related object given as an id or a nested object, None if there is none."""
+    if isinstance(value, int):
+        return value
+    if isinstance(value, Mapping) and isinstance(value.get('id'), int):
+        return value['id']
+    return None
+
+
+class CacheIndex:
+    """
+    Integer keyed indexes of the cached NetBox objects, maintained by NetBoxCache.add().
+
+    by_id holds every cached object by type and id. interfaces_by_device finds an
+    interface by its device's id and name, cables_by_termination the cable attached
+    to an interface. Lookups take the ints NetBox returns, no key strings are built.
+    """
+
+    def __init__(self):
+        self.by_id = {}                  # object_type -> {id: object}
+        self.interfaces_by_device = {}   # device id -> {interface name: interface}
+        self.cables_by_termination = {}  # interface id -> cable
+
+    def add(self, object_type, obj):
+        object_id = related_id(obj)
+        if object_id is None:
+            return
+        self.by_id.setdefault(object_type, {})[object_id] = obj
+        if object_type == 'interfaces':
+            device_id = related_id(obj.get('device'))
+            if device_id is not None:
+                self.interfaces_by_device.setdefault(device_id, {})[obj.get('name')] = obj
+        elif object_type == 'cables':
+            for termination_id in termination_ids(obj):
+                self.cables_by_termination[termination_id] = obj
+
+    def discard(self, object_type, obj):
+        """Remove an object's secondary index entries, before it is changed and added again."""
+        if object_type == 'interfaces':
+            interfaces = self.interfaces_by_device.get(related_id(obj.get('device')), _EMPTY)
+            if interfaces.get(obj.get('name')) is obj:
+                del interfaces[obj.get('name')]
+        elif object_type == 'cables':
+            for termination_id in termination_ids(obj):
+                if self.cables_by_termination.get(termination_id) is obj:
+                    del self.cables_by_termination[termination_id]
+
+    def get(self, object_type, object_id):
+        """Return the cached object of a type by its id, None if it isn't cached."""
+        return self.by_id.get(object_type, _EMPTY).get(object_id)
+
+    def interface(self, device_id, name):
+        return self.interfaces_by_device.get(device_id, _EMPTY).get(name)
+
+    def cable(self, termination_id):
+        return self.cables_by_termination.get(termination_id)
+
+    def tables(self):
+        """Yield (table name, {key: object}) of every index, keys as strings, for the shared cache snapshot."""
+        for object_type, objects in self.by_id.items():
+            yield (f"index:id:{object_type}", {str(object_id): obj for object_id, obj in objects.items()})
+        yield ('index:interfaces_by_device', {f"{device_id}:{name}": interface
+                                              for device_id, interfaces in self.interfaces_by_device.items() for name, interface in interfaces.items()})
+        yield ('index:cables_by_termination', {str(termination_id): cable for termination_id, cable in self.cables_by_termination.items()})
+
+
+def termination_ids(cable):
+    """Interface ids of both ends of a cached cable (terminations are cached as ids)."""
+    return [termination_id for end in ('a_terminations', 'b_terminations')
+            for termination_id in map(related_id, cable.get(end) or []) if termination_id is not None]
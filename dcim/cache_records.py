@@ -0,0 +1,155 @@
+import sys
+import threading
+from collections.abc import MutableMapping
+
+# Object types held by the hundred thousand, cached as CachedRecord instead of dicts
+RECORD_TYPES = ('devices', 'interfaces', 'ip_addresses', 'cables')
+
+# REST fields describing the API rather than the object, the sync never compares or sends them
+DROPPED_FIELDS = frozenset(['url', 'display', 'display_url', 'created', 'last_updated', '_occupied', 'link_peers', 'link_peers_type',
+                            'connected_endpoints', 'connected_endpoints_type', 'connected_endpoints_reachable', 'count_ipaddresses',
+                            'count_fhrp_groups', 'l2vpn_termination', 'wireless_link', 'wireless_lans', 'vdcs'])
+
+# Strings repeated across objects (choice values, names of shared objects) are stored once
+INTERNED_LENGTH = 32
+
+
+class Empty:
+    """Stand-in for the empty lists and dicts most objects carry (tags, tagged_vlans, custom_fields)."""
+
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __reduce__(self):
+        return self.name  # Copied and pickled as the module's singleton
+
+
+# Every read of a field holding one of these returns a new empty list or dict, callers can still change it
+EMPTY_LIST = Empty('EMPTY_LIST')
+EMPTY_DICT = Empty('EMPTY_DICT')
+
+
+class RecordSchema:
+    """
+    The field names of records, shared by every record with the same fields.
+
+    Each record only holds a tuple of values in the order of its schema. Objects of
+    one type loaded from NetBox all have the same fields and share one schema, a
+    field added by an update moves the record to the (shared) extended schema.
+    """
+
+    _schemas = {}
+    _lock = threading.Lock()
+
+    def __init__(self, fields):
+        self.fields = fields
+        self.index = {field: position for position, field in enumerate(fields)}
+        self.extended = {}  # field -> schema with the field added
+
+    @classmethod
+    def of(cls, fields):
+        fields = tuple(fields)
+        with cls._lock:
+            schema = cls._schemas.get(fields)
+            if schema is None:
+                schema = cls._schemas[fields] = cls(fields)
+            return schema
+
+    def extend(self, field):
+        schema = self.extended.get(field)
+        if schema is None:
+            schema = self.extended[field] = RecordSchema.of(self.fields + (field,))
+        return schema
+
+
+def compact(value):
+    """Intern short strings and replace empty lists and dicts, so equal values of many records share one object."""
+    if isinstance(value, str) and len(value) <= INTERNED_LENGTH:
+        return sys.intern(value)
+    if isinstance(value, list) and not value:
+        return EMPTY_LIST
+    if isinstance(value, dict) and not value:
+        return EMPTY_DICT
+    return value
+
+
+def expand(value):
+    if value is EMPTY_LIST:
+        return []
+    if value is EMPTY_DICT:
+        return {}
+    return value
+
+
+class CachedRecord(MutableMapping):
+    """
+    Compact cached NetBox object, read and updated like the dict it replaces.
+
+    A dict of a NetBox interface carries a hash table of some 40 keys next to URLs and
+    timestamps unique to the object. A record holds a schema shared with the other
+    objects of its type and a tuple of values, without the fields in DROPPED_FIELDS
+    and without fields that are None: compare_objects() treats a missing field as None,
+    use get() rather than [] for fields that may be empty.
+    """
+
+    __slots__ = ('schema', 'data')
+
+    def __init__(self, schema, data):
+        self.schema = schema
+        self.data = data
+
+    @classmethod
+    def from_dict(cls, obj):
+        fields = [field for field, value in obj.items() if value is not None and field not in DROPPED_FIELDS]
+        return cls(RecordSchema.of(fields), tuple(compact(obj[field]) for field in fields))
+
+    def __getitem__(self, key):
+        position = self.schema.index.get(key)
+        if position is None:
+            raise KeyError(key)
+        return expand(self.data[position])
+
+    def get(self, key, default=None):
+        position = self.schema.index.get(key)
+        return default if position is None else expand(self.data[position])
+
+    def __contains__(self, key):
+        return key in self.schema.index
+
+    def __setitem__(self, key, value):
+        position = self.schema.index.get(key)
+        if position is None:
+            self.schema = self.schema.extend(key)
+            self.data = self.data + (compact(value),)
+        else:
+            self.data = self.data[:position] + (compact(value),) + self.data[position + 1:]
+
+    def __delitem__(self, key):
+        position = self.schema.index.get(key)
+        if position is None:
+            raise KeyError(key)
+        fields = self.schema.fields
+        self.schema = RecordSchema.of(fields[:position] + fields[position + 1:])
+        self.data = self.data[:position] + self.data[position + 1:]
+
+    def __iter__(self):
+        return iter(self.schema.fields)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __repr__(self):
+        return f"CachedRecord({self.serialize()!r})"
+
+    def serialize(self):
+        """Plain dict of the record, for JSON and the NetBox API."""
+        return {field: expand(value) for field, value in zip(self.schema.fields, self.data)}
+
+
+def to_record(object_type, obj):
+    """Return obj as a CachedRecord if object_type is one of RECORD_TYPES, otherwise unchanged."""
+    if object_type in RECORD_TYPES and isinstance(obj, dict):
+        return CachedRecord.from_dict(obj)
+    return obj
@@ -1,3 +1,8 @@
+from metrics.run_log import get_logger, SAMPLED
+
+log = get_logger(__name__)
+
+
 class IPManager:
     def __init__(self):
         # Temporary storage for IPs to be assigned
@@ -18,12 +23,12 @@ class IPManager:
             primary_ips = self.ip_addresses_to_assign[device_name]
 
             if interface_ip == primary_ips.get('primary_ip4'):
-                print(f"Assigning ip4 {interface_ip} to interface: {interface_data['name']}")
+                log.info("Assigning ip4 %s to interface: %s", interface_ip, interface_data['name'], extra=SAMPLED)
                 netbox_ip = netbox_instance.ipam.ip_addresses.get(address=interface_ip)
                 netbox_ip.update({'assigned_object_id': interface_data['id']})
 
             if interface_ip == primary_ips.get('primary_ip6'):
-                print(f"Assigning ip6 {interface_ip} to interface: {interface_data['name']}")
+                log.info("Assigning ip6 %s to interface: %s", interface_ip, interface_data['name'], extra=SAMPLED)
                 netbox_ip = netbox_instance.ipam.ip_addresses.get(address=interface_ip)
                 netbox_ip.update({'assigned_object_id': interface_data['id']})
 
@@ -38,4 +43,4 @@ class IPManager:
                 device.update({
                     'primary_ip6': netbox_instance.ipam.ip_addresses.get(address=ips['primary_ip6'])
                 })
-            print(f"Updated device {device.name} with primary IPs")
+            log.info("Updated device %s with primary IPs", device.name, extra=SAMPLED)
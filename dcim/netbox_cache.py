@@ -2,14 +2,27 @@ import os
 import json
 import time
 import pprint
+from collections.abc import Mapping
+from metrics.run_metrics import get_metrics
+from dcim.netbox_graphql import NetBoxGraphQL, GraphQLUnavailable, GRAPHQL_TYPES
+from dcim.shared_cache import SharedCacheSnapshot, SharedCacheIndex, build_lock, is_snapshot, write_snapshot
+from dcim.cache_records import RECORD_TYPES, to_record
+from dcim.cache_index import CacheIndex, related_id, related_type
+from metrics.run_log import get_logger
+
+log = get_logger(__name__)
 
 class NetBoxCache:
     def __init__(self, config, netbox):
         self.netbox = netbox
         self.DEBUG = config.get('debug')
         self.cache = {}
+        self.index = CacheIndex()
         self.cache_file_name = config.get('cache_file_name') or './netbox_cache.json'
         self.cache_time = config.get('cache_time') or 3600 # Default cache time of 1 hour
+        self.preload = (config.get('cache_preload') or 'rest').lower()  # 'graphql' reads only the compared fields
+        self.mode = (config.get('cache_mode') or 'file').lower()  # 'shared' maps a snapshot shared by processes on this host
+        self.snapshot_file_name = f"{self.cache_file_name}.mmap"
             
         # Object mapping: maps object_type to (API section, lookup key)
         self.object_mapping = {
@@ -23,7 +36,7 @@ class NetBoxCache:
             'sites': (self.netbox.dcim.sites, 'name'),
             'interfaces': (self.netbox.dcim.interfaces, lambda i: f"{i.device.name}_{i.name}"),
             'cables': (self.netbox.dcim.cables, lambda c: f"{c.a_terminations[0].id}_{c.b_terminations[0].id}"),
-            'vlans': (self.netbox.ipam.vlans, 'id'),
+            'vlans': (self.netbox.ipam.vlans, 'vid'),
             'fhrp_groups': (self.netbox.ipam.fhrp_groups, 'id'),
             'prefixes': (self.netbox.ipam.prefixes, 'prefix'),
             'ip_addresses': (self.netbox.ipam.ip_addresses, 'address'),
@@ -31,7 +44,7 @@ class NetBoxCache:
             'virtual_interfaces': (self.netbox.virtualization.interfaces, lambda i: f"{i.virtual_machine.name}_{i.name}"),
             'virtual_clusters': (self.netbox.virtualization.clusters, 'name'),
             'site_groups': (self.netbox.dcim.site_groups, 'name'),
-            'locations': (self.netbox.dcim.locations, 'name'),
+            'locations': (self.netbox.dcim.locations, lambda l: f"{l.site.name}_{l.name}"),
         }
 
         self.preload_objects()
@@ -44,46 +57,95 @@ class NetBoxCache:
 
     def preload_objects(self):
         """Preload objects either from file or from NetBox based on cache time."""
+        if self.mode == 'shared':
+            self.load_shared_cache()
+        else:
+            self.load_cache()
+
+    def load_cache(self):
+        """Load the cache from file, or from NetBox (saving it to file) once the file is too old."""
         if self.is_cache_valid():
-            if self.DEBUG:
-                print("Loading cache from file.")
-            self.load_cache_from_file()
+            log.debug("Loading cache from file.")
+            with get_metrics().phase('cache_load_file'):
+                self.load_cache_from_file()
             self.print_cache_summary()  # Print summary after loading from file
         else:
-            if self.DEBUG:
-                print("Cache file is too old or doesn't exist, loading from NetBox.")
-            self.load_cache_from_netbox()
-            self.save_cache_to_file()
+            log.debug("Cache file is too old or doesn't exist, loading from NetBox.")
+            with get_metrics().phase('cache_load_netbox'):
+                self.load_cache_from_netbox()
+                self.save_cache_to_file()
             self.print_cache_summary()  # Print summary after loading from NetBox
 
+    def load_shared_cache(self):
+        """
+        Map the host's cache snapshot, building it first if it is missing or out of date.
+
+        The first process to find the snapshot out of date loads the cache (from the cache
+        file or NetBox) and writes the snapshot while holding a lock, processes starting
+        meanwhile wait and then map what it wrote instead of loading their own copy.
+        """
+        if not self.is_snapshot_valid():
+            with build_lock(self.snapshot_file_name):
+                if not self.is_snapshot_valid():
+                    self.load_cache()
+                    with get_metrics().phase('cache_snapshot_write'):
+                        write_snapshot(self.snapshot_file_name, self.cache, self.index)
+                    log.debug(f"Cache snapshot written to {self.snapshot_file_name}.")
+        with get_metrics().phase('cache_load_shared'):
+            snapshot = SharedCacheSnapshot(self.snapshot_file_name)
+            self.cache = snapshot.views()
+            self.index = SharedCacheIndex(snapshot)
+        self.print_cache_summary()
+
+    def is_snapshot_valid(self):
+        """Check the snapshot is within the cache time and not older than the cache file it may have been built from."""
+        if not is_snapshot(self.snapshot_file_name):
+            return False
+        modified = os.path.getmtime(self.snapshot_file_name)
+        if os.path.exists(str(self.cache_file_name)) and os.path.getmtime(str(self.cache_file_name)) > modified:
+            return False  # Written by a later run (e.g. the sharded coordinator's merge)
+        return time.time() - modified < int(self.cache_time)
+
     def load_cache_from_netbox(self):
         """Load objects from NetBox API and store them in the cache."""
        
-        self.cache['id_lookup'] = {}  # Reverse lookup cache for ID-based lookups
+        graphql = NetBoxGraphQL(self.netbox) if self.preload == 'graphql' else None
 
         # First pass: Load objects into the cache without normalization or lookups
         for object_type, (api_section, lookup_key) in self.object_mapping.items():
             self.cache[object_type] = {}
-            for obj in api_section.all():
-                if callable(lookup_key):
-                    cache_key = lookup_key(obj)  # Use the lambda function to generate the key
-                else:
-                    cache_key = f"{getattr(obj, lookup_key)}"
-                obj = obj.serialize() if  hasattr(obj, 'serialize') else obj
+            objects = None
+            if graphql and object_type in GRAPHQL_TYPES:
+                try:
+                    objects = list(graphql.objects(object_type, api_section, lookup_key))
+                except GraphQLUnavailable as e:
+                    log.warning(f"GraphQL API unavailable, loading the cache through REST: {e}")
+                    graphql = None
+                except Exception as e:
+                    # A field this NetBox version does not have, or a type its GraphQL API lacks
+                    log.warning(f"GraphQL preload of {object_type} failed, loading it through REST: {e}")
+            if objects is None:
+                objects = self.load_objects_rest(api_section, lookup_key)
+
+            for cache_key, obj in objects:
                 # Add raw object to cache (without normalization)
                 self.cache[object_type][cache_key] = obj
-                
-                # Populate the reverse lookup cache by ID
-                if 'id' in obj:
-                    string_key = f"{object_type}_{obj['id']}"
-                    self.cache['id_lookup'][string_key] = obj
-                
 
         # Second pass: Now that the cache is fully populated, normalize the values
         for object_type in self.object_mapping.keys():
             for cache_key, obj in self.cache[object_type].items():
                 self.cache[object_type][cache_key] = self.normalize_object(obj, object_type)
+        self.build_index()
+
 
+    def load_objects_rest(self, api_section, lookup_key):
+        """Yield (cache key, serialized object) of every object of an API section."""
+        for obj in api_section.all():
+            if callable(lookup_key):
+                cache_key = lookup_key(obj)  # Use the lambda function to generate the key
+            else:
+                cache_key = f"{getattr(obj, lookup_key)}"
+            yield (cache_key, obj.serialize() if  hasattr(obj, 'serialize') else obj)
 
     def normalize_object(self, obj, object_type):
         """Normalize values within the object to ensure consistent comparisons."""
@@ -109,7 +171,7 @@ class NetBoxCache:
                 # Check if it's a name returned from NetBox and needs to be compared as a dictionary
                 normalized_obj[key] = {'name': value}
 
-        return normalized_obj
+        return to_record(object_type, normalized_obj)
 
     def is_cache_valid(self):
         """Check if the cache file exists and is still valid based on the configured cache time."""
@@ -123,19 +185,66 @@ class NetBoxCache:
         """Load cache from the JSON file."""
         with open(str(self.cache_file_name), 'r') as cache_file:
             self.cache = json.load(cache_file)
+        self.cache.pop('id_lookup', None)  # Written by older versions, replaced by the index
+        # Replace the dicts of RECORD_TYPES with records
+        for object_type in RECORD_TYPES:
+            for cache_key, obj in self.cache.get(object_type, {}).items():
+                self.cache[object_type][cache_key] = to_record(object_type, obj)
+        self.build_index()
+        # Older versions keyed locations by name alone, names are only unique per site
+        self.cache['locations'] = {f"{self.related_name('sites', location.get('site'))}_{location.get('name')}": location
+                                   for location in self.cache.get('locations', {}).values()}
+
+    def build_index(self):
+        """Index every cached object by id and the interfaces and cables by device and termination."""
+        self.index = CacheIndex()
+        for object_type, entries in self.cache.items():
+            if isinstance(entries, dict):
+                for obj in entries.values():
+                    self.index.add(object_type, obj)
+
+    def related_name(self, object_type, value):
+        """Name of the cached object a related object field (id or nested object) refers to."""
+        related = self.index.get(object_type, related_id(value))
+        return related.get('name') if related else None
+
+    def add(self, object_type, cache_key, obj):
+        """Cache an object created or changed by the sync under its key and in the index."""
+        obj = to_record(object_type, obj)
+        self.cache.setdefault(object_type, {})[cache_key] = obj
+        if obj is not None:
+            self.index.add(object_type, obj)
+        return obj
+
+    def update(self, object_type, cache_key, obj, data):
+        """
+        Apply new data to a cached object, keeping the index in step.
+
+        Fabric data names related objects ({'device': {'name': 'pod1-spine1'}}) where the
+        cache holds their id, a related object named the same keeps its cached id so the
+        index (interfaces by device id) still finds the object.
+        """
+        self.index.discard(object_type, obj)
+        obj.update({field: value for field, value in data.items() if not self.is_same_related(object_type, field, obj.get(field), value)})
+        return self.add(object_type, cache_key, obj)
+
+    def is_same_related(self, object_type, field, cached, value):
+        """Check a related object given by name is the one the cached id refers to."""
+        if related_id(cached) is None or not isinstance(value, Mapping) or 'id' in value or not isinstance(value.get('name'), str):
+            return False
+        name = self.related_name(related_type(object_type, field), cached)
+        return isinstance(name, str) and name.strip().lower() == value['name'].strip().lower()
 
     def save_cache_to_file(self):
         """Save the current cache to a JSON file."""
         with open(str(self.cache_file_name), 'w') as cache_file:
-            json.dump(self.cache, cache_file)
-        if self.DEBUG:
-            print(f"Cache saved to {str(self.cache_file_name)}.")
+            json.dump(self.cache, cache_file, default=lambda value: value.serialize())
+        log.debug(f"Cache saved to {str(self.cache_file_name)}.")
 
     def print_cache_summary(self):
         """Print the summary of the preloaded objects."""
         for object_type in self.object_mapping.keys():
-            if self.DEBUG:
-                print(f"Preloaded {object_type} with {len(self.cache.get(object_type, {}))} entries.")
+            log.debug(f"Preloaded {object_type} with {len(self.cache.get(object_type, {}))} entries.")
 
     def get_cache(self):
         """Return the preloaded cache."""
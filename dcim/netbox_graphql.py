@@ -0,0 +1,168 @@
+import re
+from metrics.run_log import get_logger
+
+log = get_logger(__name__)
+
+GRAPHQL_PAGE_SIZE = 5000  # Objects per GraphQL query, REST pages hold 50 (up to 1000)
+
+# Object types a cable or IP address can point to, selected with inline fragments
+TERMINATION_TYPES = ['InterfaceType', 'FrontPortType', 'RearPortType', 'ConsolePortType', 'ConsoleServerPortType',
+                     'PowerPortType', 'PowerOutletType', 'PowerFeedType', 'CircuitTerminationType']
+ASSIGNED_OBJECT_TYPES = {'InterfaceType': 'dcim.interface', 'VMInterfaceType': 'virtualization.vminterface', 'FHRPGroupType': 'ipam.fhrpgroup'}
+
+# object_mapping type -> the GraphQL list to query and the fields the sync compares, by kind:
+#   fields: scalars, relations: related objects (cached as their id like the REST serializer does,
+#   'device { id name }' also fetches what the cache key needs), lists: lists of related objects,
+#   choices: choice fields, terminations: generic object lists of cables
+GRAPHQL_TYPES = {
+    'virtual_chassis': {'query': 'virtual_chassis_list', 'fields': ['name', 'domain'], 'relations': ['master']},
+    'racks': {'query': 'rack_list', 'fields': ['name'], 'relations': ['site', 'location'], 'choices': ['status']},
+    'devices': {'query': 'device_list', 'fields': ['name', 'serial', 'vc_position', 'vc_priority', 'description'],
+                'relations': ['device_type', 'role', 'platform', 'site', 'location', 'rack', 'virtual_chassis', 'primary_ip4', 'primary_ip6'],
+                'choices': ['status']},
+    'device_roles': {'query': 'device_role_list', 'fields': ['name', 'slug', 'color']},
+    'device_types': {'query': 'device_type_list', 'fields': ['model', 'slug', 'part_number'], 'relations': ['manufacturer']},
+    'manufacturers': {'query': 'manufacturer_list', 'fields': ['name', 'slug']},
+    'platforms': {'query': 'platform_list', 'fields': ['name', 'slug'], 'relations': ['manufacturer']},
+    'sites': {'query': 'site_list', 'fields': ['name', 'slug', 'description'], 'relations': ['group', 'region'], 'choices': ['status']},
+    'interfaces': {'query': 'interface_list', 'fields': ['name', 'enabled', 'mtu', 'mac_address', 'description', 'mgmt_only', 'speed'],
+                   'relations': ['device { id name }', 'lag', 'untagged_vlan'], 'lists': ['tagged_vlans'], 'choices': ['type', 'mode', 'duplex'],
+                   'key': lambda obj: f"{obj['device']['name']}_{obj['name']}"},
+    'cables': {'query': 'cable_list', 'fields': ['label'], 'choices': ['status', 'type'], 'terminations': ['a_terminations', 'b_terminations'],
+               'key': lambda obj: f"{obj['a_terminations'][0]['id']}_{obj['b_terminations'][0]['id']}"},
+    'vlans': {'query': 'vlan_list', 'fields': ['vid', 'name', 'description'], 'relations': ['site', 'group'], 'choices': ['status']},
+    'fhrp_groups': {'query': 'fhrp_group_list', 'fields': ['group_id', 'name', 'description'], 'choices': ['protocol']},
+    'prefixes': {'query': 'prefix_list', 'fields': ['prefix', 'description', 'is_pool'], 'relations': ['vlan', 'vrf'], 'choices': ['status']},
+    'ip_addresses': {'query': 'ip_address_list', 'fields': ['address', 'dns_name', 'description'], 'relations': ['vrf'],
+                     'choices': ['status', 'role'], 'assigned_object': True},
+    'virtual_machines': {'query': 'virtual_machine_list', 'fields': ['name', 'vcpus', 'memory', 'disk', 'description'],
+                         'relations': ['cluster', 'site', 'role', 'platform', 'primary_ip4', 'primary_ip6'], 'choices': ['status']},
+    'virtual_interfaces': {'query': 'vm_interface_list', 'fields': ['name', 'enabled', 'mtu', 'mac_address', 'description'],
+                           'relations': ['virtual_machine { id name }', 'parent', 'untagged_vlan'], 'choices': ['mode'],
+                           'key': lambda obj: f"{obj['virtual_machine']['name']}_{obj['name']}"},
+    'virtual_clusters': {'query': 'cluster_list', 'fields': ['name', 'description'], 'relations': ['type', 'group'], 'choices': ['status']},
+    'site_groups': {'query': 'site_group_list', 'fields': ['name', 'slug', 'description'], 'relations': ['parent']},
+    'locations': {'query': 'location_list', 'fields': ['name', 'slug', 'description'], 'relations': ['site { id name }', 'parent'], 'choices': ['status'],
+                  'key': lambda obj: f"{obj['site']['name']}_{obj['name']}"},
+}
+
+
+class GraphQLError(Exception):
+    pass
+
+
+class GraphQLUnavailable(GraphQLError):
+    """The GraphQL API itself failed (disabled, older NetBox, no permission), not one query."""
+    pass
+
+
+class NetBoxGraphQL:
+    """
+    Reads whole NetBox tables through the GraphQL API for the cache preload.
+
+    The REST API returns every field of an object with its related objects fully
+    nested, 50 to 1000 objects per request. GraphQL only returns the fields in
+    GRAPHQL_TYPES, in pages of GRAPHQL_PAGE_SIZE objects. Objects are returned in
+    the shape of pynetbox's serialize(): related objects as ids, choices as values.
+    """
+
+    def __init__(self, netbox):
+        self.netbox = netbox
+        self.url = re.sub(r'/api/?$', '', netbox.base_url) + '/graphql/'
+
+    def objects(self, object_type, api_section, lookup_key):
+        """Yield (cache key, object) of every object of a type, raises GraphQLError if NetBox rejects the query."""
+        spec = GRAPHQL_TYPES[object_type]
+        choices = None
+        offset = 0
+        while True:
+            page = self.query(f"query {{ {spec['query']}(pagination: {{offset: {offset}, limit: {GRAPHQL_PAGE_SIZE}}}) {{ {selection(spec)} }} }}")
+            results = page[spec['query']]
+            if results and choices is None:
+                choices = self.choice_values(object_type, api_section, spec.get('choices', []))
+            for raw in results:
+                obj = flatten(raw, spec, choices)
+                cache_key = spec['key'](raw) if 'key' in spec else f"{obj.get(lookup_key)}"
+                yield (cache_key, obj)
+            if len(results) < GRAPHQL_PAGE_SIZE:
+                return
+            offset += GRAPHQL_PAGE_SIZE
+
+    def query(self, query):
+        response = self.netbox.http_session.post(self.url, json={'query': query},
+                                                 headers={'Authorization': f"Token {self.netbox.token}", 'Accept': 'application/json'})
+        if response.status_code != 200:
+            raise GraphQLUnavailable(f"HTTP {response.status_code} from {self.url}")
+        result = response.json()
+        if result.get('errors'):
+            raise GraphQLError('; '.join(error.get('message', str(error)) for error in result['errors']))
+        return result['data']
+
+    def choice_values(self, object_type, api_section, fields):
+        """
+        Return {field: {enum name: value}} of a type's choice fields.
+
+        GraphQL returns choices as enum names, which can't hold the '-' and '.' of values
+        like '2.5gbase-t'. The real values come from the REST endpoint's OPTIONS, one
+        request per type. Without them the value is guessed from the name.
+        """
+        if not fields:
+            return {}
+        try:
+            options = api_section.choices()
+        except Exception as e:
+            log.warning(f"Could not read {object_type} choices, guessing them from GraphQL names: {e}")
+            options = {}
+        return {field: {enum_name(choice['value']): choice['value'] for choice in options.get(field, [])} for field in fields}
+
+
+def selection(spec):
+    """GraphQL selection set of a type."""
+    fields = ['id'] + spec.get('fields', []) + spec.get('choices', [])
+    fields += [relation if '{' in relation else f"{relation} {{ id }}" for relation in spec.get('relations', []) + spec.get('lists', [])]
+    fragments = ' '.join(f"... on {name} {{ id }}" for name in TERMINATION_TYPES)
+    fields += [f"{field} {{ __typename {fragments} }}" for field in spec.get('terminations', [])]
+    if spec.get('assigned_object'):
+        fields.append(f"assigned_object {{ __typename {' '.join(f'... on {name} {{ id }}' for name in ASSIGNED_OBJECT_TYPES)} }}")
+    return ' '.join(fields)
+
+
+def flatten(raw, spec, choices):
+    """Convert a GraphQL object to the cached (REST serialized) form."""
+    obj = {'id': int(raw['id'])}
+    for field in spec.get('fields', []):
+        obj[field] = raw.get(field)
+    for relation in spec.get('relations', []):
+        field = relation.split()[0]
+        obj[field] = int(raw[field]['id']) if raw.get(field) else None
+    for field in spec.get('lists', []):
+        obj[field] = [int(item['id']) for item in raw.get(field) or []]
+    for field in spec.get('choices', []):
+        obj[field] = choice_value(field, raw.get(field), choices.get(field, {}))
+    for field in spec.get('terminations', []):
+        obj[field] = [int(item['id']) for item in raw.get(field) or [] if 'id' in item]
+    if spec.get('assigned_object'):
+        assigned = raw.get('assigned_object') or {}
+        obj['assigned_object_type'] = ASSIGNED_OBJECT_TYPES.get(assigned.get('__typename'))
+        obj['assigned_object_id'] = int(assigned['id']) if 'id' in assigned else None
+    return obj
+
+
+def enum_name(value):
+    """Reduce a choice value or GraphQL enum name to the characters both keep."""
+    return re.sub(r'[^a-z0-9]', '_', str(value).lower())
+
+
+def choice_value(field, name, values):
+    """Map a GraphQL enum name (e.g. TYPE_2_5GBASE_T or STATUS_ACTIVE) back to the NetBox choice value."""
+    if name is None:
+        return None
+    reduced = enum_name(name)
+    prefix = f"{field}_"
+    for candidate in (reduced, reduced[len(prefix):] if reduced.startswith(prefix) else None):
+        if candidate in values:
+            return values[candidate]
+    if re.search(r'[-.]', str(name)):
+        return name  # Already a value
+    # Best guess, most values separate words with '-'
+    return (reduced[len(prefix):] if reduced.startswith(prefix) else reduced).replace('_', '-')
@@ -1,15 +1,48 @@
 import pynetbox
 import pprint
 import re
+import threading
 
 from dcim.ip_manager import IPManager 
 from dcim.netbox_cache import NetBoxCache
+from metrics.run_metrics import get_metrics
+from metrics.run_log import get_logger, SAMPLED
+from dcim.cache_index import related_type
+
+log = get_logger(__name__)
+
+class SharedNetBox:
+    """
+    NetBox API client and NetBoxCache loaded once and shared by the NetBoxManagers of
+    several fabrics synced concurrently. Writes are serialized by a single lock so an
+    object shared between fabrics (site, manufacturer, device type) is created once.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.lock = threading.RLock()
+        self.nb = None
+        self.nb_cacher = None
+
+    def load(self):
+        """Connect to NetBox and load the cache on first use."""
+        with self.lock:
+            if self.nb is None:
+                self.nb = pynetbox.api(url=self.config.get('netbox_url'), token=self.config.get('netbox_token'))
+                # Count and time every NetBox request, including cache loading and pagination
+                self.nb.http_session.hooks['response'].append(get_metrics().observe_netbox_response)
+                self.nb_cacher = NetBoxCache(self.config, self.nb)
+        return self
+
 
 class NetBoxManager:
     
-    def __init__(self, config, ip_manager):
+    def __init__(self, config, ip_manager, shared=None):
         self.config = config
-        self.nb = pynetbox.api(url=self.config.get('netbox_url'), token=self.config.get('netbox_token'))
+        # Fabrics synced in the same process share one NetBox client, cache and write lock
+        shared = (shared or SharedNetBox(self.config)).load()
+        self.nb = shared.nb
+        self.write_lock = shared.lock
         self.ip_manager = ip_manager
         self.host = self.config.get('fabric_url')
         self.username = self.config.get('fabric_user')
@@ -21,7 +54,7 @@ class NetBoxManager:
         self.DEBUG = self.config.get('debug')
         self.client = None
         # Initialize the NetBoxCache inside NetBoxManager
-        self.nb_cacher = NetBoxCache(self.config, self.nb)
+        self.nb_cacher = shared.nb_cacher
         self.netbox_cache = self.nb_cacher.cache
         # Object mapping: maps object_type to (API section, lookup key)
         self.object_mapping = {
@@ -35,13 +68,15 @@ class NetBoxManager:
             'sites': (self.nb.dcim.sites, 'name'),
             'interfaces': (self.nb.dcim.interfaces, lambda i: f"{i.device.name}_{i.name}"),
             'cables': (self.nb.dcim.cables, lambda c: f"{c.a_terminations[0].id}_{c.b_terminations[0].id}"),
-            'vlans': (self.nb.ipam.vlans, 'id'),
+            'vlans': (self.nb.ipam.vlans, 'vid'),
             'fhrp_groups': (self.nb.ipam.fhrp_groups, 'id'),
             'prefixes': (self.nb.ipam.prefixes, 'prefix'),
             'ip_addresses': (self.nb.ipam.ip_addresses, 'address'),
             'virtual_machines': (self.nb.virtualization.virtual_machines, 'name'),
             'virtual_interfaces': (self.nb.virtualization.interfaces, lambda i: f"{i.virtual_machine.name}_{i.name}"),
             'virtual_clusters': (self.nb.virtualization.clusters, 'name'),
+            'site_groups': (self.nb.dcim.site_groups, 'name'),
+            'locations': (self.nb.dcim.locations, 'name'),
         }        
     def interface_netbox_type(self, interface_name, speed=None, interface_type=None):
         """
@@ -130,17 +165,23 @@ class NetBoxManager:
             The existing, modified, or newly created object.
         """
 
+        # Lookup and create happen under the write lock, concurrent fabrics never create the same object twice
+        with self.write_lock:
+            return self.create_or_update_locked(object_type, lookup_field, lookup_value, data)
+
+    def cache_key(self, object_type, lookup_field, data):
+        """Return the key the object described by data is cached under."""
         # Generate the cache lookup key for interfaces and VM interfaces
         if object_type == 'interfaces':
             # Check if 'device' in the data is a dictionary (new_data) or an ID (existing_object)
             if isinstance(data['device'], dict) and 'name' in data['device']:
                 device_name = data['device'].get('name')
             else:
-                # Use reverse lookup to convert ID to name
-                device_id = data['device']
-                device_name = self.netbox_cache['id_lookup'].get('devices_'+str(device_id))
+                # Use the index to convert ID to name
+                device = self.nb_cacher.index.get('devices', data['device'])
+                device_name = device.get('name') if device else None
             
-            cache_key = f"{device_name}_{data[lookup_field]}"  # Device Name + Interface Name
+            return f"{device_name}_{data[lookup_field]}"  # Device Name + Interface Name
 
         elif object_type == 'virtual_interfaces':
             # Same logic for VM interfaces
@@ -148,42 +189,107 @@ class NetBoxManager:
                 vm_name = data['virtual_machine'].get('name')
             else:
                 vm_id = data['virtual_machine']
-                vm_name = self.cache['id_lookup'].get(vm_id, {}).get('name', f"UnknownVM-{vm_id}")
+                virtual_machine = self.nb_cacher.index.get('virtual_machines', vm_id)
+                vm_name = virtual_machine.get('name') if virtual_machine else f"UnknownVM-{vm_id}"
             
-            cache_key = f"{vm_name}_{data[lookup_field]}"  # VM Name + Interface Name
-        else:
-            # Default cache key for other object types
-            cache_key = f"{data[lookup_field]}"
+            return f"{vm_name}_{data[lookup_field]}"  # VM Name + Interface Name
+
+        elif object_type == 'locations':
+            # Location names are unique per site only
+            if isinstance(data['site'], dict) and 'name' in data['site']:
+                site_name = data['site'].get('name')
+            else:
+                site = self.nb_cacher.index.get('sites', data['site'])
+                site_name = site.get('name') if site else None
+
+            return self.location_cache_key(site_name, data[lookup_field])  # Site Name + Location Name
+
+        # Default cache key for other object types
+        return f"{data[lookup_field]}"
+
+    def location_cache_key(self, site_name, location_name):
+        return f"{site_name}_{location_name}"
+
+    def create_or_update_locked(self, object_type, lookup_field, lookup_value, data):
+        """create_or_update() for callers already holding the write lock."""
+        cache_key = self.cache_key(object_type, lookup_field, data)
 
         # Check if the object exists in the cache
+        metrics = get_metrics()
+        metrics.cache_lookup(object_type, cache_key in self.netbox_cache[object_type])
         if cache_key in self.netbox_cache[object_type]:
-            print(f"Using cached {object_type}: {lookup_value} {cache_key}") if self.DEBUG == 1 else None
+            log.debug("Using cached %s: %s %s", object_type, lookup_value, cache_key)
             existing_object = self.netbox_cache[object_type][cache_key]
             # Compare and update if necessary
-            no_change = not existing_object or self.compare_objects(existing_object, data)
+            no_change = not existing_object or self.compare_objects(existing_object, data, object_type)
+            metrics.object_outcome(object_type, 'unchanged' if no_change else 'updated')
             if not no_change:  
-                print(f"Updating {object_type}: {lookup_value}") #if self.DEBUG == 1 else None
-                existing_object.update(data)  
-                # Update cache with new data
-                self.netbox_cache[object_type][cache_key] = existing_object  
-                string_key = f"{object_type}_{existing_object['id']}"
-                self.netbox_cache['id_lookup'][string_key] = existing_object
+                log.info("Updating %s: %s", object_type, lookup_value, extra=SAMPLED)
+                # Update cache and index with new data
+                existing_object = self.nb_cacher.update(object_type, cache_key, existing_object, data)
             
             return existing_object
        
         else:
        
             # If not found in cache, create the object
-            print(f"Creating new {object_type}: {lookup_value}") #if self.DEBUG == 1 else None
+            log.info("Creating new %s: %s", object_type, lookup_value, extra=SAMPLED)
             new_object = self.create_object(object_type, data)
-            #update forward and reverse cache for new object
-            self.netbox_cache[object_type][cache_key] = new_object
-            string_key = f"{object_type}_{new_object['id']}"
-            self.netbox_cache['id_lookup'][string_key] = new_object
+            metrics.object_outcome(object_type, 'created' if new_object else 'failed')
+            # Cache and index the new object, failed creates are tried again next time
+            if new_object:
+                new_object = self.nb_cacher.add(object_type, cache_key, new_object)
        
             return new_object
 
 
+    def bulk_create_or_update(self, object_type, lookup_field, items):
+        """
+        create_or_update() many objects of one type, creating the missing ones with a single request.
+
+        Objects already cached are compared and updated one by one as create_or_update()
+        does, only objects NetBox lacks are sent together. Items with the same cache key
+        are written once.
+
+        Returns:
+            dict: Cache key -> the existing, modified or new object (None if it could not be created).
+        """
+        results = {}
+        missing = {}
+        metrics = get_metrics()
+        with self.write_lock:
+            for data in items:
+                cache_key = self.cache_key(object_type, lookup_field, data)
+                if cache_key in results or cache_key in missing:
+                    continue
+                if cache_key in self.netbox_cache[object_type]:
+                    results[cache_key] = self.create_or_update_locked(object_type, lookup_field, data[lookup_field], data)
+                else:
+                    metrics.cache_lookup(object_type, False)
+                    missing[cache_key] = data
+
+            if missing:
+                log.info(f"Creating {len(missing)} new {object_type}")
+                for (cache_key, data), new_object in zip(missing.items(), self.create_objects(object_type, list(missing.values()))):
+                    log.info("Created new %s: %s", object_type, data[lookup_field], extra=SAMPLED)
+                    metrics.object_outcome(object_type, 'created' if new_object else 'failed')
+                    # Cache and index the new object, failed creates are tried again next time
+                    results[cache_key] = self.nb_cacher.add(object_type, cache_key, new_object) if new_object else None
+        return results
+
+    def create_objects(self, object_type, items):
+        """Create objects in NetBox with one bulk request, one by one if NetBox rejects the batch."""
+
+        api_section, _ = self.object_mapping[object_type]
+
+        try:
+            # NetBox answers a bulk create with the complete objects, in the order they were sent
+            return [self.nb_cacher.normalize_object(new_object, object_type) for new_object in api_section.create(items)]
+
+        except Exception as e:
+            log.warning(f"Bulk create of {len(items)} {object_type} failed, creating them one at a time: {e}")
+            return [self.create_object(object_type, data) for data in items]
+
     def create_object(self, object_type, data):
         """Helper method to create a new object in NetBox."""
         
@@ -193,15 +299,16 @@ class NetBoxManager:
             # Call the API to create the object and get it imemdiately to get a complete object
             response = api_section.create(data)
             new_object = api_section.get(response.id)
-            return new_object
+            # Cache it like the objects preloaded from NetBox, callers expect a dict
+            return self.nb_cacher.normalize_object(new_object, object_type)
         
         except Exception as e:
-            print(f"Error creating {object_type}: {e}")
+            log.error(f"Error creating {object_type}: {e}")
             return None
 
 
-    def compare_objects(self, existing_object, new_data):
-        """Compare existing object with new data. Returns True if they match, False otherwise."""
+    def compare_objects(self, existing_object, new_data, object_type=None):
+        """Compare existing object (of object_type) with new data. Returns True if they match, False otherwise."""
         for key, value in new_data.items():
             # Try both attribute and dictionary access
             if key in existing_object: 
@@ -209,16 +316,16 @@ class NetBoxManager:
             else:
                existing_value = None
 
-            print(f'COMPARING {key}: {existing_value} :: {value}') if self.DEBUG == 1 else None 
+            log.debug('COMPARING %s: %s :: %s', key, existing_value, value)
 
             # Handle fields that contain IDs in the existing object but names in the new data
             if isinstance(existing_value, int) and isinstance(value, dict) and value.get('name'):
-                # Perform a reverse lookup to get the name from the ID
-                reverse_key = f"{key}s_{existing_value}"
-                print(f'looking up id for: {reverse_key}') if self.DEBUG == 1 else None 
-                if reverse_key in self.netbox_cache['id_lookup']:
-                    existing_value = {'name': self.netbox_cache['id_lookup'][reverse_key]['name']}
-                    print(f'after lookup {key}: {existing_value} :: {value}') if self.DEBUG == 1 else None 
+                # Look up the related object by ID to compare its name
+                related = self.nb_cacher.index.get(related_type(object_type, key), existing_value)
+                log.debug('looking up id for: %s %s', key, existing_value)
+                if related is not None:
+                    (existing_value, value) = (related.get('name'), value['name'])
+                    log.debug('after lookup %s: %s :: %s', key, existing_value, value)
 
             # Normalize strings for comparison
             if isinstance(existing_value, str) and isinstance(value, str):
@@ -226,10 +333,10 @@ class NetBoxManager:
                 value = value.strip().lower()
 
             if existing_value != value:
-                print('CONCLUSION: Cache and Fabric do NOT Match') if self.DEBUG == 1 else None    
+                log.debug('CONCLUSION: Cache and Fabric do NOT Match')
                 return False
             
-        print('CONCLUSION: Cache and Fabric Match') if self.DEBUG == 1 else None   
+        log.debug('CONCLUSION: Cache and Fabric Match')
         return True
 
     def create_virtual_chassis(self, vc_data):
@@ -257,8 +364,14 @@ class NetBoxManager:
         # Remove IPs from device data (they can't be set yet)
         device_data.pop('primary_ip4', None)
         device_data.pop('primary_ip6', None)
-        
-        # Check or create dependencies first: device_role, device_type, platform, and site
+
+        self.resolve_device_dependencies(device_data)
+
+        # Now create the device itself
+        return self.create_or_update('devices', 'name', device_data['name'], device_data)
+
+    def resolve_device_dependencies(self, device_data):
+        """Create or look up the device_role, device_type, platform and site of a device, replacing them with their ids."""
         if 'role' in device_data:
             role_name = device_data['role']['name']
             device_data['role'] = self.create_or_update(
@@ -271,10 +384,11 @@ class NetBoxManager:
             manufacturer_obj = self.create_or_update(
                 'manufacturers', 'name', manufacturer, {'name': manufacturer, 'slug': self.generate_slug(manufacturer)}
             )
-            slug=self.generate_slug(manufacturer)+'-'+self.generate_slug(device_data['device_type']['part_number'] if device_data['device_type']['part_number'] else type_model)
+            part_number = device_data['device_type'].get('part_number')
+            slug=self.generate_slug(manufacturer)+'-'+self.generate_slug(part_number if part_number else type_model)
             #print(f"'device_types', 'model', {type_model}, 'model': {type_model}, 'slug': {slug}, 'part_number': {device_data['device_type']['part_number'] if device_data['device_type']['part_number'] else None}, 'manufacturer': {manufacturer_obj.get('id')}")
             device_data['device_type'] = self.create_or_update(
-                'device_types', 'model', type_model, {'model': type_model, 'slug': slug, 'part_number': device_data["device_type"]["part_number"] if device_data["device_type"]["part_number"] else None, 'manufacturer': manufacturer_obj.get('id')}
+                'device_types', 'model', type_model, {'model': type_model, 'slug': slug, 'part_number': part_number if part_number else None, 'manufacturer': manufacturer_obj.get('id')}
             ).get('id')
             
 
@@ -284,15 +398,13 @@ class NetBoxManager:
                 'platforms', 'name', platform_name, {'name': platform_name, 'slug': self.generate_slug(platform_name)}
             ).get('id')
 
-        if 'site' in device_data:
+        # Sites already resolved to their id (by FabricSync.prepare_device()) are used as they are
+        if isinstance(device_data.get('site'), dict):
             site_name = device_data['site']['name']
             device_data['site'] = self.create_or_update(
                 'sites', 'name', site_name, {'name': site_name, 'slug': self.generate_slug(site_name)}
             ).get('id')
 
-        # Now create the device itself
-        return self.create_or_update('devices', 'name', device_data['name'], device_data)
-
     def create_interface(self, interface_data):
         """Create or update an Interface in NetBox with dependency checks."""
 
@@ -325,7 +437,7 @@ class NetBoxManager:
         """Create or update a LAG in NetBox with dependency checks."""
         members=lag_data['members']
         lag_data.pop('members', None)        
-        print(f"Creating/Updating LAG {lag_data['name']}") if self.DEBUG == 1 else None
+        log.debug("Creating/Updating LAG %s", lag_data['name'])
         
         lag_data=self.create_or_update('interfaces', 'name', lag_data['name'], lag_data)
 
@@ -334,59 +446,49 @@ class NetBoxManager:
             member_data['lag']={'name': lag_data['name'], 'device': { 'name' : lag_data['device']['name'] } }
             member_data['device']={ 'name' : lag_data['device']['name'] }
             member_data['name']=member['name']
-            print(f"Adding {member['name']} to {lag_data['name']}") if self.DEBUG == 1 else None
+            log.debug("Adding %s to %s", member['name'], lag_data['name'])
             self.create_or_update('interfaces', 'name', member_data['name'], member_data)
         
         
-    def create_connection(self, connection_data):
-        """Create or update a connection (cable) in NetBox with device and interface checks, using cache."""
-
-        # Step 1: Check the cache for the source and destination devices
-        src_device_cache_key = f"{connection_data['src-device']}"
-        dst_device_cache_key = f"{connection_data['dst-device']}"
-
-        src_device = self.netbox_cache['devices'].get(src_device_cache_key)
-        dst_device = self.netbox_cache['devices'].get(dst_device_cache_key)
-
-        if not src_device :
-            src_device_data = {
-                'name': connection_data['src-device'],
+    def get_or_create_device(self, device_name):
+        """Return the cached device, creating a placeholder with the default role, type and site if it is missing."""
+        device = self.netbox_cache['devices'].get(f"{device_name}")
+        if not device:
+            device_data = {
+                'name': device_name,
                 'status': 'active',
                 'role': {'name': self.default_device_role}, 
                 'device_type': {'model': self.default_device_model, 'manufacturer': {'name': self.default_device_manufacturer}}, 
                 'site': {'name': self.default_site} 
             }
-            print(f"Src Device {connection_data['src-device']} missing. Creating")
-            src_device = self.create_or_update('devices', 'name', connection_data['src-device'], src_device_data)
-            self.netbox_cache['devices'][src_device_cache_key] = src_device
-            self.netbox_cache['id_lookup']['devices_'+src_device.get('id')] = src_device
-
-        if not dst_device:
-            dst_device_data = {
-                'name': connection_data['dst-device'],
-                'status': 'active',
-                'role': {'name': self.default_device_role}, 
-                'device_type': {'model': self.default_device_model, 'manufacturer': {'name': self.default_device_manufacturer}}, 
-                'site': {'name': self.default_site} 
-            }
-            print(f"Dst Device {connection_data['dst-device']} missing. Creating")
-            dst_device = self.create_or_update('devices', 'name', connection_data['dst-device'], dst_device_data)
-            self.netbox_cache['devices'][dst_device_cache_key] = dst_device
-            self.netbox_cache['id_lookup']['devices_'+dst_device.get('id')] = dst_device
+            log.info("Device %s missing. Creating", device_name, extra=SAMPLED)
+            device = self.create_or_update('devices', 'name', device_name, device_data)
+        return device
+
+    def create_connection(self, connection_data):
+        """Create or update a connection (cable) in NetBox with device and interface checks, using cache."""
+
+        # The cable checks and create happen under the write lock, fabrics sharing a device never cable it twice
+        with self.write_lock:
+            return self.create_connection_locked(connection_data)
+
+    def create_connection_locked(self, connection_data):
+        """create_connection() for callers already holding the write lock."""
+
+        # Step 1: Check the cache for the source and destination devices, devices outside the fabric get a placeholder
+        src_device = self.get_or_create_device(connection_data['src-device'])
+        dst_device = self.get_or_create_device(connection_data['dst-device'])
 
         if not src_device or not dst_device:
-            print(f"Failed to create or find devices: {connection_data['src-device']} or {connection_data['dst-device']}")
+            log.error(f"Failed to create or find devices: {connection_data['src-device']} or {connection_data['dst-device']}")
             return None
 
-        # Step 2: Check the cache for the source and destination interfaces
-        src_interface_cache_key = f"{connection_data['src-device']}_{connection_data['src-interface']}"
-        dst_interface_cache_key = f"{connection_data['dst-device']}_{connection_data['dst-interface']}"
-
-        src_interface = self.netbox_cache['interfaces'].get(src_interface_cache_key)
-        dst_interface = self.netbox_cache['interfaces'].get(dst_interface_cache_key)
+        # Step 2: Check the index for the source and destination interfaces
+        src_interface = self.nb_cacher.index.interface(src_device['id'], connection_data['src-interface'])
+        dst_interface = self.nb_cacher.index.interface(dst_device['id'], connection_data['dst-interface'])
 
         if not src_interface:
-            print(f"Creating new source interface for cable to attach to {src_device['name']} {connection_data['src-interface']}")
+            log.info("Creating new source interface for cable to attach to %s %s", src_device['name'], connection_data['src-interface'], extra=SAMPLED)
             src_interface_data = {
                 'name': connection_data['src-interface'],
                 'device': src_device['id'],
@@ -394,10 +496,9 @@ class NetBoxManager:
                 'type': dst_interface.get('type')
             }
             src_interface = self.create_or_update('interfaces', 'name', connection_data['src-interface'], src_interface_data)
-            self.netbox_cache['interfaces'][src_interface_cache_key] = src_interface
 
         if not dst_interface:
-            print(f"Creating new destination interface for cable to attach to {dst_device['name']} {connection_data['dst-interface']}")
+            log.info("Creating new destination interface for cable to attach to %s %s", dst_device['name'], connection_data['dst-interface'], extra=SAMPLED)
             dst_interface_data = {
                 'name': connection_data['dst-interface'],
                 'device': dst_device['id'],
@@ -405,20 +506,20 @@ class NetBoxManager:
                 'type': src_interface.get('type')
             }
             dst_interface = self.create_or_update('interfaces', 'name', connection_data['dst-interface'], dst_interface_data)
-            self.netbox_cache['interfaces'][dst_interface_cache_key] = dst_interface
 
         if not src_interface or not dst_interface:
-            print(f"Failed to create or find interfaces: {connection_data['src-interface']} or {connection_data['dst-interface']}")
+            log.error(f"Failed to create or find interfaces: {connection_data['src-interface']} or {connection_data['dst-interface']}")
             return None
 
-        # Step 3: Check the cache for the cable between these interfaces using the object_type_id format
-        cable_cache_key = f"{src_interface['id']}_{dst_interface['id']}"
-        reverse_cable_cache_key = f"{dst_interface['id']}_{src_interface['id']}"
-
-        # Check if the cable exists in either direction in the cache
-        existing_cable = self.netbox_cache['cables'].get(cable_cache_key) or self.netbox_cache['cables'].get(reverse_cable_cache_key)
-        if existing_cable:
-            print(f"Existing cable found between {connection_data['src-device']} and {connection_data['dst-device']}.")
+        # Step 3: Check the index for a cable on either interface
+        src_cable = self.nb_cacher.index.cable(src_interface['id'])
+        dst_cable = self.nb_cacher.index.cable(dst_interface['id'])
+        if src_cable and dst_cable and src_cable.get('id') == dst_cable.get('id'):
+            log.info("Existing cable found between %s and %s.", connection_data['src-device'], connection_data['dst-device'], extra=SAMPLED)
+            return None
+        if src_cable or dst_cable:
+            log.warning(f"Cable between {connection_data['src-device']} {connection_data['src-interface']} and {connection_data['dst-device']} "
+                        f"{connection_data['dst-interface']} not created, cable {(src_cable or dst_cable).get('id')} is attached to one of them")
             return None
         # Step 4: Create the cable (connection) in NetBox
         new_cable = self.nb.dcim.cables.create(
@@ -434,8 +535,8 @@ class NetBoxManager:
               "object_id": dst_interface['id']
               }
              ],
-          )        # Add the new cable to the cache in both directions
-        self.netbox_cache[cable_cache_key] = new_cable
-        self.netbox_cache[reverse_cable_cache_key] = new_cable
+          )
+        # Cache the new cable under the key the cache loader uses, the index finds it from either end
+        self.nb_cacher.add('cables', f"{src_interface['id']}_{dst_interface['id']}", self.nb_cacher.normalize_object(new_cable, 'cables'))
 
         return new_cable
@@ -0,0 +1,248 @@
+import os
+import copy
+import json
+import mmap
+import fcntl
+import struct
+import hashlib
+import contextlib
+from collections.abc import MutableMapping
+from dcim.cache_index import CacheIndex, related_id, termination_ids
+
+# Layout of a snapshot file, all integers little endian:
+#   MAGIC, directory offset (Q)
+#   records: length (I) + UTF-8 bytes, a cache key or the compact JSON of an object
+#   per object type a hash table of 2^n ENTRY slots (key hash, key offset, object offset), key offset 0 is empty
+#   directory: JSON {object_type: [table offset, slots, entries]}
+MAGIC = b'F2DCSHM2'
+HEADER = struct.Struct('<8sQ')
+LENGTH = struct.Struct('<I')
+ENTRY = struct.Struct('<QQQ')
+
+
+def key_hash(encoded_key):
+    """Stable 64 bit hash of a cache key, the same in every process."""
+    return int.from_bytes(hashlib.blake2b(encoded_key, digest_size=8).digest(), 'little')
+
+
+def is_snapshot(file_name):
+    """Check a file is a snapshot in the format this version writes."""
+    try:
+        with open(file_name, 'rb') as snapshot_file:
+            return snapshot_file.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+@contextlib.contextmanager
+def build_lock(file_name):
+    """Hold an exclusive lock while a process builds the snapshot, other processes wait for it."""
+    with open(f"{file_name}.lock", 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def write_snapshot(file_name, cache, index):
+    """
+    Write the lookups of a NetBox cache ({object_type: {key: object}}) and its CacheIndex to a snapshot file.
+
+    Objects are stored once and shared by every table referring to them, so the
+    index tables only add their keys. The file is replaced atomically, processes
+    that mapped the previous snapshot keep reading it.
+    """
+    temp_file_name = f"{file_name}.{os.getpid()}.tmp"
+    directory = {}
+    with open(temp_file_name, 'wb') as snapshot_file:
+        snapshot_file.write(HEADER.pack(MAGIC, 0))
+        objects = {}  # digest of an object's JSON -> its record offset
+
+        def write_record(data):
+            offset = snapshot_file.tell()
+            snapshot_file.write(LENGTH.pack(len(data)))
+            snapshot_file.write(data)
+            return offset
+
+        tables = {}
+        for object_type, entries in list(cache.items()) + list(index.tables()):
+            if not isinstance(entries, dict):
+                continue
+            table = tables[object_type] = []
+            for key, obj in entries.items():
+                data = json.dumps(obj.serialize() if hasattr(obj, 'serialize') else obj, separators=(',', ':'), default=str).encode()
+                digest = hashlib.blake2b(data, digest_size=16).digest()
+                if digest not in objects:
+                    objects[digest] = write_record(data)
+                encoded_key = str(key).encode()
+                table.append((key_hash(encoded_key), write_record(encoded_key), objects[digest]))
+
+        for object_type, table in tables.items():
+            slots = 1 << max(len(table) * 2 - 1, 1).bit_length()  # At most half full
+            buffer = bytearray(slots * ENTRY.size)
+            for entry in table:
+                slot = entry[0] & (slots - 1)
+                while ENTRY.unpack_from(buffer, slot * ENTRY.size)[1]:
+                    slot = (slot + 1) & (slots - 1)
+                ENTRY.pack_into(buffer, slot * ENTRY.size, *entry)
+            directory[object_type] = [snapshot_file.tell(), slots, len(table)]
+            snapshot_file.write(buffer)
+
+        directory_offset = snapshot_file.tell()
+        snapshot_file.write(json.dumps(directory).encode())
+        snapshot_file.seek(0)
+        snapshot_file.write(HEADER.pack(MAGIC, directory_offset))
+    os.replace(temp_file_name, file_name)
+
+
+class SharedCacheSnapshot:
+    """
+    Read-only NetBox cache lookups in a memory-mapped snapshot file.
+
+    Every process on a host maps the same file, its pages are shared through the OS
+    page cache instead of each process holding its own copy of the parsed cache.
+    Lookups probe the hash table in place and only decode the object they find.
+    """
+
+    def __init__(self, file_name):
+        with open(file_name, 'rb') as snapshot_file:
+            self.map = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, directory_offset) = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{file_name} is not a fabric2dcim cache snapshot")
+        self.tables = {object_type: tuple(table) for object_type, table in json.loads(self.map[directory_offset:]).items()}
+
+    def views(self):
+        """Return the cache as {object_type: SharedCacheView}, the form NetBoxManager uses."""
+        return {object_type: SharedCacheView(self, object_type) for object_type in self.tables if not object_type.startswith('index:')}
+
+    def read(self, offset):
+        (length,) = LENGTH.unpack_from(self.map, offset)
+        return self.map[offset + LENGTH.size:offset + LENGTH.size + length]
+
+    def find(self, object_type, key):
+        """Return the record offset of the object cached under key, None if there is none."""
+        if not isinstance(key, str):
+            return None  # Snapshot keys are strings, like the keys of a cache loaded from JSON
+        (table_offset, slots, _) = self.tables[object_type]
+        encoded_key = key.encode()
+        hashed = key_hash(encoded_key)
+        slot = hashed & (slots - 1)
+        while True:
+            (entry_hash, key_offset, object_offset) = ENTRY.unpack_from(self.map, table_offset + slot * ENTRY.size)
+            if not key_offset:
+                return None
+            if entry_hash == hashed and self.read(key_offset) == encoded_key:
+                return object_offset
+            slot = (slot + 1) & (slots - 1)
+
+    def get(self, offset):
+        return json.loads(self.read(offset))
+
+    def keys(self, object_type):
+        (table_offset, slots, _) = self.tables[object_type]
+        for slot in range(slots):
+            key_offset = ENTRY.unpack_from(self.map, table_offset + slot * ENTRY.size)[1]
+            if key_offset:
+                yield self.read(key_offset).decode()
+
+    def count(self, object_type):
+        return self.tables[object_type][2]
+
+
+class SharedCacheView(MutableMapping):
+    """
+    One object type of a SharedCacheSnapshot, with the process's own writes on top.
+
+    Objects created or updated by this process go to a small in-memory overlay, the
+    snapshot itself is never written. Objects read from the snapshot are decoded on
+    every lookup, changes to them have to be stored back (as create_or_update() does).
+    """
+
+    def __init__(self, snapshot, object_type):
+        self.snapshot = snapshot
+        self.object_type = object_type
+        self.overlay = {}
+        self.deleted = set()
+
+    def __getitem__(self, key):
+        if key in self.overlay:
+            return self.overlay[key]
+        offset = None if key in self.deleted else self.snapshot.find(self.object_type, key)
+        if offset is None:
+            raise KeyError(key)
+        return self.snapshot.get(offset)
+
+    def __contains__(self, key):
+        return key in self.overlay or (key not in self.deleted and self.snapshot.find(self.object_type, key) is not None)
+
+    def __setitem__(self, key, value):
+        self.overlay[key] = value
+        self.deleted.discard(key)
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self.overlay.pop(key, None)
+        if self.snapshot.find(self.object_type, key) is not None:
+            self.deleted.add(key)
+
+    def __iter__(self):
+        yield from self.overlay
+        for key in self.snapshot.keys(self.object_type):
+            if key not in self.overlay and key not in self.deleted:
+                yield key
+
+    def __len__(self):
+        added = sum(1 for key in self.overlay if self.snapshot.find(self.object_type, key) is None)
+        return self.snapshot.count(self.object_type) + added - len(self.deleted)
+
+    def __deepcopy__(self, memo):
+        view = SharedCacheView(self.snapshot, self.object_type)
+        view.overlay = copy.deepcopy(self.overlay, memo)
+        view.deleted = set(self.deleted)
+        return view
+
+    def serialize(self):
+        """Plain dict of every entry, for writing the cache as JSON."""
+        return {key: value.serialize() if hasattr(value, 'serialize') else value for key, value in self.items()}
+
+
+class SharedCacheIndex(CacheIndex):
+    """
+    CacheIndex of a SharedCacheSnapshot, objects this process adds are indexed in memory on top.
+
+    An object discarded before a change leaves tombstones for its snapshot index keys,
+    so a renamed interface or re-terminated cable is no longer found under its old key.
+    """
+
+    def __init__(self, snapshot):
+        super().__init__()
+        self.snapshot = snapshot
+        self.deleted = set()  # (table, key) of snapshot index entries no longer valid
+
+    def discard(self, object_type, obj):
+        super().discard(object_type, obj)
+        if object_type == 'interfaces':
+            self.deleted.add(('index:interfaces_by_device', f"{related_id(obj.get('device'))}:{obj.get('name')}"))
+        elif object_type == 'cables':
+            self.deleted.update(('index:cables_by_termination', str(termination_id)) for termination_id in termination_ids(obj))
+
+    def lookup(self, table, key):
+        if table not in self.snapshot.tables or (table, key) in self.deleted:
+            return None
+        offset = self.snapshot.find(table, key)
+        return None if offset is None else self.snapshot.get(offset)
+
+    def get(self, object_type, object_id):
+        obj = super().get(object_type, object_id)
+        return obj if obj is not None else self.lookup(f"index:id:{object_type}", str(object_id))
+
+    def interface(self, device_id, name):
+        interface = super().interface(device_id, name)
+        return interface if interface is not None else self.lookup('index:interfaces_by_device', f"{device_id}:{name}")
+
+    def cable(self, termination_id):
+        cable = super().cable(termination_id)
+        return cable if cable is not None else self.lookup('index:cables_by_termination', str(termination_id))
@@ -1,11 +1,20 @@
 import pybsn
+import requests
 import re
 import pprint
 import ipaddress
 from fabrics.network_fabric_base import NetworkFabric
-    
+from fabrics.token_cache import TokenCache
+from metrics.run_log import get_logger, SAMPLED
+
+log = get_logger(__name__)
+
+# Reuse Big Switch session cookies for up to an hour
+BCF_TOKEN_TTL = 3600
+
 # Big Switch Subclass
 class BigSwitchFabric(NetworkFabric):
+    manufacturer = 'Arista'  # NetBox manufacturer of the fabric's switches
 
     def __init__(self, config, ip_manager):
         self.config = config
@@ -15,22 +24,53 @@ class BigSwitchFabric(NetworkFabric):
         self.password = self.config.get('fabric_pass')
         self.default_site = self.config.get('netbox_site')
         self.DEBUG = self.config.get('debug') 
+        self.token_cache = TokenCache(self.config)
         self.client = None
 
     def connect(self):
-        """Implement connection logic specific to Big Switch."""
+        """Implement connection logic specific to Big Switch, reusing a cached session cookie when one is still valid."""
+        token = self.token_cache.get(self.host, self.username)
+        if token:
+            try:
+                # pybsn checks the token against the controller before handing back a client
+                self.client = pybsn.connect(host=self.host, token=token, verify_tls=False)
+                log.info(f"Connected to Big Switch API at {self.host}")
+                return
+            except requests.exceptions.HTTPError:
+                self.token_cache.invalidate(self.host, self.username)
+        self.login()
+
+    def login(self):
+        """Log in to the Big Switch controller with username/password and cache the session cookie."""
         self.client = pybsn.connect(
             host=self.host,
             username=self.username,
             password=self.password,
             verify_tls=False
         )
-        print(f"Connected to Big Switch API at {self.host}")
+        token = self.client.session.cookies.get_dict().get('session_cookie')
+        if token:
+            self.token_cache.store(self.host, self.username, token, BCF_TOKEN_TTL)
+        log.info(f"Connected to Big Switch API at {self.host}")
+
+    def get(self, path, endpoint=None):
+        """GET a BigDB path through the request scheduler, endpoint groups the call statistics."""
+        def request(path):
+            try:
+                return self.client.get(path)
+            except requests.exceptions.HTTPError as e:
+                if e.response is None or e.response.status_code != 401:
+                    raise
+                # Cached or long running session expired, log in again and repeat the request once
+                self.token_cache.invalidate(self.host, self.username)
+                self.login()
+                return self.client.get(path)
+        return self.call(endpoint or path, request, path)
 
     def get_device_inventory(self):
         """Retrieve switches from Big Switch via the /fabric/switch endpoint."""
         try:
-            switches = self.client.get("controller/applications/bcf/info/fabric/switch")
+            switches = self.get("controller/applications/bcf/info/fabric/switch")
             switches_data = []
             
             for switch in switches:
@@ -49,19 +89,22 @@ class BigSwitchFabric(NetworkFabric):
             
             return switches_data
         except Exception as e:
-            print(f"Error fetching switch inventory: {e}")
+            log.error(f"Error fetching switch inventory: {e}")
             return []
 
     def get_interface_inventory(self):
         """Retrieve switches from Big Switch."""     
+        return list(self.iter_interfaces())
+
+    def iter_interfaces(self):
+        """Yield each switch with its interfaces as soon as the switch has been queried."""
         try:
-            switches = self.client.get("controller/core/switch-config")
-            switches_data = []
+            switches = self.get("controller/core/switch-config")
             for switch in switches:
                 switch_name = switch.get('name')
                 switch_mac = switch.get('mac')
-                interfaces = self.client.get(f'controller/core/switch[name="{switch_name}"]')
-                print(f"Found {switch_name} with {len(interfaces[0].get('interface'))} interfaces") if self.DEBUG else None
+                interfaces = self.get(f'controller/core/switch[name="{switch_name}"]', endpoint='controller/core/switch')
+                log.debug(f"Found {switch_name} with {len(interfaces[0].get('interface'))} interfaces")
                 switch_info = {
                     'name': switch_name,
                     'mac_address': switch_mac,
@@ -76,27 +119,25 @@ class BigSwitchFabric(NetworkFabric):
                         } for iface in range(len(interfaces[0].get('interface')))
                     ]
                 }
-                switches_data.append(switch_info)
-            return switches_data
+                yield switch_info
         except Exception as e:
-            print(f"Error fetching network inventory: {e}")
-            return []
+            log.error(f"Error fetching network inventory: {e}")
     
     def get_network_inventory(self):
         """Retrieve l2/l3 network inventory from Big Switch."""
         try:
             
-            print(f"Processing Interface Groups..")
+            log.info(f"Processing Interface Groups..")
 
-            interface_groups = self.client.get("controller/applications/bcf/info/fabric/interface-group/detail")
+            interface_groups = self.get("controller/applications/bcf/info/fabric/interface-group/detail")
             ig_data=[]
             segment_data={}
             # Loop through the response at the "group" level
-            print(f"Found {len(interface_groups[0].get('name'))} interfaces groups")
+            log.info(f"Found {len(interface_groups[0].get('name'))} interfaces groups")
             for group in interface_groups:
                 group_data = []
                 group_name = group.get('name')
-                print(f'Found IG: {group_name}') if self.DEBUG ==1 else None
+                log.debug(f'Found IG: {group_name}')
 
                 if group_name == 'segment': continue # skip the segment entries
 
@@ -139,31 +180,31 @@ class BigSwitchFabric(NetworkFabric):
                 # check if entry for group-name & leaf-group already exists, if so merge members together
                 for index, group in enumerate(ig_data):
                     if group.get('interface_group_name') == group_name and group.get('switch_group') == leaf_group:
-                        print(f'adding members to group {group_name}') if self.DEBUG ==1 else None
+                        log.debug(f'adding members to group {group_name}')
                         ig_data[index]['members'].append(members)  
                         merged=True
                 # Append the processed data to the array
                 if not merged: 
                     ig_data.append(group_data)
-                    print(f'Adding group {group_name}') if self.DEBUG ==1 else None
+                    log.debug(f'Adding group {group_name}')
                 
                 
 
 
-            print(f"Processing layer2 info..")
-            segments = self.client.get("controller/applications/bcf/tenant/segment")
+            log.info(f"Processing layer2 info..")
+            segments = self.get("controller/applications/bcf/tenant/segment")
 
             for segment in segments:
                 # Extract the group name from 'interface-group-membership-rule' if available
                 if 'interface-group-membership-rule' in segment:
                     for rule in segment['interface-group-membership-rule']:
                         interface_group = rule.get('interface-group')
-                        print(f'Found IG in segment: {interface_group}') if self.DEBUG ==1 else None
+                        log.debug(f'Found IG in segment: {interface_group}')
                 
                         # Iterate through 'ig_data' with enumerate to track index
                         for idx, igroup in enumerate(ig_data):
                              if igroup['interface_group_name'] == interface_group:
-                                print(f'Found existing group {interface_group}') if self.DEBUG ==1 else None
+                                log.debug(f'Found existing group {interface_group}')
                                 # Ensure 'segments' is a list in the group
                                 if 'segments' not in igroup:
                                     igroup['segments'] = []
@@ -174,7 +215,7 @@ class BigSwitchFabric(NetworkFabric):
                                 }
                                 ig_data[idx]['segments'].append(new_segment)
                                 matched = True
-                                print(f'Adding segment to group {interface_group }') if self.DEBUG ==1 else None
+                                log.debug(f'Adding segment to group {interface_group }')
 
                                 break  # Stop searching once we find a match
                         
@@ -190,7 +231,7 @@ class BigSwitchFabric(NetworkFabric):
                                 ]
                             }
                             matched=False
-                            print(f"Adding interface group {new_group} for segment {segment.get('name')}")
+                            log.info("Adding interface group %s for segment %s", new_group, segment.get('name'), extra=SAMPLED)
                             ig_data.append(new_group)                 
 
 
@@ -200,9 +241,9 @@ class BigSwitchFabric(NetworkFabric):
                             'vni': segment.get('member-vni') if segment.get('member-vni') != 'None' else None,
                         }
                             
-            print(f"Processing layer3 info..")
+            log.info(f"Processing layer3 info..")
             
-            logical_routers = self.client.get("controller/applications/bcf/tenant/logical-router/segment-interface")
+            logical_routers = self.get("controller/applications/bcf/tenant/logical-router/segment-interface")
             for ip_info in logical_routers:
                 # Initialize fields for IPv4 and IPv6
                 ip4_address = None
@@ -240,19 +281,21 @@ class BigSwitchFabric(NetworkFabric):
             return (ig_data,segment_data)
             
         except Exception as e:
-            print(f"Error fetching switch inventory: {e}")
+            log.error(f"Error fetching switch inventory: {e}")
             return []
             
     
     def get_connection_inventory(self):
         """Retrieve connection inventory from Big Switch."""
-        
-        cables = []
+        return list(self.iter_connections())
+
+    def iter_connections(self):
+        """Yield fabric links and connected device cables from Big Switch."""
         
         # Collect Fabric Links between spines and leafs 
-        core_links = self.client.get("controller/applications/bcf/info/fabric/link")
-        print(f"Processing Fabric Links (Spine Leaf)")
-        print(f'Found {len(core_links)} interconnections')
+        core_links = self.get("controller/applications/bcf/info/fabric/link")
+        log.info(f"Processing Fabric Links (Spine Leaf)")
+        log.info(f'Found {len(core_links)} interconnections')
         
         for link in core_links:
             # Create a new dictionary for each cable
@@ -262,12 +305,12 @@ class BigSwitchFabric(NetworkFabric):
                 'src-device': link['src']['switch-info']['switch-name'],
                 'src-interface': link['src']['interface']['name']
             }
-            cables.append(cable_data) 
+            yield cable_data
         
         # Collect connected devices information
-        connected_devices = self.client.get("controller/applications/bcf/info/fabric/connected-device")
-        print(f'Processing switch <> device interconnections')
-        print(f'Found {len(connected_devices)} interconnections')
+        connected_devices = self.get("controller/applications/bcf/info/fabric/connected-device")
+        log.info(f'Processing switch <> device interconnections')
+        log.info(f'Found {len(connected_devices)} interconnections')
 
         for entry in connected_devices:
             # Create a new dictionary for each device interconnection
@@ -277,7 +320,7 @@ class BigSwitchFabric(NetworkFabric):
                 'src-device': entry['switch'],
                 'src-interface': entry['interface']
             }
-            cables.append(cable_data) 
+            yield cable_data
         #vni_links = self.client.get("applications/bcf/info/endpoint-manager/extended-segment")
         #print(f'Processing vxlan interconnections')
         #print(f'Found {len(vni_links)} interconnections')
@@ -292,8 +335,6 @@ class BigSwitchFabric(NetworkFabric):
         #    }
         #    cables.append(cable_data) 
 
-        return cables
-
 
     
     
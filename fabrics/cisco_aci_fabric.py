@@ -1,8 +1,21 @@
+import re
+import ssl
+import json
+import time
+import socket
 import requests
 from fabrics.network_fabric_base import NetworkFabric
+from fabrics.token_cache import TokenCache
+from metrics.run_log import get_logger
+
+log = get_logger(__name__)
+
+# Classes watched by subscription mode: switches, physical ports and LLDP neighbours
+SUBSCRIPTION_CLASSES = ['fabricNode', 'l1PhysIf', 'lldpAdjEp']
 
 # Cisco ACI Subclass
 class CiscoACIFabric(NetworkFabric):
+    manufacturer = 'Cisco'  # NetBox manufacturer of the fabric's switches
 
     def __init__(self, config, ip_manager):
         self.config = config
@@ -12,10 +25,32 @@ class CiscoACIFabric(NetworkFabric):
         self.password = self.config.get('fabric_pass')
         self.default_site = self.config.get('netbox_site')
         self.DEBUG = self.config.get('debug')
+        self.workers = int(self.config.get('fabric_workers') or 8)
+        self.page_size = 1000  # Objects per APIC class query page
+        self.token_cache = TokenCache(self.config)
+        self.node_names = {}  # Node DN -> switch name
+        self.session = None
         self.client = None
+        self.prepare_device = lambda device, position: device  # Completes new switches in subscription mode, see subscribe()
 
     def connect(self):
-        """Implement connection logic specific to Cisco ACI."""
+        """Implement connection logic specific to Cisco ACI, reusing a cached APIC session when one is still valid."""
+        # One pooled keep-alive session for every APIC call, the APIC-cookie lives in its cookie jar
+        self.session = requests.Session()
+        self.session.verify = False
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        token = self.token_cache.get(self.apic_url, self.username)
+        if token:
+            self.session.cookies.set('APIC-cookie', token)
+            log.info("Connected to Cisco ACI.")
+        else:
+            self.login()
+
+    def login(self):
+        """Log in to the APIC and cache the session token."""
         login_url = f"{self.apic_url}/api/aaaLogin.json"
         payload = {
             "aaaUser": {
@@ -26,57 +61,148 @@ class CiscoACIFabric(NetworkFabric):
             }
         }
         try:
-            response = requests.post(login_url, json=payload, verify=False)
+            response = self.session.post(login_url, json=payload)
             response.raise_for_status()
-            self.session = response.cookies
-            print("Connected to Cisco ACI.")
+            attributes = response.json()["imdata"][0]["aaaLogin"]["attributes"]
+            # Tokens expire unless refreshed within refreshTimeoutSeconds, stop reusing them a minute early
+            ttl = int(attributes.get("refreshTimeoutSeconds") or 600) - 60
+            self.token_cache.store(self.apic_url, self.username, attributes["token"], ttl)
+            log.info("Connected to Cisco ACI.")
         except requests.exceptions.RequestException as e:
-            print(f"Error connecting to Cisco ACI: {e}")
-    
-    def get_switch_inventory(self):
-        """Retrieve switches from Cisco ACI."""
-        switch_url = f"{self.apic_url}/api/node/class/fabricNode.json"
-        try:
-            response = requests.get(switch_url, cookies=self.session, verify=False)
+            log.error(f"Error connecting to Cisco ACI: {e}")
+
+    def get(self, url, endpoint, params=None):
+        """GET an APIC URL through the request scheduler, raising on HTTP errors so they can be retried."""
+        def request(url, params):
+            response = self.session.get(url, params=params)
+            if response.status_code in (401, 403):
+                # Cached or long running session expired, log in again and repeat the request once
+                self.token_cache.invalidate(self.apic_url, self.username)
+                self.login()
+                response = self.session.get(url, params=params)
             response.raise_for_status()
-            switches = response.json()["imdata"]
-            switches_data = []
-            for switch in switches:
-                attributes = switch["fabricNode"]["attributes"]
-                switch_info = {
-                    "name": attributes["name"],
-                    "model": attributes["model"],
-                    "serial": attributes["serial"],
-                    "role": attributes["role"],
-                    "address": attributes["address"]
-                }
-                switches_data.append(switch_info)
-            return switches_data
-        except Exception as e:
-            print(f"Error fetching switch inventory from Cisco ACI: {e}")
-            return []
+            return response
+        return self.call(endpoint, request, url, params)
 
-    def get_interface_inventory(self):
-        """Retrieve interface inventory from Cisco ACI."""
-        interface_url = f"{self.apic_url}/api/node/class/l1PhysIf.json"
+    def query_class(self, class_name, params=None):
+        """
+        Run an APIC class query page by page.
+
+        Args:
+            class_name (str): The APIC class to query (e.g., 'fabricNode').
+            params (dict): Extra query options such as rsp-subtree filters.
+
+        Yields:
+            Each object from the imdata of every page, as soon as its page arrives.
+        """
+        url = f"{self.apic_url}/api/node/class/{class_name}.json"
+        page = 0
+
+        while True:
+            query = dict(params or {})
+            query.update({'page': page, 'page-size': self.page_size, 'order-by': f"{class_name}.dn"})
+            data = self.get(url, class_name, params=query).json()
+            objects = data.get("imdata", [])
+            yield from objects
+
+            page += 1
+            if len(objects) < self.page_size or page * self.page_size >= int(data.get("totalCount", 0)):
+                break
+
+    def get_nodes(self):
+        """
+        Yield every leaf/spine with its physical interfaces.
+
+        topSystem is queried with an rsp-subtree so each switch arrives together with its
+        l1PhysIf (and their ethpmPhysIf operational state) in the same page, models come
+        from a single paged fabricNode query.
+
+        Yields:
+            (node attributes, [(l1PhysIf attributes, ethpmPhysIf attributes), ...])
+        """
+        models = {}
+        for node in self.query_class('fabricNode'):
+            attributes = node["fabricNode"]["attributes"]
+            models[attributes["dn"]] = attributes
+
+        subtree = {'rsp-subtree': 'full', 'rsp-subtree-class': 'l1PhysIf,ethpmPhysIf'}
+        for system in self.query_class('topSystem', subtree):
+            attributes = system["topSystem"]["attributes"]
+            if attributes.get("role") == 'controller':
+                continue
+
+            # topology/pod-1/node-101/sys -> topology/pod-1/node-101
+            node = dict(models.get(attributes["dn"].rsplit('/', 1)[0], {}), **attributes)
+
+            interfaces = []
+            for child in system["topSystem"].get("children", []):
+                if "l1PhysIf" not in child:
+                    continue
+                oper = {}
+                for grandchild in child["l1PhysIf"].get("children", []):
+                    if "ethpmPhysIf" in grandchild:
+                        oper = grandchild["ethpmPhysIf"]["attributes"]
+                interfaces.append((child["l1PhysIf"]["attributes"], oper))
+
+            yield node, interfaces
+
+    def node_to_device(self, node):
+        """Convert fabricNode/topSystem attributes to a device for NetBoxManager.create_device."""
+        model = node.get("model") or 'Switch'
+        return {
+            'name': node.get("name"),
+            'role': {'name': node.get("role")},
+            'device_type': {'model': model, 'manufacturer': {'name': 'Cisco'}, 'part_number': model},
+            'platform': f"ACI {node.get('version')}" if node.get('version') else 'ACI',
+            'serial': node.get("serial"),
+            'status': 'active' if node.get("fabricSt", 'active') == 'active' else 'offline',
+            'primary_ip4': f"{node.get('oobMgmtAddr')}/32" if node.get('oobMgmtAddr') not in (None, '', '0.0.0.0') else None,
+            'site': {'name': self.default_site}
+        }
+
+    def physif_to_interface(self, device_name, interface, oper=None):
+        """Convert l1PhysIf (and ethpmPhysIf) attributes to an interface for NetBoxManager.create_interface."""
+        oper = oper or {}
+        return {
+            'device': {'name': device_name},
+            'name': interface.get("id"),
+            'mac_address': oper.get("backplaneMac") or '',
+            'enabled': interface.get("adminSt") == 'up',
+            'speed_type': ['fiber', str(oper.get("operSpeed") or interface.get("speed") or '').lower()]
+        }
+
+    def lldp_to_connection(self, adjacency):
+        """Convert lldpAdjEp attributes to a cable for NetBoxManager.create_connection, None if the node is unknown."""
+        # topology/pod-1/node-101/sys/lldp/inst/if-[eth1/1]/adj-1
+        match = re.match(r'^(topology/pod-\d+/node-\d+)/sys/lldp/inst/if-\[([^\]]+)\]', adjacency.get("dn", ''))
+        if not match or match.group(1) not in self.node_names or not adjacency.get("sysName"):
+            return None
+        return {
+            'src-device': self.node_names[match.group(1)],
+            'src-interface': match.group(2),
+            'dst-device': re.sub(r'([A-Za-z0-9\-]+)\..+', r'\1', adjacency.get("sysName")),
+            'dst-interface': adjacency.get("portIdV") or adjacency.get("portDesc"),
+        }
+
+    def get_device_inventory(self):
+        """Retrieve switches from Cisco ACI, each carrying its interfaces under 'interfaces'."""
+        return list(self.iter_devices())
+
+    def iter_devices(self):
+        """Yield switches as their topSystem pages arrive, each carrying its interfaces under 'interfaces'."""
         try:
-            response = requests.get(interface_url, cookies=self.session, verify=False)
-            response.raise_for_status()
-            interfaces = response.json()["imdata"]
-            interfaces_data = []
-            for interface in interfaces:
-                attributes = interface["l1PhysIf"]["attributes"]
-                interface_info = {
-                    "id": attributes["id"],
-                    "description": attributes["descr"],
-                    "speed": attributes["speed"],
-                    "mtu": attributes["mtu"]
-                }
-                interfaces_data.append(interface_info)
-            return interfaces_data
+            for node, interfaces in self.get_nodes():
+                name = node.get("name")
+                device = self.node_to_device(node)
+                device['interfaces'] = [self.physif_to_interface(name, interface, oper) for interface, oper in interfaces]
+                log.debug(f"Found {name} with {len(interfaces)} interfaces")
+                yield device
         except Exception as e:
-            print(f"Error fetching interface inventory from Cisco ACI: {e}")
-            return []
+            log.error(f"Error fetching switch inventory from Cisco ACI: {e}")
+
+    def get_interface_inventory(self):
+        """Interfaces are returned together with their switch by get_device_inventory()."""
+        return []
 
     def get_network_inventory(self):
         """Retrieve LAG inventory from Cisco ACI."""
@@ -84,6 +210,166 @@ class CiscoACIFabric(NetworkFabric):
         pass
 
     def get_connection_inventory(self):
-        """Retrieve connection inventory from Cisco ACI."""
-        # Connections (Cables) can be inferred from interface and port-channel relationships
-        pass
+        """Retrieve connection inventory (LLDP neighbours) from Cisco ACI."""
+        return list(self.iter_connections())
+
+    def iter_connections(self):
+        """Yield LLDP neighbours from Cisco ACI as the lldpAdjEp pages arrive."""
+        try:
+            self.load_node_names()
+            for adjacency in self.query_class('lldpAdjEp'):
+                connection = self.lldp_to_connection(adjacency["lldpAdjEp"]["attributes"])
+                if connection:
+                    yield connection
+        except Exception as e:
+            log.error(f"Error fetching connection inventory from Cisco ACI: {e}")
+
+    def load_node_names(self):
+        """Map node DNs (topology/pod-1/node-101) to switch names."""
+        self.node_names = {}
+        for node in self.query_class('fabricNode'):
+            attributes = node["fabricNode"]["attributes"]
+            self.node_names[attributes["dn"]] = attributes["name"]
+
+    def subscribe(self, netbox_manager, prepare_device=None, websocket_factory=None, refresh_interval=30, max_events=None):
+        """
+        Keep NetBox in sync from APIC query subscriptions instead of polling the whole fabric.
+
+        Subscriptions are opened on SUBSCRIPTION_CLASSES, every event pushed over the APIC
+        websocket is turned into an update of just the changed object, and the subscriptions
+        and login token are refreshed every refresh_interval seconds.
+
+        Args:
+            netbox_manager (NetBoxManager): Where changes are written.
+            prepare_device (callable): (device, position) -> device, completes new switches the way
+                the full sync does (FabricSync.prepare_device, virtual chassis membership).
+            websocket_factory (callable): Opens the websocket given its URL, defaults to
+                websocket-client. Tests can pass a local stand-in here.
+            refresh_interval (int): Seconds between subscription refreshes (APIC drops them after 60s).
+            max_events (int): Stop after this many events, runs until interrupted if None.
+        """
+        if websocket_factory is None:
+            websocket_factory = self.open_websocket
+        if prepare_device:
+            self.prepare_device = prepare_device
+
+        self.load_node_names()
+        token = self.session.cookies.get('APIC-cookie')
+        websocket_url = re.sub(r'^http', 'ws', self.apic_url.rstrip('/')) + f"/socket{token}"
+        ws = websocket_factory(websocket_url)
+        ws.settimeout(1)
+        log.info(f"Listening for APIC events on {', '.join(SUBSCRIPTION_CLASSES)}")
+
+        subscriptions = self.open_subscriptions()
+        refreshed = time.monotonic()
+        events = 0
+
+        try:
+            while max_events is None or events < max_events:
+                if time.monotonic() - refreshed >= refresh_interval:
+                    subscriptions = self.refresh_subscriptions(subscriptions)
+                    refreshed = time.monotonic()
+
+                try:
+                    message = ws.recv()
+                except Exception as e:
+                    if is_timeout(e):
+                        continue
+                    raise
+
+                if not message:
+                    continue
+                for obj in json.loads(message).get("imdata", []):
+                    self.handle_event(obj, netbox_manager)
+                    events += 1
+        finally:
+            ws.close()
+
+    def open_websocket(self, url):
+        """Open the APIC websocket with websocket-client (only needed for subscription mode)."""
+        import websocket
+        return websocket.create_connection(url, sslopt={'cert_reqs': ssl.CERT_NONE})
+
+    def open_subscriptions(self):
+        """Subscribe to every class in SUBSCRIPTION_CLASSES, returns class name -> subscription id."""
+        subscriptions = {}
+        for class_name in SUBSCRIPTION_CLASSES:
+            url = f"{self.apic_url}/api/node/class/{class_name}.json"
+            data = self.get(url, f"{class_name}.subscribe", params={'subscription': 'yes'}).json()
+            subscriptions[class_name] = data["subscriptionId"]
+            log.debug(f"Subscribed to {class_name} ({data['subscriptionId']})")
+        return subscriptions
+
+    def refresh_subscriptions(self, subscriptions):
+        """Refresh the login token and every subscription, re-subscribing if the APIC has dropped them."""
+        try:
+            response = self.get(f"{self.apic_url}/api/aaaRefresh.json", 'aaaRefresh')
+            attributes = response.json()["imdata"][0]["aaaLogin"]["attributes"]
+            self.token_cache.store(self.apic_url, self.username, attributes["token"], int(attributes.get("refreshTimeoutSeconds") or 600) - 60)
+            for subscription_id in subscriptions.values():
+                self.get(f"{self.apic_url}/api/subscriptionRefresh.json", 'subscriptionRefresh', params={'id': subscription_id})
+            return subscriptions
+        except Exception as e:
+            log.info(f"Subscription refresh failed ({e}), subscribing again")
+            return self.open_subscriptions()
+
+    def handle_event(self, obj, netbox_manager):
+        """Apply a single subscription event to NetBox, touching only the object that changed."""
+        class_name = next(iter(obj))
+        attributes = obj[class_name]["attributes"]
+        status = attributes.get("status")
+        dn = attributes.get("dn", '')
+
+        if status == 'deleted':
+            # NetBoxManager never removes objects, deletions are left to a full sync
+            log.debug(f"Ignoring deleted {class_name} {dn}")
+            return
+
+        if class_name == 'fabricNode':
+            name = attributes.get("name") or self.node_names.get(dn)
+            if status == 'created' or dn not in self.node_names:
+                if not name or attributes.get("role") == 'controller':
+                    return  # APICs are not synced, nor nodes the event doesn't name
+                self.node_names[dn] = name
+                log.info(f"APIC event: node {name} {status}")
+                # Built like the switches of a full sync, positioned after every node known so far
+                netbox_manager.create_device(self.prepare_device(self.node_to_device(attributes), len(self.node_names)))
+            elif 'fabricSt' in attributes:
+                if name not in netbox_manager.netbox_cache['devices']:
+                    log.info(f"APIC event: node {name} is not in NetBox, left for the next full sync")
+                    return
+                log.info(f"APIC event: node {name} is {attributes['fabricSt']}")
+                netbox_manager.create_or_update('devices', 'name', name, {'name': name, 'status': 'active' if attributes['fabricSt'] == 'active' else 'offline'})
+
+        elif class_name == 'l1PhysIf':
+            # topology/pod-1/node-101/sys/phys-[eth1/1]
+            match = re.match(r'^(topology/pod-\d+/node-\d+)/sys/phys-\[([^\]]+)\]', dn)
+            if not match or match.group(1) not in self.node_names:
+                return
+            device_name = self.node_names[match.group(1)]
+            device = netbox_manager.netbox_cache['devices'].get(device_name)
+            if not device:
+                log.info(f"APIC event: interface {device_name} {match.group(2)} {status}, switch not in NetBox, left for the next full sync")
+                return
+            attributes = dict(attributes, id=match.group(2))
+            log.info(f"APIC event: interface {device_name} {match.group(2)} {status}")
+            if status == 'created':
+                # Named and typed like the interfaces of a full sync
+                netbox_manager.create_interface(self.physif_to_interface(device_name, attributes))
+            elif 'adminSt' in attributes:
+                (_, name) = netbox_manager.interface_netbox_type(match.group(2))
+                if netbox_manager.nb_cacher.index.interface(device['id'], name) is None:
+                    log.info(f"APIC event: interface {device_name} {name} is not in NetBox, left for the next full sync")
+                    return
+                netbox_manager.create_or_update('interfaces', 'name', name, {'device': device['id'], 'name': name, 'enabled': attributes['adminSt'] == 'up'})
+
+        elif class_name == 'lldpAdjEp':
+            connection = self.lldp_to_connection(attributes)
+            if connection:
+                log.info(f"APIC event: neighbour {connection['dst-device']} on {connection['src-device']} {connection['src-interface']}")
+                netbox_manager.create_connection(connection)
+
+
+def is_timeout(error):
+    """True for the read timeouts websocket-client (or a stand-in socket) raises while idle."""
+    return isinstance(error, (TimeoutError, socket.timeout)) or type(error).__name__ == 'WebSocketTimeoutException'
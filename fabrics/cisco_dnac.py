@@ -1,11 +1,36 @@
 from dnacentersdk import api
 from fabrics.network_fabric_base import NetworkFabric
+from fabrics.token_cache import TokenCache
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+import os
 import re
+import json
+import time
+import hashlib
 import ipaddress
-import pprint
+import threading
+from metrics.run_log import get_logger, SAMPLED
+
+log = get_logger(__name__)
+
+# DNAC tokens are valid for an hour, stop reusing them a little before that
+DNAC_TOKEN_TTL = 3300
+
+# DNAC device fields kept after the device inventory, used by the VLAN collection
+DEVICE_FIELDS = ['id', 'hostname', 'serialNumber', 'platformId', 'softwareVersion', 'lastUpdateTime']
+
+# Interface VLAN fields kept in the VLAN cache
+VLAN_FIELDS = ['vlanNumber', 'vlanType', 'networkAddress', 'prefix']
+
+# Held while api.Authentication is swapped for a controller's caching subclass, fabrics synced
+# concurrently would otherwise log in with (and restore) each other's subclass
+AUTHENTICATION_LOCK = threading.Lock()
 
 # Cisco DNA Center Subclass
 class CiscoDNAC(NetworkFabric):
+    manufacturer = 'Cisco'  # NetBox manufacturer of the fabric's switches
 
     def __init__(self, config, ip_manager):
         self.config = config
@@ -15,189 +40,300 @@ class CiscoDNAC(NetworkFabric):
         self.password = self.config.get('fabric_pass')
         self.default_site = self.config.get('netbox_site')
         self.DEBUG = self.config.get('debug')
+        self.workers = int(self.config.get('fabric_workers') or 8)  # Concurrent API calls to DNAC
+        self.vlan_cache_file_name = self.config.get('vlan_cache_file_name') or './dnac_vlan_cache.json'
+        self.vlan_cache_time = int(self.config.get('vlan_cache_time') or 86400)  # Default VLAN cache time of 1 day
+        self.dnac_devices = {}  # Inventory device name -> DNAC device object
+        self.sites = None  # Serial number -> site hierarchy, set by get_site_inventory() and iter_devices()
+        self.token_cache = TokenCache(self.config)
         self.client = None
 
     def connect(self):
-        """Connect to Cisco DNA Center."""
-        self.client = api.DNACenterAPI(
-            base_url=self.host,
-            username=self.username,
-            password=self.password,
-            verify=False
-        )
-        print(f"Connected to Cisco DNA Center API at {self.host}")
+        """Connect to Cisco DNA Center, reusing a cached auth token when one is still valid."""
+        token_cache = self.token_cache
+        cached_token = token_cache.get(self.host, self.username)
+
+        class CachedTokenAuthentication(api.Authentication):
+            """Hands out the cached token for the first login, later (401) logins go to DNAC and are cached."""
+
+            def authentication_api(auth, username, password, encoded_auth=None):
+                nonlocal cached_token
+                if cached_token:
+                    token, cached_token = cached_token, None
+                    return SimpleNamespace(Token=token)
+                token = super().authentication_api(username, password, encoded_auth)
+                token_cache.store(self.host, self.username, token.Token, DNAC_TOKEN_TTL)
+                return token
+
+        # DNACenterAPI logs in from its constructor through the module's Authentication class and
+        # offers no other way in, swap in the caching authentication while it runs. The client keeps
+        # its own instance of the subclass for later logins, only construction is serialized
+        with AUTHENTICATION_LOCK:
+            authentication = api.Authentication
+            api.Authentication = CachedTokenAuthentication
+            try:
+                self.client = api.DNACenterAPI(
+                    base_url=self.host,
+                    username=self.username,
+                    password=self.password,
+                    verify=False,
+                    wait_on_rate_limit=False  # Throttling is handled by the shared request scheduler
+                )
+            finally:
+                api.Authentication = authentication
+        log.info(f"Connected to Cisco DNA Center API at {self.host}")
 
     def devices_to_sites(self):
         """
         Map Device Serial Number to Site ID from Cisco DNA Center.
         """
         results = {}
-        devices = []
+        for (hierarchy, members) in self.iter_site_members():
+            for device in members:
+                results.setdefault(device.serialNumber, hierarchy)
+        return results
+
+    def iter_site_members(self):
+        """
+        Yield (site hierarchy, member devices) for each DNA Center site, fetching each site's membership when it is reached.
 
+        Sites are walked deepest first (floors, then buildings, then areas), so a device
+        listed at several levels is first seen at its most specific one.
+        """
         # Fetch sites from DNA Center
-        sites_response = self.client.sites.get_site().response
+        sites_response = self.call('sites.get_site', self.client.sites.get_site).response
         if not sites_response:
             raise ValueError("No sites found in Cisco DNA Center.")
-        counter=0
-        for site in sites_response:
-            counter += 1
-            print(f'Processing Site {counter} of {len(sites_response)}')  
-            if counter == 1: continue 
-            print(f"Devices: {devices}, Sites: {results}")  # Debugging line
-
-            if counter == 3: return devices,results
-                   
+
+        # Global itself has no devices to map
+        sites = [site for site in sites_response if '/' in (site.get('siteNameHierarchy') or '')]
+        sites.sort(key=lambda site: site.get('siteNameHierarchy').count('/'), reverse=True)
+        for counter, site in enumerate(sites, 1):
+            log.info('Processing Site %d of %d', counter, len(sites), extra=SAMPLED)
+
             # Fetch membership for each site
-            membership = self.client.sites.get_membership(site_id=site.id)
-            
-            if not membership or not hasattr(membership, 'device'):
-                # Log if membership is None or doesn't have 'device'
-                continue  # Skip if no membership or devices
-            if membership.device is None:
-                # Log and continue if device is None
+            membership = self.call('sites.get_membership', self.client.sites.get_membership, site_id=site.id)
+            if not membership or not hasattr(membership, 'device') or membership.device is None:
                 continue  # Skip the site if devices are missing
 
-            # If membership contains devices, map them
+            devices = []
             for members in membership.device:
-                
                 if not members or not hasattr(members, 'response'):
                     continue  # Skip if no valid device response
-                
-                print(f'{len(members.response)} Devices Found.')
+                log.info(f'{len(members.response)} Devices Found.')
+                devices.extend(device for device in members.response if hasattr(device, 'serialNumber'))
+            yield (site.get('siteNameHierarchy'), devices)
 
-                for device in members.response:
-                    if hasattr(device, 'serialNumber'):
-                        #print(f"found device {device.hostname} in site {site.get('siteNameHierarchy')}")
-                        devices.append(device)
-                        results[device.serialNumber] = site.get('siteNameHierarchy')
-                    
-        return devices,results
-
-    def get_paginated_devices(self, client, limit=500):
+    def get_paginated_devices(self, client=None, limit=500, prefetch=True):
         """
         Retrieves all devices from DNAC using pagination.
+
+        Devices are yielded as soon as their page arrives. With prefetch the next page
+        is requested while the current one is being processed, so no more than two
+        pages are ever held in memory.
         
         Args:
-            client: The DNAC API client.
+            client: The DNAC API client (default: the connected client).
             limit: The maximum number of devices to retrieve per request (default: 500).
+            prefetch: Request the next page in the background (default: True).
 
-        Returns:
-            A list of all devices across all pages.
+        Yields:
+            Each device across all pages.
         """
-        devices = []
-        offset = 1
+        client = client or self.client
+        offset = 1  # DNAC offsets start at 1
 
-        while True:
-            # Fetch devices with pagination (limit and offset)
-            response = client.devices.get_device_list(offset=offset, limit=limit)
-            
-            # Append the current batch of devices to the overall list
-            devices.extend(response.response)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            next_page = executor.submit(self.fetch_device_page, client, offset, limit)
 
-            # Break if the number of devices retrieved is less than the limit (no more pages)
-            #if len(response.response) < limit:
-            if offset == 1:
-                break
+            while next_page is not None:
+                devices = next_page.result()
+                offset += limit
 
-            # Increment the offset for the next page
-            offset += limit
-            
-        return devices
+                # A short page is the last one
+                more = len(devices) == limit
+                next_page = executor.submit(self.fetch_device_page, client, offset, limit) if more and prefetch else None
+
+                yield from devices
+
+                if more and not prefetch:
+                    next_page = executor.submit(self.fetch_device_page, client, offset, limit)
+
+    def fetch_device_page(self, client, offset, limit):
+        """Fetch a single page of the device list."""
+        response = self.call('devices.get_device_list', client.devices.get_device_list, offset=offset, limit=limit)
+        log.debug(f'Retrieved {len(response.response)} devices at offset {offset} from DNAC')
+        return response.response or []
     
+    def fetch_device_interfaces(self, devices):
+        """
+        Fetch interfaces for a list of devices using a pool of worker threads.
+
+        Only a bounded number of requests is kept in flight so the caller can
+        process already fetched devices while the rest are still downloading.
+
+        Args:
+            devices: Iterable of DNAC device objects.
+
+        Yields:
+            (device, interfaces) tuples in the same order as devices. interfaces is None if the fetch failed.
+        """
+        window = self.workers * 2
+        pending = deque()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for device in devices:
+                pending.append((device, executor.submit(self.fetch_interfaces, device)))
+                if len(pending) >= window:
+                    device, future = pending.popleft()
+                    yield device, future.result()
+
+            while pending:
+                device, future = pending.popleft()
+                yield device, future.result()
+
+    def fetch_interfaces(self, device):
+        """Fetch the interface list for a single device, returns None on error."""
+        try:
+            return self.call('devices.get_interface_info_by_id', self.client.devices.get_interface_info_by_id, device.id).response
+        except Exception as e:
+            log.error(f"Error fetching interfaces for device {device.hostname}: {e}")
+            return None
+
     def get_device_inventory(self):
         """Retrieve device inventory from Cisco DNA Center."""
         try:
-            #devices = self.get_paginated_devices(self.client)
-            #print(f'Retrieved {len(devices)} total devices from DNAC...')
+            log.info('Retrieving Device Information from DNAC...')
+            sites = self.get_site_inventory()
+            log.info(f'Retrieved {len(sites)} total sites.')
 
-            devices_data = []
-            print('Retrieving Device Information from DNAC...')
-            (devices,sites) = self.devices_to_sites()
-            print(f'Retrieved {len(devices)} total devices.')
-            print(f'Retrieved {len(sites)} total sites.')
+            devices_data = list(self.iter_device_inventory(sites))
+            log.info(f'Retrieved {len(devices_data)} total devices.')
 
-            for device in devices:
-                site = 'Clemson Network'
-                location = None
-                
-                if device.get('serialNumber'):
-                    parts = sites[device.serialNumber].split('/')
-                    site = parts[2] if len(parts) > 2 else None        # Reeves Football Ops
-                    location = parts[3] if len(parts) > 3 else None    # First Floor
-                            
-                if device.hostname:
-                    # Ensure platformId, serialNumber, and hostname are strings
-                    platform_id = str(device.platformId or '')
-                    serial_number = str(device.serialNumber or '')
-                    hostname = str(device.hostname or '')
-                    serial_number = re.sub(r'^([^\,]+)\,.+', r'\1', serial_number)
-                    part_number = re.sub(r'^([^\,]+)\,.+', r'\1', platform_id)
-                    
-                    #TODO need to manage stackwise better. 
-                    #Its just creating interfaces on the main device now and not creating a stack/virtual chassis
-                    
-                    model = re.sub(r'^C', r'Catalyst ', platform_id)
-                    model = re.sub(r'^WS\-C', r'Catalyst ', model)
-                    model = re.sub(r'^IE\-', r'Catalyst IE', model)
-                    model = re.sub(r'^AIR\-AP', r'Catalyst ', model)
-                    model = re.sub(r'^AIR\-CAP', r'Catalyst ', model)
-                    model = re.sub(r'\-K9$', r'', model)
-                    model = re.sub(r'^([^\,]+)\,.+', r'\1', model)
+            return devices_data, sites
 
+        except Exception as e:
+            log.error(f"Error fetching device inventory: {e}")
+            return []
 
-                    role = device.family
-                    
-                    if 'Third Party Device' in role:
-                        continue
-                    
-                    name = re.sub(r'(^[^\.]+)\.clemson\.edu', r'\1', hostname).lower() # TODO make this a variable vs clemson specific
-                    interfaces = []
-                    
-                    # Fetch interfaces for this device
-                    try:
-                        interfaces_response = self.client.devices.get_interface_info_by_id(device.id).response
-                        print(f"Fetched {len(interfaces_response)} interfaces for device {name}")
-                        
-                        # Process interfaces
-                        interfaces = [
-                            {
-                                'device': {'name': name},
-                                'name': interface.get('portName'),
-                                'mac_address': interface.get('macAddress'),
-                                'enabled': interface.get('status') == 'up',
-                                'speed_type': interface.get('speed')
-                            }
-                            for interface in interfaces_response
-                        ]
+    def get_site_inventory(self):
+        """Retrieve the serial number -> site hierarchy map."""
+        self.sites = self.devices_to_sites()
+        return self.sites
 
-                    except Exception as e:
-                        interfaces = []
+    def iter_devices(self):
+        """
+        Yield devices from Cisco DNA Center site by site, as each site's membership arrives.
 
-                    manufacturer = device.vendor or 'Cisco'
-                    manufacturer = re.sub(r' Systems Inc',r'', manufacturer)
-                    manufacturer = re.sub(r'^NA$',r'Cisco', manufacturer)
+        Each device carries its site hierarchy under 'site_hierarchy', so the streaming
+        sync can create the site before the device. Devices no site lists are paged in
+        from the device list afterwards.
+        """
+        try:
+            self.sites = {}
+            yield from self.iter_device_inventory(self.sites, self.iter_site_devices(), hierarchies=True)
+        except Exception as e:
+            log.error(f"Error fetching device inventory: {e}")
+
+    def iter_site_devices(self):
+        """Yield DNAC device objects site by site, then the ones no site lists, recording each device's site hierarchy in self.sites."""
+        for (hierarchy, members) in self.iter_site_members():
+            for device in members:
+                if device.serialNumber not in self.sites:
+                    self.sites[device.serialNumber] = hierarchy
+                    yield device
+        for device in self.get_paginated_devices():
+            if device.serialNumber not in self.sites:
+                yield device
+
+    def iter_device_inventory(self, sites, devices=None, hierarchies=False):
+        """
+        Yield device inventory from Cisco DNA Center as the device list is paged in.
+
+        Args:
+            sites (dict): Serial number to site hierarchy map from devices_to_sites().
+            devices: DNAC device objects to normalize (default: the paged device list).
+            hierarchies (bool): Add each device's site hierarchy under 'site_hierarchy'.
+        """
+        # Skip devices we never import before queueing their interface fetch
+        devices = (device for device in (devices if devices is not None else self.get_paginated_devices())
+                   if device.hostname and 'Third Party Device' not in (device.family or ''))
+
+        # Interfaces are fetched by the worker pool while each device is normalized below
+        for device, interfaces_response in self.fetch_device_interfaces(devices):
+            site = 'Clemson Network'
+            location = None
+            
+            if sites.get(device.serialNumber):
+                parts = sites[device.serialNumber].split('/')
+                site = parts[2] if len(parts) > 2 else None        # Reeves Football Ops
+                location = parts[3] if len(parts) > 3 else None    # First Floor
+                        
+            if device.hostname:
+                # Ensure platformId, serialNumber, and hostname are strings
+                platform_id = str(device.platformId or '')
+                serial_number = str(device.serialNumber or '')
+                hostname = str(device.hostname or '')
+                serial_number = re.sub(r'^([^\,]+)\,.+', r'\1', serial_number)
+                part_number = re.sub(r'^([^\,]+)\,.+', r'\1', platform_id)
+                
+                #TODO need to manage stackwise better. 
+                #Its just creating interfaces on the main device now and not creating a stack/virtual chassis
+                
+                model = re.sub(r'^C', r'Catalyst ', platform_id)
+                model = re.sub(r'^WS\-C', r'Catalyst ', model)
+                model = re.sub(r'^IE\-', r'Catalyst IE', model)
+                model = re.sub(r'^AIR\-AP', r'Catalyst ', model)
+                model = re.sub(r'^AIR\-CAP', r'Catalyst ', model)
+                model = re.sub(r'\-K9$', r'', model)
+                model = re.sub(r'^([^\,]+)\,.+', r'\1', model)
 
-                    device_info = {
-                        'name': name,
-                        'role': {'name': role},
-                        'device_type': {'model': model, 'manufacturer': {'name': manufacturer}, 'part_number': part_number},
-                        'platform': f"{device.softwareType or 'AP-IOS'} {device.softwareVersion or ''}",
-                        'serial': serial_number,
-                        'status': 'active' if device.reachabilityStatus == 'Reachable' else 'offline',
-                        'primary_ip4': f"{device.managementIpAddress}/32" if device.managementIpAddress else None,
-                        'site': {'name': site},
-                        'location': {'name': location},
-                        'interfaces': interfaces  
 
-                    }
+                role = device.family
+                
+                name = re.sub(r'(^[^\.]+)\.clemson\.edu', r'\1', hostname).lower() # TODO make this a variable vs clemson specific
+                interfaces = []
+                
+                if interfaces_response is not None:
+                    log.info("Fetched %d interfaces for device %s", len(interfaces_response), name, extra=SAMPLED)
+                    
+                    # Process interfaces
+                    interfaces = [
+                        {
+                            'device': {'name': name},
+                            'name': interface.get('portName'),
+                            'mac_address': interface.get('macAddress'),
+                            'enabled': interface.get('status') == 'up',
+                            'speed_type': interface.get('speed')
+                        }
+                        for interface in interfaces_response
+                    ]
+
+                manufacturer = device.vendor or 'Cisco'
+                manufacturer = re.sub(r' Systems Inc',r'', manufacturer)
+                manufacturer = re.sub(r'^NA$',r'Cisco', manufacturer)
+
+                device_info = {
+                    'name': name,
+                    'role': {'name': role},
+                    'device_type': {'model': model, 'manufacturer': {'name': manufacturer}, 'part_number': part_number},
+                    'platform': f"{device.softwareType or 'AP-IOS'} {device.softwareVersion or ''}",
+                    'serial': serial_number,
+                    'status': 'active' if device.reachabilityStatus == 'Reachable' else 'offline',
+                    'primary_ip4': f"{device.managementIpAddress}/32" if device.managementIpAddress else None,
+                    'site': {'name': site},
+                    'location': {'name': location},
+                    'interfaces': interfaces  
 
-                    devices_data.append(device_info)
+                }
 
-            return devices_data, sites
+                if hierarchies and sites.get(device.serialNumber):
+                    device_info['site_hierarchy'] = sites[device.serialNumber]
 
-        except Exception as e:
-            print(f"Error fetching device inventory: {e}")
-            return []
+                # Keep just enough of the DNAC device for the VLAN collection later on
+                self.dnac_devices[name] = type(device)({key: device.get(key) for key in DEVICE_FIELDS})
+
+                yield device_info
 
     def get_interface_inventory(self):
         """Abstract method to retrieve interface inventory from the fabric."""
@@ -212,53 +348,146 @@ class CiscoDNAC(NetworkFabric):
         try:
             vlans_data = {}  # Dictionary to store VLAN information by VLAN number
             prefixes_data = {}  # Dictionary to store Prefix information by VLAN number
-            
+            site_parts = {}  # Split each site hierarchy once, not once per device
+            merged_sets = set()  # VLAN sets already merged, access switches mostly share the same one
+
+            # Devices passed in may be our own inventory dicts, map them back to the DNAC device objects
+            devices = [device if 'id' in device else self.dnac_devices.get(device.get('name')) for device in devices]
+            devices = [device for device in devices if device is not None]
+
+            device_vlans = self.collect_device_vlans(devices)
+
+            # Single pass merge of every device's VLANs into vlans_data / prefixes_data
             for device in devices:
-                parts = sites[device.serialNumber].split('/')
-                site_group = parts[1] if len(parts) > 1 else None  # Athletics
-                site = parts[2] if len(parts) > 2 else None        # Reeves Football Ops
-                location = parts[3] if len(parts) > 3 else None    # First Floor
-                            
-                try:
-                    # Fetch VLAN information for the device's interfaces
-                    vlans = self.client.devices.get_device_interface_vlans(device.id).response
-
-                    for vlan in vlans:
-                        # Create or update VLAN structure (indexed by vlan_number)
-                        if vlan.get('vlanNumber') not in vlans_data:  # Check if VLAN is new
-                            print(f"VLAN {site_group}: {site}: {location} :: {vlan.get('vlanNumber')} {vlan.get('vlanType', 'Unknown')}")
-                            vlans_data[vlan.get('vlanNumber')] = {
-                                'vid': vlan.get('vlanNumber'),
+                vlans = device_vlans.get(device.id)
+                if not vlans:
+                    continue
+
+                vlan_set = (device.hostname, tuple(tuple(sorted(vlan.items())) for vlan in vlans))
+                if all(vlan.get('vlanType') for vlan in vlans):
+                    vlan_set = vlan_set[1]  # Names don't depend on the hostname, identical sets on any device can be skipped
+                if vlan_set in merged_sets:
+                    continue
+                merged_sets.add(vlan_set)
+
+                hierarchy = sites.get(device.serialNumber) or ''
+                if hierarchy not in site_parts:
+                    parts = hierarchy.split('/')
+                    site_parts[hierarchy] = (
+                        parts[1] if len(parts) > 1 else None,  # Athletics
+                        parts[2] if len(parts) > 2 else None,  # Reeves Football Ops
+                        parts[3] if len(parts) > 3 else None,  # First Floor
+                    )
+                (site_group, site, location) = site_parts[hierarchy]
+
+                for vlan in vlans:
+                    # Create or update VLAN structure (indexed by vlan_number)
+                    if vlan.get('vlanNumber') not in vlans_data:  # Check if VLAN is new
+                        log.info("VLAN %s: %s: %s :: %s %s", site_group, site, location, vlan.get('vlanNumber'), vlan.get('vlanType', 'Unknown'), extra=SAMPLED)
+                        vlans_data[vlan.get('vlanNumber')] = {
+                            'vid': vlan.get('vlanNumber'),
+                            'name': vlan.get('vlanType', (f"{device.hostname} vlan {vlan.get('vlanNumber')}")),
+                            'status': 'active'
+                        }
+
+                    # Create or update Prefix structure (indexed by vlan_number, only if IP-related data exists)
+                    if vlan.get('networkAddress') and vlan.get('prefix'):
+                        if vlan.get('vlanNumber') not in prefixes_data:  # Check if Prefix is new
+                            log.info("Prefix %s: %s: %s :: %s/%s", site_group, site, location, vlan.get('networkAddress'), vlan.get('prefix'), extra=SAMPLED)
+                            prefixes_data[vlan.get('vlanNumber')] = {
                                 'name': vlan.get('vlanType', (f"{device.hostname} vlan {vlan.get('vlanNumber')}")),
+                                'vlan': vlan.get('vlanNumber'),
+                                'prefix': f"{vlan.get('networkAddress')}/{vlan.get('prefix')}", 
                                 'status': 'active'
                             }
-
-                        # Create or update Prefix structure (indexed by vlan_number, only if IP-related data exists)
-                        if vlan.get('networkAddress') and vlan.get('prefix'):
-                            if vlan.get('vlanNumber') not in prefixes_data:  # Check if Prefix is new
-                                print(f"Prefix {site_group}: {site}: {location} :: {vlan.get('networkAddress')}/{vlan.get('prefix')}")
-                                prefixes_data[vlan.get('vlanNumber')] = {
-                                    'name': vlan.get('vlanType', (f"{device.hostname} vlan {vlan.get('vlanNumber')}")),
-                                    'vlan': vlan.get('vlanNumber'),
-                                    'prefix': f"{vlan.get('networkAddress')}/{vlan.get('prefix')}", 
-                                    'status': 'active'
-                                }
-
-
-                except Exception as e:
-                    continue #print(f"Error fetching VLANs for device {device.hostname}: {e}")
             
             return vlans_data, prefixes_data
             
         except Exception as e:
-            print(f"Error fetching network inventory: {e}")
+            log.error(f"Error fetching network inventory: {e}")
             return {}, {}
 
+    def collect_device_vlans(self, devices):
+        """
+        Collect the interface VLANs of every device, using the on-disk VLAN cache where possible.
+
+        Devices whose fingerprint matches the cache and whose VLANs were fetched less
+        than vlan_cache_time seconds ago are not queried again, the rest are fetched
+        concurrently. The cache is written back with the given devices only, devices
+        DNAC no longer reports are dropped from it.
+
+        Args:
+            devices: List of DNAC device objects.
+
+        Returns:
+            dict: device id -> list of VLAN dicts (None if the fetch failed).
+        """
+        cached = self.load_vlan_cache()
+        cache = {}
+        results = {}
+        to_fetch = []
+        now = time.time()
+
+        for device in devices:
+            entry = cached.get(device.id)
+            if entry and entry.get('fingerprint') == self.device_fingerprint(device) and now - float(entry.get('fetched') or 0) < self.vlan_cache_time:
+                results[device.id] = entry['vlans']
+                cache[device.id] = entry
+            else:
+                to_fetch.append(device)
+
+        log.info(f"Using cached VLANs for {len(results)} devices, fetching {len(to_fetch)} from DNAC")
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for device, vlans in zip(to_fetch, executor.map(self.fetch_vlans, to_fetch)):
+                results[device.id] = vlans
+                if vlans is not None:
+                    cache[device.id] = {'fingerprint': self.device_fingerprint(device), 'fetched': now, 'vlans': vlans}
+
+        self.save_vlan_cache(cache)
+        return results
+
+    def fetch_vlans(self, device):
+        """Fetch the interface VLANs for a single device, keeping only the fields we use. Returns None on error."""
+        try:
+            vlans = self.call('devices.get_device_interface_vlans', self.client.devices.get_device_interface_vlans, device.id).response
+            return [{key: vlan.get(key) for key in VLAN_FIELDS if key in vlan} for vlan in vlans]
+        except Exception as e:
+            log.error(f"Error fetching VLANs for device {device.hostname}: {e}")
+            return None
+
+    def device_fingerprint(self, device):
+        """
+        Fingerprint of the device DNAC reports, it changes when the device is upgraded or replaced.
+
+        lastUpdateTime is left out, DNAC bumps it on every periodic resync whether or
+        not anything changed. Configuration changes are picked up once the cached
+        VLANs are older than vlan_cache_time.
+        """
+        values = [str(device.get(key)) for key in ('serialNumber', 'platformId', 'softwareVersion')]
+        return hashlib.sha1('|'.join(values).encode()).hexdigest()
+
+    def load_vlan_cache(self):
+        """Load the per device VLAN cache, an unreadable cache is treated as empty."""
+        try:
+            with open(str(self.vlan_cache_file_name), 'r') as cache_file:
+                return json.load(cache_file)
+        except (OSError, ValueError):
+            return {}
+
+    def save_vlan_cache(self, cache):
+        """Write the per device VLAN cache, replacing the old file atomically."""
+        temp_file_name = f"{self.vlan_cache_file_name}.{os.getpid()}.tmp"
+        with open(temp_file_name, 'w') as cache_file:
+            json.dump(cache, cache_file)
+        os.replace(temp_file_name, str(self.vlan_cache_file_name))
+        log.debug(f"VLAN cache saved to {self.vlan_cache_file_name}.")
+
     def get_connection_inventory(self):
         """Retrieve connection inventory from Cisco DNA Center."""
         try:
-            links = self.client.topology.get_physical_topology()
-            pprint.pp(links)
+            links = self.call('topology.get_physical_topology', self.client.topology.get_physical_topology)
+            log.debug(f"Physical topology has {len(links.response.links)} links", extra=SAMPLED)
             connections = []
 
             for link in links.response.links:
@@ -272,5 +501,5 @@ class CiscoDNAC(NetworkFabric):
 
             return connections
         except Exception as e:
-            print(f"Error fetching connection inventory: {e}")
+            log.error(f"Error fetching connection inventory: {e}")
             return []
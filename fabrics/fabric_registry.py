@@ -0,0 +1,67 @@
+import importlib
+import threading
+from fabrics.network_fabric_base import NetworkFabric
+
+# Installed packages add fabric types by declaring an entry point in this group, e.g. in pyproject.toml:
+#   [project.entry-points."fabric2dcim.fabrics"]
+#   arista-cvp = "fabric2dcim_cvp.fabric:CloudVisionFabric"
+ENTRY_POINT_GROUP = 'fabric2dcim.fabrics'
+
+# fabric_type -> 'module:Class' of the built-in fabrics, imported only when selected
+# so a run never loads the SDKs of the other controllers
+_fabrics = {
+    'bigswitch': 'fabrics.bigswitch_fabric:BigSwitchFabric',
+    'cisco-aci': 'fabrics.cisco_aci_fabric:CiscoACIFabric',
+    'cisco-dnac': 'fabrics.cisco_dnac:CiscoDNAC',
+}
+_lock = threading.Lock()
+_entry_points_loaded = False
+
+
+def register_fabric(fabric_type, target):
+    """Register a NetworkFabric subclass, or its 'module:Class' path to import on first use, as a fabric type."""
+    with _lock:
+        _fabrics[fabric_type.lower()] = target
+
+
+def fabric_types():
+    """Return the names of every registered fabric type, built-in and from entry points."""
+    load_entry_points()
+    with _lock:
+        return sorted(_fabrics)
+
+
+def get_fabric_class(fabric_type):
+    """Return the NetworkFabric subclass of a fabric type, importing its module if needed."""
+    fabric_type = fabric_type.lower()
+    if fabric_type not in _fabrics:
+        load_entry_points()
+    with _lock:
+        target = _fabrics.get(fabric_type)
+    if target is None:
+        raise ValueError(f"Unsupported fabric type {fabric_type}. Supported values are {', '.join(repr(name) for name in fabric_types())}.")
+
+    if isinstance(target, str):
+        (module_name, _, class_name) = target.partition(':')
+        target = getattr(importlib.import_module(module_name), class_name)
+    elif hasattr(target, 'load'):
+        target = target.load()  # Entry point
+    if not (isinstance(target, type) and issubclass(target, NetworkFabric)):
+        raise ValueError(f"Fabric type {fabric_type} is registered to {target!r}, which is not a NetworkFabric subclass")
+
+    with _lock:
+        _fabrics[fabric_type] = target
+    return target
+
+
+def load_entry_points():
+    """Add the fabric types installed packages declare, without importing them. Built-in types can't be replaced."""
+    global _entry_points_loaded
+    if _entry_points_loaded:
+        return
+    # Reading the installed package metadata is slow as well, only done for types that aren't built-in
+    from importlib.metadata import entry_points
+    with _lock:
+        for entry_point in entry_points(group=ENTRY_POINT_GROUP):
+            _fabrics.setdefault(entry_point.name.lower(), entry_point)
+        _entry_points_loaded = True
@@ -1,8 +1,76 @@
 
+import time
+import threading
 from abc import ABC, abstractmethod
+from fabrics.request_scheduler import get_scheduler
+
+# Collection threads make their first calls at the same time, only one of them may open the archive
+_recorder_lock = threading.Lock()
 
 # Base Class for Network Fabric
 class NetworkFabric(ABC):
+    manufacturer = 'Generic'  # NetBox manufacturer of the fabric's switches, set by each fabric type
+
+    def call(self, endpoint, func, *args, **kwargs):
+        """Make a controller API call through the shared rate limiting scheduler for this fabric's controller."""
+        recorder = self.get_recorder()
+        if recorder is None:
+            return self.get_scheduler().call(endpoint, func, *args, **kwargs)
+
+        # Recording, the call's arguments identify its response in the archive
+        start = time.monotonic()
+        try:
+            response = self.get_scheduler().call(endpoint, func, *args, **kwargs)
+        except Exception as e:
+            recorder.record(endpoint, args, kwargs, time.monotonic() - start, error=e)
+            raise
+        recorder.record(endpoint, args, kwargs, time.monotonic() - start, response=response)
+        return response
+
+    def get_scheduler(self):
+        """Return the RequestScheduler shared by every fabric object using the same controller."""
+        if getattr(self, 'scheduler', None) is None:
+            self.scheduler = get_scheduler(self.config)
+        return self.scheduler
+
+    def get_recorder(self):
+        """Return the FabricRecorder saving this fabric's controller responses, None unless --record-file is set."""
+        if not self.config.get('record_file'):
+            return None
+        with _recorder_lock:
+            if getattr(self, 'recorder', None) is None:
+                from fabrics.replay_fabric import FabricRecorder
+                self.recorder = FabricRecorder(self.config)
+        return self.recorder
+
+    def print_request_stats(self):
+        """Print per endpoint call counts and latency for this fabric's controller."""
+        self.get_scheduler().print_stats()
+
+    def get_site_inventory(self):
+        """Return a serial number -> site hierarchy (Global/Group/Site/Location) map, fabrics without sites return {}."""
+        return {}
+
+    def iter_devices(self):
+        """
+        Yield devices as they are collected. Fabrics that can page or stream their inventory override this.
+
+        Devices of fabrics with sites carry their site hierarchy under 'site_hierarchy'.
+        """
+        result = self.get_device_inventory() or []
+        (devices, sites) = result if isinstance(result, tuple) else (result, {})
+        for device in devices:
+            if sites.get(device.get('serial')):
+                device['site_hierarchy'] = sites[device['serial']]
+            yield device
+
+    def iter_interfaces(self):
+        """Yield per switch interface lists ({'name': ..., 'interfaces': [...]}) as they are collected."""
+        yield from self.get_interface_inventory() or []
+
+    def iter_connections(self):
+        """Yield connections as they are collected."""
+        yield from self.get_connection_inventory() or []
 
     @abstractmethod
     def connect(self):
@@ -0,0 +1,207 @@
+import os
+import gzip
+import json
+import time
+import atexit
+import threading
+import requests
+from fabrics.network_fabric_base import NetworkFabric
+from metrics.run_metrics import get_metrics
+from metrics.run_log import get_logger
+
+log = get_logger(__name__)
+
+ARCHIVE_VERSION = 1
+
+
+def request_key(endpoint, args, kwargs):
+    """Identifies a controller call in an archive, the same call made again gets the same key."""
+    return json.dumps([endpoint, list(args), kwargs], sort_keys=True, default=str)
+
+
+def encode_response(response):
+    """Turn a client response into JSON, keeping enough of its type to rebuild it on replay."""
+    if type(response).__name__ == 'MyDict':
+        # DNAC SDK responses are dicts with attribute access, any attribute exists on them
+        return {'kind': 'mydict', 'value': response}
+    if hasattr(response, 'status_code') and hasattr(response, 'text'):
+        # requests.Response from the APIC
+        return {'kind': 'http', 'status_code': response.status_code, 'url': response.url, 'text': response.text}
+    return {'kind': 'json', 'value': response}
+
+
+def decode_response(encoded):
+    if encoded['kind'] == 'http':
+        return ReplayResponse(encoded['status_code'], encoded['url'], encoded['text'])
+    if encoded['kind'] == 'mydict':
+        from dnacentersdk.models.mydict import MyDict
+        return MyDict(encoded['value'])
+    return encoded['value']
+
+
+class ReplayResponse:
+    """The parts of requests.Response the fabrics use, rebuilt from an archive."""
+
+    def __init__(self, status_code, url, text):
+        self.status_code = status_code
+        self.url = url
+        self.text = text
+
+    def json(self):
+        return json.loads(self.text)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} for url: {self.url}", response=self)
+
+
+class FabricRecorder:
+    """
+    Appends every controller response of a fabric to a gzip compressed JSON lines archive.
+
+    The first line describes the recorded fabric, every further line is one call with
+    its key, latency and response. Failed calls are recorded too, so a replay fails
+    the same way the recorded run did.
+    """
+
+    def __init__(self, config):
+        self.archive_file_name = config.get('record_file')
+        self.lock = threading.Lock()
+        # Archives hold the whole fabric inventory, keep them readable by the sync user only
+        fd = os.open(self.archive_file_name, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        self.raw_file = os.fdopen(fd, 'wb')
+        self.archive = gzip.GzipFile(fileobj=self.raw_file, mode='wb')
+        self.write({
+            'version': ARCHIVE_VERSION,
+            'recorded': time.time(),
+            'fabric': {key: config.get(key) for key in ['fabric_type', 'fabric_url', 'fabric_name']},
+        })
+        # The gzip trailer is only written on close
+        atexit.register(self.close)
+
+    def record(self, endpoint, args, kwargs, latency, response=None, error=None):
+        entry = {'key': request_key(endpoint, args, kwargs), 'endpoint': endpoint, 'latency': latency}
+        if error is not None:
+            entry['error'] = f"{type(error).__name__}: {error}"
+        else:
+            entry['response'] = encode_response(response)
+        self.write(entry)
+
+    def write(self, entry):
+        line = json.dumps(entry, default=str) + '\n'
+        with self.lock:
+            if not self.archive.closed:
+                self.archive.write(line.encode())
+
+    def close(self):
+        with self.lock:
+            if not self.archive.closed:
+                self.archive.close()
+                self.raw_file.close()
+
+
+class ReplayArchive:
+    """A recorded archive loaded into memory, recorded calls are kept in order per request key."""
+
+    def __init__(self, archive_file_name):
+        self.archive_file_name = archive_file_name
+        self.calls = {}
+        count = 0
+        with gzip.open(archive_file_name, 'rt') as archive:
+            header = json.loads(archive.readline())
+            if header.get('version') != ARCHIVE_VERSION:
+                raise ValueError(f"{archive_file_name} is not a version {ARCHIVE_VERSION} fabric recording")
+            try:
+                for line in archive:
+                    entry = json.loads(line)
+                    self.calls.setdefault(entry['key'], []).append(entry)
+                    count += 1
+            except (EOFError, ValueError):
+                # The recording run was killed before the archive was closed, use what made it to disk
+                log.info(f"{archive_file_name} is truncated, replaying the first {count} calls")
+        self.fabric = header['fabric']
+        self.count = count
+
+
+class ReplayClient:
+    """Stands in for the controller client, its methods are only handed to call() which never runs them."""
+
+    def __getattr__(self, name):
+        return self
+
+    def __call__(self, *args, **kwargs):
+        raise RuntimeError("A replayed fabric never calls the controller")
+
+
+class ReplayFabric(NetworkFabric):
+    """
+    Serves a recorded archive back through the fabric implementation that recorded it.
+
+    The recorded fabric's own parsing code runs unchanged, only its controller calls
+    are answered from the archive, so the whole sync can be run and profiled offline.
+    A call made more often than it was recorded (daemon mode) gets the recorded
+    responses in order and the last one again after that.
+    """
+
+    def __init__(self, config, fabric, archive):
+        self.config = config
+        self.fabric = fabric
+        self.archive = archive
+        self.DEBUG = self.config.get('debug')
+        self.lock = threading.Lock()
+        latency = self.config.get('replay_latency') or 0
+        self.latency = latency if latency == 'recorded' else float(latency)  # Seconds added to every call, or the recorded latency
+
+        # Answer the wrapped fabric's calls from the archive instead of its controller
+        self.fabric.call = self.call
+        self.fabric.client = ReplayClient()
+
+    def connect(self):
+        log.info(f"Replaying {self.archive.count} recorded calls to {self.config.get('fabric_url')} from {self.archive.archive_file_name}")
+
+    def call(self, endpoint, func, *args, **kwargs):
+        key = request_key(endpoint, args, kwargs)
+        with self.lock:
+            recorded = self.archive.calls.get(key)
+            if not recorded:
+                raise RuntimeError(f"No recorded response for {endpoint} {key}")
+            entry = recorded.pop(0) if len(recorded) > 1 else recorded[0]
+
+        latency = (entry.get('latency') or 0) if self.latency == 'recorded' else self.latency
+        if latency:
+            time.sleep(latency)
+        self.get_scheduler().record(endpoint, latency)
+        get_metrics().observe_request('fabric', endpoint, latency, error='error' in entry)
+        if 'error' in entry:
+            raise RuntimeError(f"Recorded {endpoint} call failed: {entry['error']}")
+        return decode_response(entry['response'])
+
+    def get_device_inventory(self):
+        return self.fabric.get_device_inventory()
+
+    def get_interface_inventory(self):
+        return self.fabric.get_interface_inventory()
+
+    def get_network_inventory(self):
+        return self.fabric.get_network_inventory()
+
+    def get_connection_inventory(self):
+        return self.fabric.get_connection_inventory()
+
+    def get_site_inventory(self):
+        return self.fabric.get_site_inventory()
+
+    def iter_devices(self):
+        return self.fabric.iter_devices()
+
+    def iter_interfaces(self):
+        return self.fabric.iter_interfaces()
+
+    def iter_connections(self):
+        return self.fabric.iter_connections()
+
+    def __getattr__(self, name):
+        # Only DNAC collects VLANs, the sync checks for the method
+        if name == 'get_vlan_inventory':
+            return getattr(self.fabric, name)
+        raise AttributeError(name)
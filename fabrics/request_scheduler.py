@@ -0,0 +1,177 @@
+import time
+import random
+import threading
+import requests
+from metrics.run_metrics import get_metrics
+from metrics.run_log import get_logger
+
+log = get_logger(__name__)
+
+# Status codes that mean "slow down / try again" rather than a real failure
+RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
+
+# One scheduler per controller URL, shared by every fabric object talking to it
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(config):
+    """Return the shared RequestScheduler for the controller in config, creating it on first use."""
+    controller = str(config.get('fabric_url')).lower().rstrip('/')
+    with _schedulers_lock:
+        if controller not in _schedulers:
+            _schedulers[controller] = RequestScheduler(
+                controller,
+                rate=float(config.get('fabric_rate_limit') or 10),
+                retries=int(config.get('fabric_retries') or 5),
+                debug=config.get('debug'),
+            )
+        return _schedulers[controller]
+
+
+class RequestScheduler:
+    """
+    Rate limit aware scheduler for calls made to a single fabric controller.
+
+    Calls are admitted through a token bucket, throttled or failed calls are
+    retried with jittered exponential backoff (or after the controller's
+    Retry-After), and call counts and latency are tracked per endpoint.
+    """
+
+    def __init__(self, controller, rate=10, burst=None, retries=5, backoff=1.0, max_backoff=60, debug=0):
+        self.controller = controller
+        self.max_rate = rate                # Requests per second allowed when the controller is healthy
+        self.rate = rate                    # Current rate, lowered while the controller is throttling us
+        self.min_rate = min(rate, 0.5)
+        self.burst = burst or max(1, rate)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.DEBUG = debug
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0
+        self.lock = threading.Lock()
+        self.stats = {}
+
+    def call(self, endpoint, func, *args, **kwargs):
+        """
+        Run func(*args, **kwargs) under the rate limit, retrying on throttling and transient errors.
+
+        Args:
+            endpoint (str): Name used for the statistics (e.g., 'devices.get_device_list').
+            func (callable): The client call to make.
+
+        Returns:
+            Whatever func returns. The last exception is raised once retries are exhausted.
+        """
+        attempt = 0
+        while True:
+            self.acquire()
+            start = time.monotonic()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                self.record(endpoint, time.monotonic() - start, error=True)
+                get_metrics().observe_request('fabric', endpoint, time.monotonic() - start, error=True)
+                status = self.status_code(e)
+                if not self.is_retryable(e, status) or attempt >= self.retries:
+                    self.record(endpoint, failed=True)
+                    raise
+                delay = self.retry_delay(e, status, attempt)
+                attempt += 1
+                self.record(endpoint, retried=True)
+                log.debug(f"{self.controller} {endpoint} returned {status or type(e).__name__}, retry {attempt}/{self.retries} in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+
+            self.record(endpoint, time.monotonic() - start)
+            get_metrics().observe_request('fabric', endpoint, time.monotonic() - start)
+            self.recover()
+            return result
+
+    def acquire(self):
+        """Block until the token bucket allows another request."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.blocked_until > now:
+                    wait = self.blocked_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                else:
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def status_code(self, error):
+        """Extract the HTTP status code from a client exception, if it has one."""
+        status = getattr(error, 'status_code', None)
+        if status is None and getattr(error, 'response', None) is not None:
+            status = getattr(error.response, 'status_code', None)
+        return status
+
+    def is_retryable(self, error, status):
+        """Throttling, server side errors and dropped connections are worth another try."""
+        if status is not None:
+            return status in RETRY_STATUS_CODES
+        return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+    def retry_delay(self, error, status, attempt):
+        """
+        Work out how long to wait before retrying.
+
+        A Retry-After from the controller pauses every caller of this controller,
+        otherwise the delay is exponential backoff with full jitter.
+        """
+        retry_after = getattr(error, 'retry_after', None)
+        response = getattr(error, 'response', None)
+        if retry_after is None and response is not None and hasattr(response, 'headers'):
+            retry_after = response.headers.get('Retry-After')
+
+        if status == 429:
+            # The controller is throttling us, halve the rate until calls succeed again
+            with self.lock:
+                self.rate = max(self.min_rate, self.rate / 2)
+
+        try:
+            delay = float(retry_after) + random.uniform(0, 1) if retry_after is not None else None
+        except ValueError:
+            delay = None  # HTTP-date Retry-After values are not worth parsing, fall back to backoff
+
+        if delay is None:
+            delay = random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+        elif status == 429:
+            with self.lock:
+                self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+
+        return delay
+
+    def recover(self):
+        """Creep the rate back up towards the configured maximum after a successful call."""
+        if self.rate < self.max_rate:
+            with self.lock:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+    def record(self, endpoint, latency=None, error=False, retried=False, failed=False):
+        """Update the call/latency counters for an endpoint."""
+        with self.lock:
+            stats = self.stats.setdefault(endpoint, {'calls': 0, 'errors': 0, 'retries': 0, 'failed': 0, 'total_time': 0.0, 'max_time': 0.0})
+            if latency is not None:
+                stats['calls'] += 1
+                stats['total_time'] += latency
+                stats['max_time'] = max(stats['max_time'], latency)
+            stats['errors'] += 1 if error else 0
+            stats['retries'] += 1 if retried else 0
+            stats['failed'] += 1 if failed else 0
+
+    def print_stats(self):
+        """Print the per endpoint counters, always warning about calls that were given up on."""
+        for endpoint, stats in sorted(self.stats.items()):
+            average = stats['total_time'] / stats['calls'] if stats['calls'] else 0
+            if self.DEBUG == 1 or stats['failed']:
+                (log.warning if stats['failed'] else log.info)(
+                    f"{self.controller} {endpoint}: {stats['calls']} calls, {stats['retries']} retries, "
+                    f"{stats['failed']} failed, avg {average:.3f}s, max {stats['max_time']:.3f}s")
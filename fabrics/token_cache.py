@@ -0,0 +1,79 @@
+import os
+import json
+import time
+import stat
+import hashlib
+import threading
+from metrics.run_log import get_logger
+
+log = get_logger(__name__)
+
+# Shared by every TokenCache, fabrics synced in one process rewrite the same file
+TOKEN_CACHE_LOCK = threading.Lock()
+
+
+class TokenCache:
+    """
+    On-disk cache of controller auth tokens/session cookies, keyed by controller URL and user.
+
+    The file only ever holds tokens, never passwords, and is created readable by
+    the owner only. A cache file that other users can read is ignored.
+    """
+
+    def __init__(self, config):
+        self.DEBUG = config.get('debug')
+        self.token_cache_file_name = os.path.expanduser(config.get('token_cache_file_name') or '~/.cache/fabric2dcim/tokens.json')
+        self.lock = TOKEN_CACHE_LOCK
+
+    def key(self, url, username):
+        """Cache key for a controller/user pair, hashed so the file does not list our controllers and users."""
+        return hashlib.sha256(f"{str(url).lower().rstrip('/')}|{username}".encode()).hexdigest()
+
+    def get(self, url, username):
+        """Return the cached token for the controller/user, or None if missing or expired."""
+        with self.lock:
+            entry = self.load().get(self.key(url, username))
+        if entry and entry.get('expires', 0) > time.time():
+            log.debug(f"Reusing cached session for {url}")
+            return entry.get('token')
+        return None
+
+    def store(self, url, username, token, ttl):
+        """Save a token for the controller/user that is reused for ttl seconds."""
+        with self.lock:
+            tokens = self.load()
+            now = time.time()
+            # Drop anything that has expired while we are rewriting the file anyway
+            tokens = {key: entry for key, entry in tokens.items() if entry.get('expires', 0) > now}
+            tokens[self.key(url, username)] = {'token': token, 'expires': now + ttl}
+            self.save(tokens)
+
+    def invalidate(self, url, username):
+        """Forget the token for the controller/user, used when the controller rejects it."""
+        with self.lock:
+            tokens = self.load()
+            if tokens.pop(self.key(url, username), None) is not None:
+                self.save(tokens)
+
+    def load(self):
+        """Read the token file, an unreadable or insecure file is treated as empty."""
+        try:
+            if os.stat(self.token_cache_file_name).st_mode & (stat.S_IRWXG | stat.S_IRWXO):
+                log.info(f"Ignoring token cache {self.token_cache_file_name}, it is accessible by other users")
+                return {}
+            with open(self.token_cache_file_name, 'r') as cache_file:
+                return json.load(cache_file)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self, tokens):
+        """Write the token file with owner only permissions, replacing the old file atomically."""
+        directory = os.path.dirname(self.token_cache_file_name)
+        if directory:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+
+        temp_file_name = f"{self.token_cache_file_name}.{os.getpid()}.tmp"
+        fd = os.open(temp_file_name, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as cache_file:
+            json.dump(tokens, cache_file)
+        os.replace(temp_file_name, self.token_cache_file_name)
@@ -0,0 +1,185 @@
+import os
+import sys
+import time
+import pstats
+import functools
+import cProfile
+import threading
+import collections
+
+SAMPLE_INTERVAL = 0.005  # Seconds between wall-clock stack samples
+PROFILED_PHASES = ('cache_load_', 'collect_', 'write_')  # Phases outside these only contain other phases
+SUMMARY_FUNCTIONS = 15  # Functions listed per phase in the summary
+
+# Code worth listing in the summary: this repository, not the SDKs and standard library
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# From Python 3.12 cProfile runs on sys.monitoring, which profiles every thread and takes one
+# active profiler per process, concurrent phases can't each have their own
+PER_THREAD_PROFILES = sys.version_info < (3, 12)
+PROCESS_PROFILE = 'process'  # Name of the single CPU profile used instead
+
+
+class PhaseProfiler:
+    """
+    Profiles each sync phase on its own, started and stopped by RunMetrics.phase().
+
+    Every phase gets a cProfile run timed with the thread's CPU clock, so network
+    waits don't show up as time spent in our code, and a wall-clock stack sampler
+    that shows where the phase's thread spends its time including those waits.
+    Phases run in several threads at once, each is only profiled in its own thread.
+    A phase started inside another one (the cache preload during the first device
+    write) pauses the outer profile until it ends. From Python 3.12 one cProfile run
+    covers the whole process from the first profiled phase (process.cpu.prof), the
+    stack samples are still taken per phase.
+
+    write() leaves per phase <phase>.cpu.prof (pstats / snakeviz), <phase>.wall.folded
+    (collapsed stacks for flamegraph.pl / speedscope) and a summary.txt of the top
+    self-time functions of this repository.
+    """
+
+    def __init__(self, profile_dir):
+        self.profile_dir = profile_dir
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.profiles = collections.defaultdict(list)  # phase -> cProfile.Profile per run of the phase
+        self.samples = collections.defaultdict(collections.Counter)  # phase -> (stack, innermost fabric2dcim frame) -> samples
+        self.active = {}  # thread id -> phase being profiled in it
+        self.sampler = None
+        self.process_profile = None  # Single cProfile run where per thread profiles aren't possible
+
+    def is_profiled(self, name):
+        return name.startswith(PROFILED_PHASES)
+
+    def start(self, name):
+        """Start profiling a phase in the current thread."""
+        stack = self.local.__dict__.setdefault('stack', [])
+        if stack and stack[-1][1]:
+            stack[-1][1].disable()
+        profile = cProfile.Profile(time.thread_time) if PER_THREAD_PROFILES else None
+        stack.append((name, profile))
+        with self.lock:
+            self.active[threading.get_ident()] = name
+            if self.sampler is None:
+                self.sampler = threading.Thread(target=self.sample, daemon=True)
+                self.sampler.start()
+            if not PER_THREAD_PROFILES and self.process_profile is None:
+                # CPU time of the whole process, the functions of concurrent threads share it
+                self.process_profile = enabled(cProfile.Profile(time.process_time))
+        if profile:
+            enabled(profile)
+
+    def stop(self):
+        """Stop profiling the current thread's phase, resuming the phase it was started in."""
+        stack = self.local.stack
+        (name, profile) = stack.pop()
+        if profile:
+            profile.disable()
+        with self.lock:
+            if profile:
+                self.profiles[name].append(profile)
+            if stack:
+                self.active[threading.get_ident()] = stack[-1][0]
+                if stack[-1][1]:
+                    enabled(stack[-1][1])
+            else:
+                del self.active[threading.get_ident()]
+
+    def sample(self):
+        """Sampler thread, counts the stacks of the threads running a profiled phase."""
+        while True:
+            time.sleep(SAMPLE_INTERVAL)
+            frames = sys._current_frames()
+            with self.lock:
+                for thread_id, name in self.active.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        self.samples[name][stack_of(frame)] += 1
+
+    def write(self):
+        """Write the profile files and summary of every phase profiled so far."""
+        os.makedirs(self.profile_dir, exist_ok=True)
+        with self.lock:
+            profiles = {name: list(runs) for name, runs in self.profiles.items()}
+            samples = {name: collections.Counter(stacks) for name, stacks in self.samples.items()}
+            if self.process_profile:
+                # Dumping stops the profile, it carries on once its stats are written
+                process_file_name = os.path.join(self.profile_dir, f"{PROCESS_PROFILE}.cpu.prof")
+                self.process_profile.dump_stats(process_file_name)
+                profiles[PROCESS_PROFILE] = [process_file_name]
+                enabled(self.process_profile)
+
+        summary = []
+        for name in sorted(set(profiles) | set(samples)):
+            stats = None
+            if profiles.get(name):
+                stats = pstats.Stats(profiles[name][0])
+                for profile in profiles[name][1:]:
+                    stats.add(profile)
+                stats.dump_stats(os.path.join(self.profile_dir, f"{name}.cpu.prof"))
+
+            stacks = collections.Counter()
+            for (stack, _), count in samples.get(name, {}).items():
+                stacks[stack] += count
+            if name in samples:
+                with open(os.path.join(self.profile_dir, f"{name}.wall.folded"), 'w') as folded_file:
+                    for stack, count in stacks.most_common():
+                        folded_file.write(f"{';'.join(stack)} {count}\n")
+            summary += summarize(name, stats, samples.get(name, {}))
+
+        with open(os.path.join(self.profile_dir, 'summary.txt'), 'w') as summary_file:
+            summary_file.write('\n'.join(summary) + '\n')
+
+
+def enabled(profile):
+    """Enable a profile, unless another profiling tool (a debugger, an outer profile) already runs."""
+    try:
+        profile.enable()
+    except ValueError:
+        pass  # That phase is only sampled
+    return profile
+
+
+def stack_of(frame):
+    """Return the root to leaf 'module.function' names of a thread's stack and its innermost frame in this repository."""
+    stack = []
+    own = None
+    while frame is not None:
+        name = f"{frame.f_globals.get('__name__')}.{frame.f_code.co_qualname}"
+        if own is None and is_repo_file(frame.f_code.co_filename):
+            own = name
+        stack.append(name)
+        frame = frame.f_back
+    return (tuple(reversed(stack)), own or stack[0])
+
+
+@functools.lru_cache(maxsize=None)
+def is_repo_file(file_name):
+    if file_name.startswith(('<', '~')):
+        return False  # Frozen modules and builtins
+    file_name = os.path.abspath(file_name)
+    return file_name.startswith(REPO_DIR + os.sep) and 'site-packages' not in file_name
+
+
+def summarize(name, stats, samples):
+    """Summary lines of one phase: top CPU self time and top wall-clock samples in this repository's code."""
+    lines = [f"== {name}"]
+    if stats is not None:
+        functions = [(timing[2], timing[1], function) for function, timing in stats.stats.items() if is_repo_file(function[0]) and function[0] != __file__]
+        lines.append(f"CPU {stats.total_tt:.3f}s, top self time in fabric2dcim code:")
+        lines.append(f"{'self s':>10} {'calls':>10}  function")
+        for (self_time, calls, (file_name, line, function)) in sorted(functions, reverse=True)[:SUMMARY_FUNCTIONS]:
+            lines.append(f"{self_time:>10.4f} {calls:>10}  {os.path.relpath(file_name, REPO_DIR)}:{line}({function})")
+
+    total = sum(samples.values())
+    if total:
+        # Time is charged to the innermost frame of our own code, waits in SDKs and sockets included
+        own = collections.Counter()
+        for (_, frame), count in samples.items():
+            own[frame] += count
+        lines.append(f"Wall {total * SAMPLE_INTERVAL:.2f}s sampled ({total} samples), innermost fabric2dcim frame:")
+        lines.append(f"{'wall %':>10}  function")
+        for frame, count in own.most_common(SUMMARY_FUNCTIONS):
+            lines.append(f"{100.0 * count / total:>9.1f}%  {frame}")
+    lines.append('')
+    return lines
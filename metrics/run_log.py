@@ -0,0 +1,163 @@
+import sys
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+import collections
+import logging.handlers
+from metrics.run_metrics import get_metrics
+
+ROOT_LOGGER = 'fabric2dcim'
+TEXT_FORMAT = '%(asctime)s %(levelname)s %(message)s'
+
+# extra= of messages logged once per object (device, interface, cable...), thinned out by --log-sample
+SAMPLED = {'sampled': True}
+
+_listener = None
+_setup_lock = threading.Lock()
+
+
+def get_logger(name):
+    """Logger of a module, below the fabric2dcim logger configured by setup_logging()."""
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+def setup_logging(config):
+    """
+    Send fabric2dcim's log messages through a queue to a background thread writing them to stdout.
+
+    Logging threads only put the record on the queue, formatting and terminal I/O happen
+    in the listener thread. --log-level (or --debug) sets the level, --log-sample N only
+    lets every Nth per-object message of each kind through and --log-format json writes
+    one JSON object per line. Safe to call more than once, only the first call counts.
+    """
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return
+        debug = str(config.get('debug') or '').lower() in ('1', 'true', 'yes')
+        level = (config.get('log_level') or ('DEBUG' if debug else 'INFO')).upper()
+
+        output = logging.StreamHandler(sys.stdout)
+        output.setFormatter(JSONFormatter() if (config.get('log_format') or 'text').lower() == 'json' else logging.Formatter(TEXT_FORMAT))
+        handler = DeferredQueueHandler(queue.SimpleQueue())
+        _sampler.every = int(config.get('log_sample') or 1)
+        handler.addFilter(_sampler)
+
+        logger = logging.getLogger(ROOT_LOGGER)
+        logger.setLevel(level)
+        logger.addHandler(handler)
+        logger.propagate = False
+        # Progress summaries stay on when per-object messages are turned off with WARNING
+        get_logger('progress').setLevel(min(logging.INFO, logger.level))
+
+        _listener = logging.handlers.QueueListener(handler.queue, output)
+        _listener.start()
+        # Write out what is still queued when the process ends
+        atexit.register(_listener.stop)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves formatting to the listener thread when the arguments can't change in the meantime."""
+
+    IMMUTABLE = (str, int, float, bool, type(None))
+
+    def prepare(self, record):
+        if record.exc_info or not all(isinstance(arg, self.IMMUTABLE) for arg in (record.args if isinstance(record.args, tuple) else [record.args])):
+            return super().prepare(record)
+        return record
+
+
+class SampleFilter(logging.Filter):
+    """Lets the first and then every Nth per-object message of each kind through, counting the others."""
+
+    def __init__(self, every):
+        super().__init__()
+        self.every = every
+        self.seen = collections.Counter()  # (logger, message template) -> messages
+        self.dropped = 0
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        if self.every <= 1 or not getattr(record, 'sampled', False):
+            return True
+        with self.lock:
+            count = self.seen[(record.name, record.msg)]
+            self.seen[(record.name, record.msg)] = count + 1
+            if count % self.every == 0:
+                return True
+            self.dropped += 1
+            return False
+
+
+# One sampler per process, its counts are reported by ProgressReporter
+_sampler = SampleFilter(1)
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per message, with the fields passed in extra= next to the message."""
+
+    STANDARD = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime', 'sampled'}
+
+    def format(self, record):
+        entry = {
+            'time': record.created,
+            'level': record.levelname,
+            'logger': record.name[len(ROOT_LOGGER) + 1:],
+            'message': record.getMessage(),
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in self.STANDARD})
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class ProgressReporter:
+    """
+    Logs how many objects of each type were created, updated or left unchanged every interval seconds.
+
+    Takes the counts from the run metrics, so per-object messages can be sampled or off
+    (--log-level WARNING) while the progress of a long sync is still visible.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.last = (0, 0, time.monotonic())  # (objects, sampled out messages, time) of the previous report
+        self.log = get_logger('progress')
+
+    def __enter__(self):
+        if self.interval > 0:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+            self.report()
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.report()
+
+    def report(self):
+        per_type = collections.defaultdict(collections.Counter)
+        for entry in get_metrics().report()['objects']:
+            per_type[entry['object_type']][entry['outcome']] += entry['count']
+        total = sum(sum(outcomes.values()) for outcomes in per_type.values())
+        dropped = _sampler.dropped
+        (last_total, last_dropped, last_time) = self.last
+        if total == last_total:
+            return  # Nothing written since the last report (daemon mode between polls)
+
+        now = time.monotonic()
+        self.last = (total, dropped, now)
+        summary = ', '.join(f"{object_type} {sum(outcomes.values())} ({outcomes['created']} created, {outcomes['updated']} updated)"
+                            for object_type, outcomes in sorted(per_type.items()))
+        self.log.info("Progress: %d objects, %.0f/s: %s%s", total, (total - last_total) / max(now - last_time, 0.001), summary,
+                      f" ({dropped - last_dropped} messages sampled out)" if dropped > last_dropped else '')
@@ -0,0 +1,187 @@
+import os
+import json
+import time
+import threading
+import contextlib
+from urllib.parse import urlparse
+
+# Upper bounds (seconds) of the request latency histogram buckets
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+
+class RunMetrics:
+    """
+    Timing and counters of one fabric2dcim process, shared by every fabric it syncs.
+
+    Records the duration of each phase of a run, the count, errors and latency
+    histogram of every fabric controller and NetBox endpoint, NetBox cache hits and
+    misses of create_or_update() and how many objects of each type were created,
+    updated or left unchanged. The result is written as a JSON run report and/or a
+    node_exporter textfile (see write_metrics()).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.phases = {}    # (fabric, phase) -> {'seconds', 'count'}
+        self.requests = {}  # (system, endpoint) -> {'count', 'errors', 'seconds', 'buckets'}
+        self.cache = {}     # (object_type, 'hit'|'miss') -> count
+        self.objects = {}   # (object_type, 'created'|'updated'|'unchanged'|'failed') -> count
+        self.success = None
+        self.profiler = None  # PhaseProfiler when --profile is given
+
+    @contextlib.contextmanager
+    def phase(self, name, fabric=''):
+        """Time the enclosed block as a phase of the run, repeated phases (daemon polls) add up."""
+        profiler = self.profiler if self.profiler and self.profiler.is_profiled(name) else None
+        if profiler:
+            profiler.start(name)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - start
+            if profiler:
+                profiler.stop()
+            with self.lock:
+                phase = self.phases.setdefault((fabric or '', name), {'seconds': 0.0, 'count': 0})
+                phase['seconds'] += elapsed
+                phase['count'] += 1
+
+    def observe_request(self, system, endpoint, latency, error=False):
+        """Record one API request to the fabric controller or NetBox."""
+        with self.lock:
+            request = self.requests.setdefault((system, endpoint), {'count': 0, 'errors': 0, 'seconds': 0.0, 'buckets': [0] * len(LATENCY_BUCKETS)})
+            request['count'] += 1
+            request['errors'] += 1 if error else 0
+            request['seconds'] += latency
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if latency <= bound:
+                    request['buckets'][index] += 1
+                    break
+
+    def observe_netbox_response(self, response, *args, **kwargs):
+        """requests response hook for the NetBox API session, counts the request under its endpoint (e.g. dcim/devices)."""
+        parts = [part for part in urlparse(response.url).path.split('/') if part]
+        endpoint = '/'.join(parts[parts.index('api') + 1:][:2]) if 'api' in parts else '/'.join(parts[:2])
+        self.observe_request('netbox', f"{response.request.method} {endpoint}", response.elapsed.total_seconds(), error=not response.ok)
+
+    def cache_lookup(self, object_type, hit):
+        self.increment(self.cache, (object_type, 'hit' if hit else 'miss'))
+
+    def object_outcome(self, object_type, outcome):
+        self.increment(self.objects, (object_type, outcome))
+
+    def increment(self, counters, key):
+        with self.lock:
+            counters[key] = counters.get(key, 0) + 1
+
+    def report(self):
+        """Return the metrics as a JSON serializable dict."""
+        with self.lock:
+            return {
+                'started': self.started,
+                'duration': time.time() - self.started,
+                'success': self.success,
+                'phases': [{'fabric': fabric, 'phase': name, **values} for (fabric, name), values in sorted(self.phases.items())],
+                'requests': [
+                    {'system': system, 'endpoint': endpoint, 'count': values['count'], 'errors': values['errors'], 'seconds': values['seconds'],
+                     'buckets': dict(zip([str(bound) for bound in LATENCY_BUCKETS], cumulative(values['buckets'])))}
+                    for (system, endpoint), values in sorted(self.requests.items())
+                ],
+                'cache': [{'object_type': object_type, 'result': result, 'count': count} for (object_type, result), count in sorted(self.cache.items())],
+                'objects': [{'object_type': object_type, 'outcome': outcome, 'count': count} for (object_type, outcome), count in sorted(self.objects.items())],
+            }
+
+    def textfile(self):
+        """Return the metrics in the Prometheus text format read by node_exporter's textfile collector."""
+        report = self.report()
+        lines = [
+            '# HELP fabric2dcim_run_start_timestamp_seconds Start time of the run.',
+            '# TYPE fabric2dcim_run_start_timestamp_seconds gauge',
+            f"fabric2dcim_run_start_timestamp_seconds {report['started']:.3f}",
+            '# HELP fabric2dcim_run_duration_seconds Duration of the run so far.',
+            '# TYPE fabric2dcim_run_duration_seconds gauge',
+            f"fabric2dcim_run_duration_seconds {report['duration']:.3f}",
+        ]
+        if report['success'] is not None:
+            lines += [
+                '# HELP fabric2dcim_run_success Whether the last sync succeeded.',
+                '# TYPE fabric2dcim_run_success gauge',
+                f"fabric2dcim_run_success {int(report['success'])}",
+            ]
+
+        lines += ['# HELP fabric2dcim_phase_duration_seconds Time spent in each phase of the run.',
+                  '# TYPE fabric2dcim_phase_duration_seconds gauge']
+        lines += [f"fabric2dcim_phase_duration_seconds{labels(fabric=phase['fabric'], phase=phase['phase'])} {phase['seconds']:.6f}" for phase in report['phases']]
+
+        lines += ['# HELP fabric2dcim_requests_total API requests per endpoint.',
+                  '# TYPE fabric2dcim_requests_total counter']
+        lines += [f"fabric2dcim_requests_total{labels(system=request['system'], endpoint=request['endpoint'])} {request['count']}" for request in report['requests']]
+        lines += ['# HELP fabric2dcim_request_errors_total Failed API requests per endpoint.',
+                  '# TYPE fabric2dcim_request_errors_total counter']
+        lines += [f"fabric2dcim_request_errors_total{labels(system=request['system'], endpoint=request['endpoint'])} {request['errors']}" for request in report['requests']]
+
+        lines += ['# HELP fabric2dcim_request_duration_seconds API request latency per endpoint.',
+                  '# TYPE fabric2dcim_request_duration_seconds histogram']
+        for request in report['requests']:
+            for bound, count in request['buckets'].items():
+                lines.append(f"fabric2dcim_request_duration_seconds_bucket{labels(system=request['system'], endpoint=request['endpoint'], le=bound)} {count}")
+            lines.append(f"fabric2dcim_request_duration_seconds_bucket{labels(system=request['system'], endpoint=request['endpoint'], le='+Inf')} {request['count']}")
+            lines.append(f"fabric2dcim_request_duration_seconds_sum{labels(system=request['system'], endpoint=request['endpoint'])} {request['seconds']:.6f}")
+            lines.append(f"fabric2dcim_request_duration_seconds_count{labels(system=request['system'], endpoint=request['endpoint'])} {request['count']}")
+
+        lines += ['# HELP fabric2dcim_cache_lookups_total NetBox cache lookups of create_or_update.',
+                  '# TYPE fabric2dcim_cache_lookups_total counter']
+        lines += [f"fabric2dcim_cache_lookups_total{labels(object_type=entry['object_type'], result=entry['result'])} {entry['count']}" for entry in report['cache']]
+
+        lines += ['# HELP fabric2dcim_objects_total NetBox objects created, updated or left unchanged.',
+                  '# TYPE fabric2dcim_objects_total counter']
+        lines += [f"fabric2dcim_objects_total{labels(object_type=entry['object_type'], outcome=entry['outcome'])} {entry['count']}" for entry in report['objects']]
+        return '\n'.join(lines) + '\n'
+
+
+def cumulative(counts):
+    total = 0
+    result = []
+    for count in counts:
+        total += count
+        result.append(total)
+    return result
+
+
+def labels(**values):
+    return '{' + ','.join(f'{key}="{escape(value)}"' for key, value in values.items()) + '}'
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# One set of metrics per process, like the request schedulers
+_metrics = RunMetrics()
+_write_lock = threading.Lock()  # Serializes write_metrics() of concurrent fabric threads
+
+
+def get_metrics():
+    return _metrics
+
+
+def write_metrics(config):
+    """Write the JSON run report, the node_exporter textfile and the phase profiles, if configured."""
+    # The fabric threads of a multi-fabric daemon write the same files after each of their polls
+    with _write_lock:
+        if config.get('metrics_file'):
+            write_atomic(config.get('metrics_file'), json.dumps(_metrics.report(), indent=2))
+        if config.get('metrics_textfile'):
+            # node_exporter may read the file at any time, it must never see a partial one
+            write_atomic(config.get('metrics_textfile'), _metrics.textfile())
+        if _metrics.profiler:
+            _metrics.profiler.write()
+
+
+def write_atomic(file_name, content):
+    temp_file_name = f"{file_name}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_file_name, 'w') as output_file:
+        output_file.write(content)
+    os.replace(temp_file_name, file_name)
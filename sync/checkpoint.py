@@ -0,0 +1,93 @@
+import os
+import json
+import hashlib
+from sync.snapshot_fingerprint import fabric_key
+
+CHECKPOINT_INTERVAL = 50  # Items written between progress saves, at most this many are repeated on resume
+
+
+class Checkpoint:
+    """
+    Progress of a sync run, kept next to the NetBox cache file until the run succeeds.
+
+    The data each write phase is about to write is saved before the phase starts and
+    the index of the last item written is saved as it goes, so --resume continues an
+    interrupted run from where it stopped without collecting or comparing again.
+    """
+
+    def __init__(self, config):
+        self.DEBUG = config.get('debug')
+        self.fabric_key = fabric_key(config)
+        cache_file_name = config.get('cache_file_name') or './netbox_cache.json'
+        self.checkpoint_file_name = f"{cache_file_name}.{hashlib.sha1(self.fabric_key.encode()).hexdigest()[:12]}.checkpoint"
+        self.state = {'fabric': self.fabric_key, 'completed': [], 'sections': [], 'progress': {}, 'fingerprints': {}}
+
+    def load(self):
+        """Load the checkpoint of an interrupted run of this fabric, returns False if there is none."""
+        state = read_json(f"{self.checkpoint_file_name}.json")
+        if not state or state.get('fabric') != self.fabric_key:
+            return False
+        self.state = state
+        return True
+
+    def is_completed(self, section):
+        return section in self.state['completed']
+
+    def section(self, section):
+        """Return (data, fingerprint, index of the next item to write) saved for a section, or None if it was never reached."""
+        if section not in self.state['sections']:
+            return None
+        data = read_json(f"{self.checkpoint_file_name}.{section}.json")
+        if data is None:
+            return None
+        return (data, self.state['fingerprints'].get(section), self.state['progress'].get(section, 0))
+
+    def start(self, section, data, fingerprint):
+        """Save the data a write phase is about to write, before the phase modifies it."""
+        write_json(f"{self.checkpoint_file_name}.{section}.json", data)
+        self.state['sections'].append(section)
+        self.state['fingerprints'][section] = fingerprint
+        self.state['progress'][section] = 0
+        self.save()
+
+    def advance(self, section, index):
+        """Record that every item of the section before index has been written."""
+        self.state['progress'][section] = index
+        if index % CHECKPOINT_INTERVAL == 0:
+            self.save()
+
+    def complete(self, section):
+        self.state['completed'].append(section)
+        self.save()
+
+    def save(self):
+        write_json(f"{self.checkpoint_file_name}.json", self.state)
+
+    def clear(self):
+        """Remove the checkpoint once the run succeeded."""
+        for section in self.state['sections']:
+            remove(f"{self.checkpoint_file_name}.{section}.json")
+        remove(f"{self.checkpoint_file_name}.json")
+        self.state = {'fabric': self.fabric_key, 'completed': [], 'sections': [], 'progress': {}, 'fingerprints': {}}
+
+
+def read_json(file_name):
+    try:
+        with open(file_name, 'r') as json_file:
+            return json.load(json_file)
+    except (OSError, ValueError):
+        return None
+
+
+def write_json(file_name, data):
+    temp_file_name = f"{file_name}.{os.getpid()}.tmp"
+    with open(temp_file_name, 'w') as json_file:
+        json.dump(data, json_file)
+    os.replace(temp_file_name, file_name)
+
+
+def remove(file_name):
+    try:
+        os.remove(file_name)
+    except OSError:
+        pass
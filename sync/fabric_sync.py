@@ -0,0 +1,584 @@
+import re
+import copy
+import time
+import queue
+import threading
+from dcim.netbox_manager import NetBoxManager
+from concurrent.futures import ThreadPoolExecutor
+from sync.checkpoint import Checkpoint
+from metrics.run_metrics import get_metrics, write_metrics
+from sync.snapshot_fingerprint import SECTIONS, fingerprint_sections, combine_fingerprints, hash_items, FingerprintStore, SectionHasher
+from metrics.run_log import get_logger, SAMPLED
+from sync.site_hierarchy import SiteHierarchy
+
+log = get_logger(__name__)
+
+
+class FabricSync:
+    """
+    Collects inventory from a network fabric and writes it to NetBox.
+
+    A sync is split into concurrent collection phases, one per inventory section,
+    and write phases that push each section to NetBox once collected. The last
+    snapshot is kept so daemon mode only pushes what changed since the previous poll.
+    """
+
+    def __init__(self, config, ip_manager, fabric, manufacturer, netbox_manager=None, shared_netbox=None):
+        self.config = config
+        self.ip_manager = ip_manager
+        self.fabric = fabric
+        self.manufacturer = manufacturer
+        self.fabric_type = self.config.get('fabric_type').lower()
+        self.DEBUG = self.config.get('debug')
+        self.netbox_manager = netbox_manager
+        self.shared_netbox = shared_netbox  # NetBox client and cache shared with other fabrics in multi-fabric mode
+        self.previous = None  # Snapshot written by the last sync
+        self.fingerprint_store = FingerprintStore(self.config)
+        self.force = self.config.get('force_sync')  # Write every section even if its fingerprint is unchanged
+        self.vc_id = None
+        self.site_ids = {}      # Site name -> id, set by sync_sites() for the device phase
+        self.location_ids = {}  # Site name -> location name -> id
+        self.checkpoint = None  # Checkpoint of the running sync, see run()
+        self.queue_depth = int(self.config.get('queue_depth') or 500)  # Items buffered per section in streaming mode
+
+    def get_netbox_manager(self):
+        """Return the NetBoxManager, connecting (and loading the NetBox cache) on first use."""
+        if self.netbox_manager is None:
+            self.netbox_manager = NetBoxManager(self.config, self.ip_manager, self.shared_netbox)
+            log.info(f"Connected to netbox API at {self.config.get('netbox_url')}")
+        return self.netbox_manager
+
+    def run(self, resume=False):
+        """
+        Collect a snapshot from the fabric and write it (or just its changes) to NetBox.
+
+        Every inventory phase is started at once by collect() and each write phase
+        only waits for the phase it writes, so devices are written while interfaces
+        and cables are still being collected. Sections whose fingerprint matches the
+        last successful sync are skipped, NetBox is not contacted at all when the
+        fabric has not changed.
+
+        Progress is checkpointed. With resume an interrupted run continues from its
+        checkpoint, reusing the saved data of every section it had reached.
+        """
+        stored = {} if self.force else self.fingerprint_store.load()
+        self.checkpoint = Checkpoint(self.config)
+        if resume and not self.checkpoint.load():
+            log.info('No checkpoint to resume from, running a full sync')
+            resume = False
+        snapshot = {}
+        previous = {}
+        written = []
+
+        # Sections the interrupted run already reached are neither collected nor compared again
+        saved = {section: self.checkpoint.section(section) for section in SECTIONS} if resume else {}
+        pending = [section for section in SECTIONS if not self.checkpoint.is_completed(section) and not saved.get(section)]
+
+        with ThreadPoolExecutor(max_workers=len(SECTIONS)) as executor:
+            phases = self.collect(executor, pending)
+            for section in SECTIONS:
+                if self.checkpoint.is_completed(section):
+                    log.info(f"Resuming after completed section {section}")
+                    continue
+
+                if saved.get(section):
+                    (changes, fingerprint, start) = saved[section]
+                    log.info(f"Resuming {section} at item {start}")
+                else:
+                    prepared = self.prepare_section(section, phases[section].result(), stored, snapshot, previous)
+                    if prepared is None:
+                        continue
+                    (changes, fingerprint) = prepared
+                    start = 0
+
+                try:
+                    with self.phase(f"write_{section}"):
+                        self.write(section, changes, start)
+                except Exception:
+                    self.checkpoint.save()
+                    self.checkpoint_collected(phases, stored, snapshot, previous)
+                    raise
+                self.fingerprint_store.save(section, fingerprint)
+                self.checkpoint.complete(section)
+                written.append(section)
+
+        self.checkpoint.clear()
+        if not written:
+            log.info('Fabric unchanged since the last successful sync, nothing to do')
+        elif len(written) < len(SECTIONS) and not resume:
+            log.info(f"Skipped unchanged sections: {', '.join(section for section in SECTIONS if section not in written)}")
+        # A resumed run only saw part of the fabric, the next daemon poll compares against nothing
+        self.previous = None if resume else previous
+        self.fabric.print_request_stats()
+
+    def prepare_section(self, section, result, stored, snapshot, previous):
+        """
+        Turn a collected phase result into the changes to write and checkpoint them.
+
+        Returns:
+            (changes, fingerprint), or None if the section is unchanged since the last successful sync.
+        """
+        current = {key: result[key] for key in SECTIONS[section]}
+        snapshot.update(current)
+        fingerprint = fingerprint_sections(current)[section]
+
+        # Keep an untouched copy, the write phases modify the dicts they are given.
+        # It only replaces the previous snapshot once every write succeeded, so failed changes are retried.
+        previous.update(copy.deepcopy(current))
+        if stored.get(section) == fingerprint:
+            self.checkpoint.complete(section)
+            return None
+
+        changes = self.changes(current, self.previous)
+        if section == 'devices':
+            # Virtual chassis positions follow the order of the full device list, not just the changes
+            changes['positions'] = {device['name']: position for position, device in enumerate(snapshot['devices'], start=1)}
+        self.checkpoint.start(section, changes, fingerprint)
+        return (changes, fingerprint)
+
+    def checkpoint_collected(self, phases, stored, snapshot, previous):
+        """After a failed write, checkpoint every section collected but not reached yet so resume collects nothing."""
+        for section, phase in phases.items():
+            if self.checkpoint.is_completed(section) or section in self.checkpoint.state['sections']:
+                continue
+            try:
+                self.prepare_section(section, phase.result(), stored, snapshot, previous)
+            except Exception as e:
+                log.warning(f"Could not checkpoint {section}: {e}")
+
+    def advance(self, section, index):
+        """Record write progress in the checkpoint of the running sync."""
+        if self.checkpoint is not None:
+            self.checkpoint.advance(section, index)
+
+    def phase(self, name):
+        """Time a phase of this fabric's sync in the run metrics."""
+        return get_metrics().phase(name, self.config.get('fabric_url'))
+
+    def run_pipeline(self):
+        """
+        Stream the fabric inventory into NetBox.
+
+        Devices, interfaces and connections are pulled from the fabric's iter_*
+        generators by producer threads into bounded queues while this thread writes
+        them, so collection and NetBox writes overlap and at most queue_depth items
+        per section are held in memory. Each site hierarchy is created when the first
+        device carrying it arrives. Section fingerprints are built as the items pass
+        through, but nothing can be skipped since a section is only known once it has
+        been written.
+        """
+        log.info('Streaming Fabric inventory to NetBox')
+        hashers = {key: SectionHasher() for key in ['devices', 'interfaces', 'connections']}
+        failed = set()
+
+        # Producers start right away and block once their queue is full
+        interfaces = stream(self.fabric.iter_interfaces(), self.queue_depth)
+        connections = stream(self.fabric.iter_connections(), self.queue_depth)
+        devices = stream(self.fabric.iter_devices(), self.queue_depth)
+
+        # Only errors of the fabric producers end a section early, NetBox write errors end the run like in run()
+        # Device names and site hierarchies are all that is kept of the devices, for the VLAN collection
+        names = []
+        sites = {}  # Serial number -> site hierarchy
+        hierarchies = set()
+        with self.phase('write_devices'):
+            if self.fabric_type != 'cisco-dnac':
+                self.sync_fabric_chassis()
+            try:
+                for device in devices:
+                    device_interfaces = device.pop('interfaces', None)
+
+                    # A site hierarchy is created when its first device arrives
+                    hierarchy = device.pop('site_hierarchy', None)
+                    if hierarchy:
+                        sites[device.get('serial')] = hierarchy
+                        if hierarchy not in hierarchies:
+                            hierarchies.add(hierarchy)
+                            self.sync_sites([hierarchy])
+                    hashers['devices'].update(device)
+                    names.append(device['name'])
+                    self.write_device(device, len(names))
+
+                    # Interfaces that arrive with their device are written while the device is current
+                    if device_interfaces:
+                        switch = {'name': device['name'], 'interfaces': device_interfaces}
+                        hashers['interfaces'].update(switch)
+                        self.write_interfaces(switch)
+            except FabricStreamError as e:
+                log.error(f"Error streaming devices from Fabric: {e}")
+                failed.add('devices')
+        hashers['sites'] = hash_items(sorted(hierarchies))
+
+        with self.phase('write_interfaces'):
+            try:
+                for switch in interfaces:
+                    hashers['interfaces'].update(switch)
+                    self.write_interfaces(switch)
+            except FabricStreamError as e:
+                log.error(f"Error streaming interfaces from Fabric: {e}")
+                failed.add('interfaces')
+            if hashers['interfaces'].digests:
+                self.get_netbox_manager().update_device_with_primary_ips()
+
+        with self.phase('collect_network'):
+            network = self.fabric.get_network_inventory()
+        hashers['network'] = hash_items([network])
+
+        (vlans, prefixes) = ({}, {})
+        if hasattr(self.fabric, 'get_vlan_inventory'):
+            with self.phase('collect_vlans'):
+                (vlans, prefixes) = self.fabric.get_vlan_inventory([{'name': name} for name in names], sites)
+        hashers['vlans'] = hash_items(vlans.values())
+        hashers['prefixes'] = hash_items(prefixes.values())
+        with self.phase('write_vlans'):
+            self.sync_vlans(list(vlans.values()), list(prefixes.values()))
+
+        with self.phase('write_connections'):
+            try:
+                for cable in connections:
+                    hashers['connections'].update(cable)
+                    self.sync_connections([cable])
+            except FabricStreamError as e:
+                log.error(f"Error streaming connections from Fabric: {e}")
+                failed.add('connections')
+
+        log.info(f"Streamed {len(names)} devices, {len(hashers['interfaces'].digests)} interface lists "
+              f"and {len(hashers['connections'].digests)} cables")
+
+        # A later snapshot run can then skip what this run wrote
+        for section, fingerprint in combine_fingerprints(hashers).items():
+            if section not in failed:
+                self.fingerprint_store.save(section, fingerprint)
+        self.fabric.print_request_stats()
+
+    def run_daemon(self, interval, resume=False):
+        """Keep the fabric client and NetBox cache resident and sync every interval seconds."""
+        while True:
+            start = time.monotonic()
+            try:
+                self.run(resume)
+                resume = False
+                get_metrics().success = True
+            except Exception as e:
+                log.error(f"Sync failed, retrying next interval: {e}")
+                get_metrics().success = False
+            # Metrics add up over the polls, the report and textfile are refreshed after each one
+            try:
+                write_metrics(self.config)
+            except Exception as e:
+                log.error(f"Writing metrics failed: {e}")
+            wait = max(0, interval - (time.monotonic() - start))
+            log.info(f"Sync took {time.monotonic() - start:.1f}s, next sync in {wait:.0f}s")
+            time.sleep(wait)
+
+    def collect(self, executor, sections=None):
+        """
+        Start the inventory phases of the given sections (default all) concurrently.
+
+        The controller queries are independent, the interface and VLAN phases need
+        the device list and wait for it. Each phase returns a dict holding the
+        snapshot keys of its section (see SECTIONS).
+
+        Returns:
+            dict: section name -> Future of the phase result.
+        """
+        sections = list(SECTIONS) if sections is None else sections
+        phases = {}
+        if set(sections) & {'devices', 'interfaces', 'vlans'}:
+            phases['devices'] = executor.submit(self.collect_devices)
+        if 'interfaces' in sections:
+            phases['interfaces'] = executor.submit(self.collect_interfaces, phases['devices'])
+        if 'network' in sections:
+            phases['network'] = executor.submit(self.collect_network)
+        if 'vlans' in sections:
+            phases['vlans'] = executor.submit(self.collect_vlans, phases['devices'])
+        if 'connections' in sections:
+            phases['connections'] = executor.submit(self.collect_connections)
+        return phases
+
+    def collect_snapshot(self):
+        """Collect every section and wait for all of them, returns the full snapshot."""
+        snapshot = {}
+        with ThreadPoolExecutor(max_workers=len(SECTIONS)) as executor:
+            phases = self.collect(executor)
+            for section, keys in SECTIONS.items():
+                result = phases[section].result()
+                snapshot.update({key: result[key] for key in keys})
+        return snapshot
+
+    def collect_devices(self):
+        log.info('Collecting Devices from Fabric')
+        with self.phase('collect_devices'):
+            result = self.fabric.get_device_inventory() or []
+        (devices, sites) = result if isinstance(result, tuple) else (result, {})
+
+        # Fabrics that return interfaces with their devices get them moved to the interface section
+        interfaces = []
+        for device in devices:
+            device_interfaces = device.pop('interfaces', None)
+            if device_interfaces:
+                interfaces.append({'name': device['name'], 'interfaces': device_interfaces})
+
+        return {
+            'sites': sorted(set(hierarchy for hierarchy in sites.values() if hierarchy)),
+            'devices': devices,
+            'site_map': sites,
+            'device_names': [device['name'] for device in devices],  # The devices themselves are modified while written
+            'device_interfaces': interfaces,
+        }
+
+    def collect_interfaces(self, devices):
+        log.info('Collecting Interfaces from Fabric')
+        with self.phase('collect_interfaces'):
+            interfaces = self.fabric.get_interface_inventory() or []
+        return {'interfaces': devices.result()['device_interfaces'] + interfaces}
+
+    def collect_network(self):
+        log.info('Collecting Network Topology from Fabric')
+        with self.phase('collect_network'):
+            return {'network': self.fabric.get_network_inventory()}
+
+    def collect_vlans(self, devices):
+        (vlans, prefixes) = ({}, {})
+        if hasattr(self.fabric, 'get_vlan_inventory'):
+            result = devices.result()
+            log.info('Fetching L2/L3 Information')
+            with self.phase('collect_vlans'):
+                (vlans, prefixes) = self.fabric.get_vlan_inventory([{'name': name} for name in result['device_names']], result['site_map'])
+        return {'vlans': list(vlans.values()), 'prefixes': list(prefixes.values())}
+
+    def collect_connections(self):
+        log.info('Collecting Connections from Fabric')
+        with self.phase('collect_connections'):
+            return {'connections': self.fabric.get_connection_inventory() or []}
+
+    def changes(self, current, previous):
+        """
+        Reduce the sections of a snapshot to what differs from the previous one.
+
+        Devices, interfaces, VLANs, prefixes and cables are compared by identity key
+        and value, everything is returned when there is no previous snapshot.
+        """
+        if previous is None:
+            return current
+
+        changes = dict(current)
+        if 'sites' in current:
+            changes['sites'] = [site for site in current['sites'] if site not in previous['sites']]
+
+        for section, key in [('devices', device_key), ('vlans', vlan_key), ('prefixes', prefix_key), ('connections', connection_key)]:
+            if section not in current:
+                continue
+            old = {key(item): item for item in previous[section]}
+            changes[section] = [item for item in current[section] if old.get(key(item)) != item]
+            log.info(f"Changes since last sync: {len(changes[section])} {section}")
+
+        if 'interfaces' in current:
+            old = {interface_key(interface): interface for switch in previous['interfaces'] for interface in switch['interfaces']}
+            changes['interfaces'] = []
+            for switch in current['interfaces']:
+                changed = [interface for interface in switch['interfaces'] if old.get(interface_key(interface)) != interface]
+                if changed:
+                    changes['interfaces'].append(dict(switch, interfaces=changed))
+            log.info(f"Changes since last sync: {sum(len(switch['interfaces']) for switch in changes['interfaces'])} interfaces")
+        return changes
+
+    def write(self, section, changes, start=0):
+        """Run the NetBox write phase of one section for its (possibly reduced) snapshot, from item start on."""
+        if section == 'devices':
+            if self.fabric_type != 'cisco-dnac':
+                self.sync_fabric_chassis()
+
+            self.sync_sites(changes['sites'])
+            self.sync_devices(changes['devices'], changes['positions'], start)
+        elif section == 'interfaces':
+            self.sync_interfaces(changes['interfaces'], start)
+        elif section == 'vlans':
+            self.sync_vlans(changes['vlans'], changes['prefixes'])
+        elif section == 'connections':
+            self.sync_connections(changes['connections'], start)
+        # Nothing is written for the network section yet
+
+    def sync_fabric_chassis(self):
+        """Create the Virtual Chassis and Controller device that represent the fabric (once per process)."""
+        if self.vc_id is not None:
+            return
+        netbox_manager = self.get_netbox_manager()
+
+        # Create Virtual Chassis to represent Fabric
+        controller = {}
+        vc={}
+        vc['name'] = self.config.get('fabric_name') or (self.config.get('fabric_type').upper()+'-'+re.sub(r'http[s]*\:\/\/([0-9A-z]*)\.*.*',r'\1',self.config.get('fabric_url').lower())).upper()
+        log.info(f"Creating/Updating Virtual Chassis and Controller {vc['name']} for Fabric")
+
+        # Create Virtual Device to represent Fabric Controller
+        controller['name'] = vc['name']+" Controller"
+        controller['device_type'] = {'model': 'Fabric Controller'}
+        controller['manufacturer']= {'name': self.manufacturer}
+        controller['role']={'name': 'Network Fabric Controller'}
+        controller['status']='active'
+        controller['site']={'name': self.config.get('netbox_site')}
+
+        # Create virtual chassis and get id to use for controllers virtual chassis
+        self.vc_id = netbox_manager.create_virtual_chassis(vc)['id']
+        controller['virtual_chassis']=self.vc_id
+        controller['vc_position']=0
+        controller['vc_priority']=0
+
+        # Create controller and take id to set master on virtual chassis
+        controller = netbox_manager.create_device(controller)
+        vc['master']=controller['id']
+        netbox_manager.create_virtual_chassis(vc)
+
+    def sync_sites(self, sites):
+        """Create the site groups, sites and locations of the site hierarchies (Global/Group/Site/Location)."""
+        if not sites:
+            return
+        netbox_manager = self.get_netbox_manager()
+
+        (site_ids, location_ids) = SiteHierarchy(sites).build(netbox_manager)
+        # Daemon mode passes only new hierarchies, keep the ids of the earlier ones
+        self.site_ids.update(site_ids)
+        for site, locations in location_ids.items():
+            self.location_ids.setdefault(site, {}).update(locations)
+
+    def sync_devices(self, devices, positions, start=0):
+        """Create or update each device, fabric switches become members of the fabric's virtual chassis."""
+        if len(devices) <= start:
+            return
+        netbox_manager = self.get_netbox_manager()
+
+        log.info(f"{len(devices)} devices returned")
+        counter=start
+        for switch in devices[start:]:
+            counter += 1
+            self.write_device(switch, positions[switch['name']], counter)
+            self.advance('devices', counter)
+
+    def write_device(self, switch, position, counter=None):
+        """Create or update a single device, position is its slot in the fabric's virtual chassis."""
+        netbox_manager = self.get_netbox_manager()
+
+        log.info("Processing #%s %s", counter or position, switch['name'], extra=SAMPLED)
+        netbox_manager.create_device(self.prepare_device(switch, position))
+
+    def prepare_device(self, switch, position):
+        """Fabric switches become members of the fabric's virtual chassis at the fabric's NetBox site."""
+        if self.fabric_type != 'cisco-dnac':
+            switch['virtual_chassis']=self.vc_id
+            switch['vc_position']=position
+            switch['vc_priority']=0
+            switch['site']={'name': self.config.get('netbox_site')}
+        elif isinstance(switch.get('site'), dict) and switch['site'].get('name') in self.site_ids:
+            # Sites and locations were created by sync_sites(), set their ids instead of looking them up per device
+            site = switch['site']['name']
+            switch['site'] = self.site_ids[site]
+            location = self.location_ids.get(site, {}).get((switch.get('location') or {}).get('name'))
+            if location is not None:
+                switch['location'] = location
+        return switch
+
+    def sync_interfaces(self, interfaces, start=0):
+        """Create or update interfaces, then set the primary IPs that depend on them."""
+        if len(interfaces) <= start:
+            return
+        netbox_manager = self.get_netbox_manager()
+
+        for index, switch in enumerate(interfaces[start:], start=start + 1):
+            self.write_interfaces(switch)
+            self.advance('interfaces', index)
+
+        log.debug('Setting Primary IPs on Devices')
+        netbox_manager.update_device_with_primary_ips()
+
+    def write_interfaces(self, switch):
+        """Create or update the interfaces of one switch."""
+        netbox_manager = self.get_netbox_manager()
+
+        log.info('Creating %d Interfaces for %s', len(switch["interfaces"]), switch["name"], extra=SAMPLED)
+        for interface in switch['interfaces']:
+            netbox_manager.create_interface(interface)
+
+    def sync_vlans(self, vlans, prefixes):
+        """Create or update VLANs and prefixes."""
+        if not vlans and not prefixes:
+            return
+        netbox_manager = self.get_netbox_manager()
+
+        # if VNI create VTEP Loopback Interfaces, add vlans and add vni links as l2vpn
+        # Create VLAN Layer3 interfaces and assign IPs if ip assigned
+        # if Virtual-IP create FHRP Group
+        for vlan in vlans:
+            log.info("Creating or Updating Vlan %s %s", vlan['vid'], vlan['name'], extra=SAMPLED)
+            netbox_manager.create_or_update('vlans','vid',vlan['vid'],vlan)
+
+        for prefix in prefixes:
+            log.info("Creating or Updating Prefix %s %s", prefix['prefix'], prefix['name'], extra=SAMPLED)
+            netbox_manager.create_or_update('prefixes','prefix',prefix['prefix'],prefix)
+
+    def sync_connections(self, connections, start=0):
+        """Create cables between devices."""
+        if len(connections) <= start:
+            return
+        netbox_manager = self.get_netbox_manager()
+
+        for index, cable in enumerate(connections[start:], start=start + 1):
+           log.info('Processing cable between %s and %s', cable["src-device"], cable["dst-device"], extra=SAMPLED)
+           netbox_manager.create_connection(cable)
+           self.advance('connections', index)
+
+
+class FabricStreamError(Exception):
+    """Raised by a stream() generator when its fabric iterator failed, the iterator's exception is the cause."""
+
+
+def stream(items, depth):
+    """
+    Run an iterator in a producer thread behind a bounded queue.
+
+    Returns a generator over the same items. The producer blocks once depth items
+    are waiting to be consumed, an exception raised while producing is re-raised
+    to the consumer as a FabricStreamError after the items that were produced
+    before it, errors of the consumer's own work stay apart.
+    """
+    buffer = queue.Queue(maxsize=depth)
+    end = object()
+    errors = []
+
+    def produce():
+        try:
+            for item in items:
+                buffer.put(item)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            buffer.put(end)
+
+    threading.Thread(target=produce, daemon=True).start()
+
+    def consume():
+        while True:
+            item = buffer.get()
+            if item is end:
+                break
+            yield item
+        if errors:
+            raise FabricStreamError(str(errors[0])) from errors[0]
+
+    return consume()
+
+
+def device_key(device):
+    return device['name']
+
+def interface_key(interface):
+    return (interface['device']['name'], interface['name'])
+
+def vlan_key(vlan):
+    return vlan['vid']
+
+def prefix_key(prefix):
+    return prefix['prefix']
+
+def connection_key(cable):
+    return (cable['src-device'], cable['src-interface'], cable['dst-device'], cable['dst-interface'])
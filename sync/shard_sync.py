@@ -0,0 +1,278 @@
+import os
+import copy
+import json
+import time
+import uuid
+import zlib
+import multiprocessing
+from collections.abc import Mapping
+from dcim.ip_manager import IPManager
+from sync.fabric_sync import FabricSync
+from sync.snapshot_fingerprint import fingerprint_sections
+from metrics.run_log import get_logger, setup_logging
+
+log = get_logger(__name__)
+
+# Shards write devices, interfaces and VLANs first, cables only once every shard has created its interfaces
+STAGES = ['devices', 'connections']
+SHARD_TIMEOUT = 6 * 3600  # Seconds the coordinator and the shards wait for each other
+POLL_INTERVAL = 2
+
+# Options of the coordinator's fabric handed to the shards in the ready file
+FABRIC_OPTIONS = ['fabric_type', 'fabric_url', 'fabric_name', 'netbox_site']
+
+
+def shard_of(key, shards):
+    """Stable shard number of a device name or VLAN id, the same on every host and run."""
+    return zlib.crc32(str(key).encode()) % shards
+
+
+def link_key(cable):
+    """The same key for a link reported from either end (A->B and B->A)."""
+    return min((cable['src-device'], cable['src-interface']), (cable['dst-device'], cable['dst-interface']))
+
+
+def unique_links(connections):
+    """Keep one direction of each link, shards writing both at once would both create its cable."""
+    links = {}
+    for cable in connections:
+        links.setdefault(link_key(cable), cable)
+    return list(links.values())
+
+
+class ShardCoordinator:
+    """
+    Splits the NetBox writes of one fabric sync over several worker processes or hosts.
+
+    The coordinator collects the fabric once and creates everything devices share
+    (fabric virtual chassis, sites, roles, manufacturers, device types, platforms and
+    placeholder devices at the far end of cables). The snapshot and a NetBox cache
+    holding those objects are handed to the shards through the work directory. Each
+    shard writes the devices whose name hashes to it and leaves a journal of the cache
+    entries it created, the journals are merged before the next stage and into the
+    NetBox cache file at the end.
+    """
+
+    def __init__(self, config, fabric_sync):
+        self.config = config
+        self.fabric_sync = fabric_sync
+        self.DEBUG = self.config.get('debug')
+        self.shards = int(self.config.get('shards'))
+        local_shards = self.config.get('local_shards')
+        self.local_shards = self.shards if local_shards is None else int(local_shards)  # The rest run on other hosts with --shard-index
+        self.work_dir = self.config.get('work_dir') or './fabric2dcim-work'
+        self.run_id = uuid.uuid4().hex
+
+    def run(self):
+        fabric_sync = self.fabric_sync
+        snapshot = fabric_sync.collect_snapshot()
+        fingerprints = fingerprint_sections(snapshot)
+        stored = {} if fabric_sync.force else fabric_sync.fingerprint_store.load()
+        if all(stored.get(section) == fingerprint for section, fingerprint in fingerprints.items()):
+            log.info('Fabric unchanged since the last successful sync, nothing to do')
+            return
+
+        snapshot['connections'] = unique_links(snapshot['connections'])
+        self.prepare_work_dir()
+        try:
+            self.write_stages(snapshot, fingerprints)
+        finally:
+            # Shards started after this run must not pick up its stages
+            self.remove_work_files(('.ready',))
+
+    def write_stages(self, snapshot, fingerprints):
+        """Hand the snapshot to the shards stage by stage and merge their journals into the NetBox cache."""
+        fabric_sync = self.fabric_sync
+        write_json(os.path.join(self.work_dir, 'snapshot.json'), snapshot)
+
+        netbox_manager = fabric_sync.get_netbox_manager()
+        self.resolve_shared(snapshot)
+        cache = netbox_manager.netbox_cache
+
+        processes = self.start_local_shards()
+        try:
+            for stage in STAGES:
+                write_json(os.path.join(self.work_dir, f"cache.{stage}.json"), cache)
+                write_json(os.path.join(self.work_dir, f"{stage}.ready"), {
+                    'run_id': self.run_id,
+                    # Shards on other hosts are started without the fabric's options, they sync as the coordinator's fabric
+                    'fabric': {key: self.config.get(key) for key in FABRIC_OPTIONS},
+                    'vc_id': fabric_sync.vc_id,
+                    'manufacturer': fabric_sync.manufacturer,
+                    'site_ids': fabric_sync.site_ids,
+                    'location_ids': fabric_sync.location_ids,
+                })
+                log.info(f"Waiting for {self.shards} shards to write {stage}")
+                for journal in self.wait_for_journals(stage, processes):
+                    for object_type, entries in journal.items():
+                        for cache_key, entry in entries.items():
+                            netbox_manager.nb_cacher.add(object_type, cache_key, entry)
+        except Exception:
+            for process in processes:
+                process.terminate()
+            raise
+        for process in processes:
+            process.join()
+
+        # Leave the merged cache for the next run
+        write_json(netbox_manager.nb_cacher.cache_file_name, cache)
+        for section, fingerprint in fingerprints.items():
+            fabric_sync.fingerprint_store.save(section, fingerprint)
+        log.info(f"Sharded sync finished, {self.shards} shards merged")
+        fabric_sync.fabric.print_request_stats()
+
+    def prepare_work_dir(self):
+        """Create the work directory and remove what a previous run left behind."""
+        os.makedirs(self.work_dir, exist_ok=True)
+        self.remove_work_files(('.ready', '.json', '.mmap'))
+
+    def remove_work_files(self, suffixes):
+        for file_name in os.listdir(self.work_dir):
+            if file_name.endswith(suffixes):
+                os.remove(os.path.join(self.work_dir, file_name))
+
+    def resolve_shared(self, snapshot):
+        """Create the objects several shards would otherwise race to create."""
+        fabric_sync = self.fabric_sync
+        netbox_manager = fabric_sync.get_netbox_manager()
+        if fabric_sync.fabric_type != 'cisco-dnac':
+            fabric_sync.sync_fabric_chassis()
+        fabric_sync.sync_sites(snapshot['sites'])
+
+        # Devices mostly share a handful of role/type/platform/site combinations
+        resolved = set()
+        for position, device in enumerate(snapshot['devices'], start=1):
+            device = fabric_sync.prepare_device(copy.deepcopy(device), position)
+            dependencies = json.dumps([device.get(key) for key in ['role', 'device_type', 'platform', 'site']], sort_keys=True, default=str)
+            if dependencies not in resolved:
+                resolved.add(dependencies)
+                netbox_manager.resolve_device_dependencies(device)
+
+        names = set(device['name'] for device in snapshot['devices'])
+        for cable in snapshot['connections']:
+            for end in ['src-device', 'dst-device']:
+                if cable[end] not in names:
+                    names.add(cable[end])
+                    netbox_manager.get_or_create_device(cable[end])
+
+    def start_local_shards(self):
+        context = multiprocessing.get_context('spawn')
+        processes = []
+        # Shards would overwrite the coordinator's run report
+        config = dict(getattr(self.config, 'config', self.config), metrics_file=None, metrics_textfile=None)
+        for index in range(self.local_shards):
+            process = context.Process(target=run_shard, args=(config, index), daemon=True)
+            process.start()
+            processes.append(process)
+        return processes
+
+    def wait_for_journals(self, stage, processes):
+        """Wait until every shard has written its journal for the stage, returns the journals."""
+        deadline = time.monotonic() + SHARD_TIMEOUT
+        journals = {}
+        while len(journals) < self.shards:
+            for index in range(self.shards):
+                journal = read_json(journal_file_name(self.work_dir, stage, index))
+                if index not in journals and journal and journal.get('run_id') == self.run_id:
+                    journals[index] = journal['journal']
+                    log.debug(f"Shard {index} finished {stage}")
+
+            failed = [index for index, process in enumerate(processes) if process.exitcode not in (None, 0) and index not in journals]
+            if failed:
+                raise RuntimeError(f"Shards {failed} failed during {stage}")
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Shards {sorted(set(range(self.shards)) - set(journals))} did not finish {stage}")
+            if len(journals) < self.shards:
+                time.sleep(POLL_INTERVAL)
+        return [journals[index] for index in range(self.shards)]
+
+
+def run_shard(config, index):
+    """
+    Run one shard: write the devices, interfaces, VLANs and cables it owns.
+
+    Used for the coordinator's local worker processes and by --shard-index on other
+    hosts sharing the work directory. Shards never talk to the fabric.
+    """
+    setup_logging(config)  # No-op unless this is a spawned local shard process
+    work_dir = config.get('work_dir') or './fabric2dcim-work'
+    shards = int(config.get('shards'))
+    run_id = None
+
+    for stage in STAGES:
+        # A stage left by a coordinator that died is skipped once this shard has journaled it
+        journaled = None if run_id else (read_json(journal_file_name(work_dir, stage, index)) or {}).get('run_id')
+        ready = wait_for_ready(os.path.join(work_dir, f"{stage}.ready"), run_id, journaled)
+        run_id = ready['run_id']
+        log.info(f"Shard {index}/{shards} writing {stage}")
+
+        # The stage cache is always loaded from the work directory, never from NetBox
+        shard_config = dict(config, **ready['fabric'], cache_file_name=os.path.join(work_dir, f"cache.{stage}.json"), cache_time=SHARD_TIMEOUT * 100)
+        fabric_sync = FabricSync(shard_config, IPManager(), None, ready['manufacturer'])
+        fabric_sync.vc_id = ready['vc_id']
+        (fabric_sync.site_ids, fabric_sync.location_ids) = (ready.get('site_ids', {}), ready.get('location_ids', {}))
+        netbox_manager = fabric_sync.get_netbox_manager()
+        base = copy.deepcopy(netbox_manager.netbox_cache)
+
+        snapshot = read_json(os.path.join(work_dir, 'snapshot.json'))
+        if stage == 'devices':
+            positions = {device['name']: position for position, device in enumerate(snapshot['devices'], start=1)}
+            fabric_sync.sync_devices([device for device in snapshot['devices'] if shard_of(device['name'], shards) == index], positions)
+            fabric_sync.sync_interfaces([switch for switch in snapshot['interfaces'] if shard_of(switch['name'], shards) == index])
+            fabric_sync.sync_vlans([vlan for vlan in snapshot['vlans'] if shard_of(vlan['vid'], shards) == index],
+                                   [prefix for prefix in snapshot['prefixes'] if shard_of(prefix['prefix'], shards) == index])
+        elif stage == 'connections':
+            fabric_sync.sync_connections([cable for cable in snapshot['connections'] if shard_of(link_key(cable), shards) == index])
+
+        write_json(journal_file_name(work_dir, stage, index), {'run_id': run_id, 'journal': cache_changes(base, netbox_manager.netbox_cache)})
+
+
+def wait_for_ready(file_name, run_id=None, done_run_id=None):
+    """Wait for the coordinator to publish a stage, of the given run if one is known and not of the run already done."""
+    deadline = time.monotonic() + SHARD_TIMEOUT
+    while time.monotonic() < deadline:
+        ready = read_json(file_name)
+        if ready and (run_id is None or ready.get('run_id') == run_id) and (done_run_id is None or ready.get('run_id') != done_run_id):
+            return ready
+        time.sleep(POLL_INTERVAL)
+    raise TimeoutError(f"Coordinator did not publish {file_name}")
+
+
+def cache_changes(base, cache):
+    """Cache entries created or changed since base, per object type."""
+    changes = {}
+    for object_type, entries in cache.items():
+        if not isinstance(entries, Mapping):
+            continue
+        old = base.get(object_type, {})
+        # A shared cache snapshot is never written, only the entries in its overlay can have changed
+        entries = getattr(entries, 'overlay', entries)
+        changed = {key: serialize(entry) for key, entry in entries.items() if key not in old or serialize(entry) != serialize(old[key])}
+        if changed:
+            changes[object_type] = changed
+    return changes
+
+
+def journal_file_name(work_dir, stage, index):
+    return os.path.join(work_dir, f"journal.{stage}.{index}.json")
+
+
+def serialize(entry):
+    """Plain dict of a cached NetBox object, newly created objects are pynetbox records."""
+    return entry.serialize() if hasattr(entry, 'serialize') else entry
+
+
+def read_json(file_name):
+    try:
+        with open(file_name, 'r') as json_file:
+            return json.load(json_file)
+    except (OSError, ValueError):
+        return None
+
+
+def write_json(file_name, data):
+    """Write a JSON file atomically, other hosts may be polling for it."""
+    temp_file_name = f"{file_name}.{os.getpid()}.tmp"
+    with open(temp_file_name, 'w') as json_file:
+        json.dump(data, json_file, default=lambda value: serialize(value) if hasattr(value, 'serialize') else str(value))
+    os.replace(temp_file_name, file_name)
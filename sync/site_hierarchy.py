@@ -0,0 +1,57 @@
+from metrics.run_log import get_logger
+
+log = get_logger(__name__)
+
+
+class SiteHierarchy:
+    """
+    Site groups, sites and locations of DNA Center site paths, each once.
+
+    Paths look like Global/<site group>/<site>/<location> (Global/Athletics/Reeves
+    Football Ops/First Floor), levels a path doesn't reach are not created. The
+    paths are parsed into a tree first, then every level is written to NetBox in one
+    pass, parents first, so each object is looked up and created once however many
+    paths share it. Locations belong to their site, the same floor name in two
+    buildings gives two locations.
+    """
+
+    def __init__(self, hierarchies):
+        self.site_groups = set()
+        self.sites = {}      # site -> site group
+        self.locations = {}  # (site, location) -> None, ordered like the paths
+        for hierarchy in hierarchies:
+            parts = hierarchy.split('/')
+            if len(parts) > 1 and parts[1]:
+                self.site_groups.add(parts[1])
+            if len(parts) > 2 and parts[2]:
+                self.sites.setdefault(parts[2], parts[1])
+            if len(parts) > 3 and parts[3]:
+                self.locations[(parts[2], parts[3])] = None
+
+    def build(self, netbox_manager):
+        """
+        Create or update every level in NetBox, returns (site ids, location ids).
+
+        Site ids are {site: id}, location ids {site: {location: id}}, for the device
+        phase to set a device's site and location without looking them up again.
+        """
+        slug = netbox_manager.generate_slug
+        log.info(f"Creating or Updating {len(self.site_groups)} Site Groups, {len(self.sites)} Sites and {len(self.locations)} Locations")
+
+        groups = netbox_manager.bulk_create_or_update('site_groups', 'name', [
+            {'name': group, 'slug': slug(group)} for group in sorted(self.site_groups)])
+        group_ids = {group: obj.get('id') for group, obj in groups.items() if obj}
+
+        sites = netbox_manager.bulk_create_or_update('sites', 'name', [
+            {'name': site, 'status': 'active', 'slug': slug(site), 'group': group_ids.get(group)} for site, group in self.sites.items()])
+        site_ids = {site: obj.get('id') for site, obj in sites.items() if obj}
+
+        location_ids = {}
+        locations = [(site, location) for (site, location) in self.locations if site in site_ids]
+        results = netbox_manager.bulk_create_or_update('locations', 'name', [
+            {'name': location, 'site': site_ids[site], 'slug': slug(location), 'status': 'active'} for (site, location) in locations])
+        for (site, location) in locations:
+            obj = results.get(netbox_manager.location_cache_key(site, location))
+            if obj:
+                location_ids.setdefault(site, {})[location] = obj.get('id')
+        return (site_ids, location_ids)
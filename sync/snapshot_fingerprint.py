@@ -0,0 +1,126 @@
+import os
+import json
+import hashlib
+import threading
+
+# Fingerprinted sections and the snapshot keys each one covers
+SECTIONS = {
+    'devices': ['sites', 'devices'],
+    'interfaces': ['interfaces'],
+    'network': ['network'],
+    'vlans': ['vlans', 'prefixes'],
+    'connections': ['connections'],
+}
+
+# Fabrics synced in one process share the fingerprint file
+FINGERPRINT_LOCK = threading.Lock()
+
+
+def canonicalize(value):
+    """
+    Normalize a snapshot value so equal inventories serialize identically.
+
+    Dict keys are stringified and strings trimmed. Sets and lists of objects (a
+    device's interfaces, a site's VLANs) are collections whose order the fabric APIs
+    don't keep, they are sorted. Other lists and tuples keep their order, it is part
+    of the value (speed_type is [media, speed]).
+    """
+    if isinstance(value, dict):
+        return {str(key): canonicalize(item) for key, item in value.items()}
+    if isinstance(value, (set, frozenset)) or (isinstance(value, list) and value and all(isinstance(item, dict) for item in value)):
+        items = [canonicalize(item) for item in value]
+        return sorted(items, key=lambda item: json.dumps(item, sort_keys=True, default=str))
+    if isinstance(value, (list, tuple)):
+        return [canonicalize(item) for item in value]
+    if isinstance(value, str):
+        return value.strip()
+    return value
+
+
+def normalize_url(url):
+    return str(url).lower().rstrip('/')
+
+
+def fabric_key(config):
+    """Identifies a fabric synced to one NetBox in files shared by several fabrics (the same fabric synced to another NetBox has its own key)."""
+    return f"{config.get('fabric_type')}|{normalize_url(config.get('fabric_url'))}|{normalize_url(config.get('netbox_url'))}"
+
+
+class SectionHasher:
+    """
+    Order independent sha256 over the items of one snapshot key.
+
+    Items are hashed one at a time, so a streamed section can be fingerprinted
+    without holding it in memory.
+    """
+
+    def __init__(self):
+        self.digests = []
+
+    def update(self, item):
+        canonical = json.dumps(canonicalize(item), sort_keys=True, default=str)
+        self.digests.append(hashlib.sha256(canonical.encode()).digest())
+
+    def hexdigest(self):
+        return hashlib.sha256(b''.join(sorted(self.digests))).hexdigest()
+
+
+def hash_items(items):
+    """Return a SectionHasher over every item of an iterable."""
+    hasher = SectionHasher()
+    for item in items:
+        hasher.update(item)
+    return hasher
+
+
+def fingerprint_sections(snapshot):
+    """
+    Hash each section of a fabric snapshot.
+
+    Must be called before the write phases, which modify the snapshot in place.
+
+    Returns:
+        dict: section name -> sha256 hex digest.
+    """
+    hashers = {key: hash_items(value if isinstance(value, list) else [value]) for key, value in snapshot.items()}
+    return combine_fingerprints(hashers)
+
+
+def combine_fingerprints(hashers):
+    """Combine per snapshot key hashers into section name -> sha256 hex digest."""
+    fingerprints = {}
+    for section, keys in SECTIONS.items():
+        digests = '|'.join((hashers.get(key) or SectionHasher()).hexdigest() for key in keys)
+        fingerprints[section] = hashlib.sha256(digests.encode()).hexdigest()
+    return fingerprints
+
+
+class FingerprintStore:
+    """Section fingerprints of the last successful sync per fabric, stored next to the NetBox cache file."""
+
+    def __init__(self, config):
+        self.DEBUG = config.get('debug')
+        cache_file_name = config.get('cache_file_name') or './netbox_cache.json'
+        self.fingerprint_file_name = f"{cache_file_name}.fingerprints.json"
+        self.fabric_key = fabric_key(config)
+
+    def load(self):
+        """Return the stored section fingerprints for this fabric."""
+        return self.load_all().get(self.fabric_key, {})
+
+    def load_all(self):
+        try:
+            with open(self.fingerprint_file_name, 'r') as fingerprint_file:
+                return json.load(fingerprint_file)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self, section, fingerprint):
+        """Record the fingerprint of a section once it has been written to NetBox successfully."""
+        with FINGERPRINT_LOCK:
+            fingerprints = self.load_all()
+            fingerprints.setdefault(self.fabric_key, {})[section] = fingerprint
+            temp_file_name = f"{self.fingerprint_file_name}.{os.getpid()}.tmp"
+            with open(temp_file_name, 'w') as fingerprint_file:
+                json.dump(fingerprints, fingerprint_file)
+            os.replace(temp_file_name, self.fingerprint_file_name)